@@ -0,0 +1,368 @@
+# api/admission.py
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from utils.logger import get_logger
+from utils.metrics import metrics
+from utils.tracing import tracer
+from utils.deadline import DeadlineExceeded, with_deadline
+from api.tenants import DEFAULT_TENANT, TenantRegistry
+
+logger = get_logger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a wait queue is full; ``retry_after`` is a hint in whole seconds."""
+
+    def __init__(self, scope: str, retry_after: int):
+        self.scope = scope
+        self.retry_after = retry_after
+        super().__init__(f"Too many requests in flight for {scope}")
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit driven by observed latency.
+
+    The limit grows by roughly one slot per window of requests while latency stays within
+    ``tolerance`` times the baseline (the lowest recently observed latency), and shrinks by
+    ``decrease_factor`` as soon as latency rises above it.
+    """
+
+    def __init__(self, initial: float, min_limit: int = 1, max_limit: int = 256,
+                 tolerance: float = 2.0, decrease_factor: float = 0.9, baseline_decay: float = 1.001):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.decrease_factor = decrease_factor
+        self.baseline_decay = baseline_decay
+        self.baseline: Optional[float] = None
+
+    def update(self, latency: float) -> int:
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            # Let the baseline drift up slowly so a permanently slower provider is re-learned
+            self.baseline *= self.baseline_decay
+        if latency > self.baseline * self.tolerance:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        return int(self.limit)
+
+
+class FairQueue:
+    """
+    Deficit round robin over per-tenant FIFO queues.
+
+    Each backlogged tenant is visited in turn and earns ``quantum * weight`` credit per visit;
+    its head request is dispatched once the credit covers the request's cost. A tenant's
+    credit is dropped when its queue empties, so idle tenants cannot bank capacity.
+    """
+
+    def __init__(self, quantum: float = 1.0, weight_of: Optional[Callable[[str], float]] = None):
+        self.quantum = quantum
+        self.weight_of = weight_of or (lambda tenant: 1.0)
+        self.queues: Dict[str, Deque[Tuple[asyncio.Future, float]]] = {}
+        self.deficits: Dict[str, float] = {}
+        self.active: Deque[str] = deque()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def push(self, tenant: str, waiter: asyncio.Future, cost: float = 1.0) -> None:
+        queue = self.queues.get(tenant)
+        if queue is None:
+            queue = self.queues[tenant] = deque()
+            self.deficits[tenant] = 0.0
+            self.active.append(tenant)
+        queue.append((waiter, cost))
+        self.size += 1
+
+    def pop(self) -> Optional[asyncio.Future]:
+        if not self.active:
+            return None
+        # The rounds of credit each tenant needs before its head request fits are computed, not
+        # visited one by one: a small weight and a large cost can take millions of rounds
+        credits, first = {}, None
+        for position, tenant in enumerate(self.active):
+            cost = self.queues[tenant][0][1]
+            credit = credits[tenant] = self.quantum * max(self.weight_of(tenant), 1e-6)
+            rounds = max(0, math.ceil((cost - self.deficits[tenant]) / credit))
+            while self.deficits[tenant] + rounds * credit < cost:
+                rounds += 1
+            if first is None or rounds < first[0]:
+                first = (rounds, position, tenant)
+        rounds, position, tenant = first
+        # Tenants ahead of it in this round were visited once more
+        for index, name in enumerate(self.active):
+            self.deficits[name] += credits[name] * (rounds + 1 if index < position else rounds)
+        self.active.rotate(-position)
+        queue = self.queues[tenant]
+        waiter, cost = queue.popleft()
+        self.size -= 1
+        self.deficits[tenant] -= cost
+        if not queue:
+            self._retire(tenant)
+        return waiter
+
+    def remove(self, waiter: asyncio.Future) -> None:
+        for tenant, queue in self.queues.items():
+            for entry in queue:
+                if entry[0] is waiter:
+                    queue.remove(entry)
+                    self.size -= 1
+                    if not queue:
+                        self._retire(tenant)
+                    return
+
+    def _retire(self, tenant: str) -> None:
+        del self.queues[tenant]
+        del self.deficits[tenant]
+        self.active.remove(tenant)
+
+    def queued_by_tenant(self) -> Dict[str, int]:
+        return {tenant: len(queue) for tenant, queue in self.queues.items()}
+
+
+class AdmissionLimiter:
+    """Bounded concurrency with a bounded wait queue, shared fairly between tenants."""
+
+    def __init__(self, scope: str, limit: int, max_queue: int, adaptive: Optional[AdaptiveLimit] = None,
+                 quantum: float = 1.0, weight_of: Optional[Callable[[str], float]] = None):
+        self.scope = scope
+        self.limit = limit
+        self.max_queue = max_queue
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.waiters = FairQueue(quantum, weight_of)
+        self.avg_latency: Optional[float] = None
+
+    def retry_after(self) -> int:
+        # Time for the queue ahead of a new caller to drain, at the current limit
+        latency = self.avg_latency or 1.0
+        return max(1, math.ceil(latency * (len(self.waiters) + 1) / max(1, self.limit)))
+
+    async def acquire(self, tenant: str = DEFAULT_TENANT, cost: float = 1.0) -> None:
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            metrics.increment('admission_rejected_total', scope=self.scope)
+            raise AdmissionRejected(self.scope, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.push(tenant, waiter, cost)
+        try:
+            await with_deadline(asyncio.shield(waiter), 'queue')
+        except (asyncio.CancelledError, DeadlineExceeded):
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we gave up; pass it on
+                self._release_slot()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self, latency: Optional[float] = None) -> None:
+        if latency is not None:
+            self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+            if self.adaptive is not None:
+                new_limit = self.adaptive.update(latency)
+                if new_limit != self.limit:
+                    logger.debug("Admission limit for %s adjusted %s -> %s", self.scope, self.limit, new_limit)
+                    self.limit = new_limit
+        self._release_slot()
+
+    def resize(self, limit: int, max_queue: int) -> None:
+        """Change the limits in place; queued requests that now fit are admitted at once."""
+        self.max_queue = max_queue
+        self.limit = limit
+        if self.adaptive is not None:
+            self.adaptive.limit = float(limit)
+        self._dispatch()
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.waiters and self.in_flight < self.limit:
+            waiter = self.waiters.pop()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": len(self.waiters)}
+
+
+class AdmissionTicket:
+    """Handed to an admitted request so it can report the tokens it used."""
+
+    def __init__(self, tenant: str):
+        self.tenant = tenant
+        self.tokens = 0
+
+    def record_tokens(self, tokens: int) -> None:
+        self.tokens += tokens
+
+
+class AdmissionController:
+    """
+    Global and per-service admission in front of generation requests.
+
+    A request first takes a slot within its tenant's concurrency cap, then a slot for its
+    service and then a global slot, so requests queued behind one saturated provider never
+    hold global capacity. Service and global queues are drained by deficit round robin across
+    tenants, weighted per tenant and costed in estimated tokens.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.enabled = config.get('enabled', True)
+        self.adaptive_config = config.get('adaptive', {})
+        global_config = config.get('global', {})
+        self.default_service_config = config.get('default_service', {'limit': 32, 'max_queue': 128})
+        self.service_configs = config.get('services', {})
+        self.tenants = TenantRegistry(config.get('tenants', {}))
+        self.tenant_limiters: Dict[str, AdmissionLimiter] = {}
+        self.global_limiter = self._create_limiter('global', global_config.get('limit', 64), global_config.get('max_queue', 256))
+        self.service_limiters: Dict[str, AdmissionLimiter] = {}
+
+    def _create_limiter(self, scope: str, limit: int, max_queue: int) -> AdmissionLimiter:
+        adaptive = None
+        if self.adaptive_config.get('enabled', False):
+            adaptive = AdaptiveLimit(
+                initial=limit,
+                min_limit=self.adaptive_config.get('min_limit', 1),
+                max_limit=self.adaptive_config.get('max_limit', max(limit, 256)),
+                tolerance=self.adaptive_config.get('tolerance', 2.0),
+                decrease_factor=self.adaptive_config.get('decrease_factor', 0.9),
+            )
+        return AdmissionLimiter(scope, limit, max_queue, adaptive, self.tenants.quantum, self.tenants.weight)
+
+    def _service_limits(self, service: str) -> Tuple[int, int]:
+        service_config = self.service_configs.get(service, self.default_service_config)
+        return (service_config.get('limit', self.default_service_config.get('limit', 32)),
+                service_config.get('max_queue', self.default_service_config.get('max_queue', 128)))
+
+    def get_service_limiter(self, service: str) -> AdmissionLimiter:
+        limiter = self.service_limiters.get(service)
+        if limiter is None:
+            limiter = self._create_limiter(f"service:{service}", *self._service_limits(service))
+            self.service_limiters[service] = limiter
+        return limiter
+
+    def get_tenant_limiter(self, tenant: str) -> Optional[AdmissionLimiter]:
+        limiter = self.tenant_limiters.get(tenant)
+        if limiter is None:
+            policy = self.tenants.policy(tenant)
+            if not policy.get('max_concurrency'):
+                return None
+            limiter = AdmissionLimiter(f"tenant:{tenant}", policy['max_concurrency'], policy.get('max_queue', 64))
+            self.tenant_limiters[tenant] = limiter
+        return limiter
+
+    def reconfigure(self, config: Dict[str, Any]) -> None:
+        """
+        Apply changed limits, queue sizes and tenant policies to the running limiters.
+
+        Admitted and queued requests are kept; a raised limit admits waiting requests at once and
+        a lowered one takes effect as requests finish. The ``adaptive`` settings need a restart.
+        """
+        self.enabled = config.get('enabled', True)
+        self.default_service_config = config.get('default_service', {'limit': 32, 'max_queue': 128})
+        self.service_configs = config.get('services', {})
+        self.tenants.configure(config.get('tenants', {}))
+        global_config = config.get('global', {})
+        self.global_limiter.resize(global_config.get('limit', 64), global_config.get('max_queue', 256))
+        for service, limiter in self.service_limiters.items():
+            limiter.resize(*self._service_limits(service))
+        for limiter in (self.global_limiter, *self.service_limiters.values()):
+            limiter.waiters.quantum = self.tenants.quantum
+        for tenant, limiter in list(self.tenant_limiters.items()):
+            policy = self.tenants.policy(tenant)
+            if policy.get('max_concurrency'):
+                limiter.resize(policy['max_concurrency'], policy.get('max_queue', 64))
+            else:
+                # Requests holding or waiting for its slots release them through their own reference
+                del self.tenant_limiters[tenant]
+        logger.info("Admission limits updated: global %s/%s", self.global_limiter.limit, self.global_limiter.max_queue)
+
+    def identify(self, headers) -> str:
+        return self.tenants.identify(headers)
+
+    @asynccontextmanager
+    async def admit(self, service: Optional[str] = None, tenant: Optional[str] = None, cost: float = 1.0):
+        tenant = tenant or DEFAULT_TENANT
+        ticket = AdmissionTicket(tenant)
+        if not self.enabled:
+            yield ticket
+            return
+        retry_after = self.tenants.retry_after(tenant)
+        if retry_after:
+            metrics.increment('admission_rejected_total', scope=f"tenant:{tenant}")
+            raise AdmissionRejected(f"tenant:{tenant}", retry_after)
+
+        tenant_limiter = self.get_tenant_limiter(tenant)
+        limiters = [tenant_limiter] if tenant_limiter else []
+        if service:
+            limiters.append(self.get_service_limiter(service))
+        limiters.append(self.global_limiter)
+        acquired = []
+        queued_at = time.monotonic()
+        try:
+            with tracer.span('admission.wait', service=service or '', tenant=tenant):
+                for limiter in limiters:
+                    await limiter.acquire(tenant, cost)
+                    acquired.append(limiter)
+        except BaseException:
+            for limiter in acquired:
+                limiter.release()
+            raise
+
+        started = time.monotonic()
+        self.tenants.record_admitted(tenant, started - queued_at)
+        try:
+            yield ticket
+        finally:
+            latency = time.monotonic() - started
+            for limiter in acquired:
+                limiter.release(latency)
+            self.tenants.charge(tenant, ticket.tokens)
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Wait until nothing is admitted or queued; returns False if ``timeout`` passes first."""
+        deadline = time.monotonic() + timeout
+        while self.global_limiter.in_flight or len(self.global_limiter.waiters):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def register_metrics(self) -> None:
+        """Expose in-flight requests and queue depth per scope as gauges on ``metrics``."""
+        def gauge(field: str):
+            limiters = [self.global_limiter, *self.service_limiters.values(), *self.tenant_limiters.values()]
+            return [({"scope": limiter.scope}, limiter.stats()[field]) for limiter in limiters]
+
+        metrics.register_gauge('admission_in_flight', lambda: gauge('in_flight'))
+        metrics.register_gauge('admission_queue_depth', lambda: gauge('queued'))
+
+    def stats(self) -> Dict[str, Any]:
+        tenants = self.tenants.stats()
+        for tenant, limiter in self.tenant_limiters.items():
+            tenants.setdefault(tenant, {}).update(limiter.stats())
+        return {
+            "global": self.global_limiter.stats(),
+            "services": {name: limiter.stats() for name, limiter in self.service_limiters.items()},
+            "queued_by_tenant": self.global_limiter.waiters.queued_by_tenant(),
+            "tenants": tenants,
+        }
\ No newline at end of file
@@ -0,0 +1,24 @@
+# api/disconnect.py
+
+import asyncio
+from typing import Any, Awaitable
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+
+async def cancel_on_disconnect(awaitable: Awaitable[Any], route: str) -> Any:
+    """
+    Await ``awaitable`` on behalf of an HTTP request.
+
+    Quart cancels the handler task as soon as the ASGI server reports ``http.disconnect``;
+    the CancelledError then unwinds through the game engine, conversation manager and
+    provider stream, which release the upstream request. This records the cancellation.
+    """
+    try:
+        return await awaitable
+    except asyncio.CancelledError:
+        metrics.increment('requests_cancelled_total', route=route)
+        logger.info("Client disconnected, cancelled request to %s", route)
+        raise
\ No newline at end of file
@@ -0,0 +1,172 @@
+# api/fan_out.py
+
+import asyncio
+import copy
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+from game_settings import get_default_settings
+from utils.logger import get_logger
+from utils.metrics import metrics
+from utils.deadline import Deadline, DeadlineExceeded, set_deadline, with_deadline
+from utils.instrumentation import timed_generate
+from utils.tokens import estimate_tokens
+from api.tenants import DEFAULT_TENANT
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class FanOutTarget:
+    """
+    A read-only, per-target view over a shared message prefix.
+
+    ``prepared_messages`` is handed to the service client as-is (see
+    ``ServiceClient.prepare_messages``), so targets that share a prefix share the same list.
+    """
+    index: int
+    service: str
+    model: str
+    settings: Any
+    prepared_messages: List[Dict[str, str]]
+    prompt_tokens: int
+    context_name: Optional[str] = None
+    name: str = field(default='fan_out')
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        return self.prepared_messages
+
+    def describe(self) -> Dict[str, Any]:
+        described = {"target": self.index, "service": self.service, "model": self.model}
+        if self.context_name:
+            described["context"] = self.context_name
+        return described
+
+
+def prepare_targets(manager, prompt: str, targets: List[Dict[str, Any]], system_prompt: Optional[str] = None,
+                    max_targets: int = 16) -> List[FanOutTarget]:
+    """
+    Build one view per target. Each target is ``{"context": name}`` (optionally overriding
+    ``service``/``model``) or ``{"service": ..., "model": ...}``; both accept ``settings``.
+
+    Message lists are prepared once per prefix: all bare (service, model) targets share one
+    list, and all targets on the same context share one list, so history is never copied per target.
+    """
+    if not prompt:
+        raise ValueError("Missing prompt")
+    if not targets:
+        raise ValueError("Missing targets")
+    if len(targets) > max_targets:
+        raise ValueError(f"At most {max_targets} targets are allowed")
+
+    prompt_message = {"role": "user", "content": prompt}
+    prefixes: Dict[Optional[str], List[Dict[str, str]]] = {}
+    prefix_tokens: Dict[Optional[str], int] = {}
+    prepared = []
+    for index, target in enumerate(targets):
+        if not isinstance(target, dict):
+            raise ValueError(f"Target {index} must be an object")
+        context_name = target.get('context')
+        if context_name:
+            context = manager.get_context_snapshot(context_name)
+            if context is None:
+                raise ValueError(f"Context '{context_name}' does not exist")
+            service = target.get('service', context.service)
+            model = target.get('model', context.model)
+            settings = copy.copy(context.settings) if service == context.service else get_default_settings(service)
+            if context_name not in prefixes:
+                prefixes[context_name] = [{"role": msg["role"], "content": msg["content"]} for msg in context.history]
+                prefixes[context_name].append(prompt_message)
+        elif target.get('service') and target.get('model'):
+            service, model = target['service'], target['model']
+            settings = get_default_settings(service)
+            if None not in prefixes:
+                prefixes[None] = ([{"role": "system", "content": system_prompt}] if system_prompt else []) + [prompt_message]
+        else:
+            raise ValueError(f"Target {index} needs a 'context' or a 'service' and 'model'")
+
+        key = context_name or None
+        if key not in prefix_tokens:
+            prefix_tokens[key] = estimate_tokens(*(msg["content"] for msg in prefixes[key]))
+        for name, value in (target.get('settings') or {}).items():
+            setattr(settings, name, value)
+        settings.stream = False
+        prepared.append(FanOutTarget(index, service, model, settings, prefixes[key], prefix_tokens[key], context_name))
+    return prepared
+
+
+class FanOut:
+    """
+    Runs one prompt against many targets concurrently and yields results as they finish.
+
+    Targets still running when ``deadline`` expires are cancelled and reported with status
+    ``deadline``. The prompt is not added to any stored context.
+    """
+
+    def __init__(self, manager, deadline: Deadline, admission=None, tenant: str = DEFAULT_TENANT):
+        self.manager = manager
+        self.deadline = deadline
+        self.admission = admission
+        self.tenant = tenant
+
+    async def run_target(self, target: FanOutTarget) -> str:
+        # Each target runs in its own task; admission waits and the provider call share the deadline
+        set_deadline(self.deadline)
+        client = self.manager.get_service_client(target.service)
+        if self.admission is None:
+            return await with_deadline(timed_generate(client, target), 'provider')
+        async with self.admission.admit(target.service, self.tenant, target.prompt_tokens) as ticket:
+            response = await with_deadline(timed_generate(client, target), 'provider')
+            ticket.record_tokens(target.prompt_tokens + estimate_tokens(response))
+            return response
+
+    async def run(self, targets: List[FanOutTarget]) -> AsyncIterator[Dict[str, Any]]:
+        started = time.perf_counter()
+        tasks = {asyncio.ensure_future(self.run_target(target)): target for target in targets}
+        counts = {"ok": 0, "error": 0, "deadline": 0}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=self.deadline.remaining(),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    result = self.result_event(tasks[task], task, time.perf_counter() - started)
+                    counts[result["status"]] += 1
+                    yield result
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                counts["deadline"] += 1
+                metrics.increment('fan_out_targets_total', status='deadline')
+                yield {**tasks[task].describe(), "type": "result", "status": "deadline",
+                       "latency_s": round(time.perf_counter() - started, 4)}
+        finally:
+            # Also reached when the client disconnects mid-stream
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        yield {"type": "summary", "targets": len(targets), "succeeded": counts["ok"], "failed": counts["error"],
+               "timed_out": counts["deadline"], "elapsed_s": round(time.perf_counter() - started, 4)}
+
+    def result_event(self, target: FanOutTarget, task: asyncio.Task, latency: float) -> Dict[str, Any]:
+        event = {**target.describe(), "type": "result", "latency_s": round(latency, 4)}
+        error = task.exception()
+        if isinstance(error, DeadlineExceeded):
+            event.update({"status": "deadline", "stage": error.stage})
+        elif error is not None:
+            logger.warning("Fan-out target %s (%s/%s) failed: %s", target.index, target.service, target.model, error)
+            event.update({"status": "error", "error": str(error) or type(error).__name__})
+        else:
+            response = task.result()
+            event.update({
+                "status": "ok",
+                "response": response,
+                "tokens": {"prompt": target.prompt_tokens, "completion": estimate_tokens(response), "estimated": True},
+            })
+        metrics.increment('fan_out_targets_total', status=event["status"])
+        return event
\ No newline at end of file
@@ -0,0 +1,117 @@
+# api/health.py
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+from quart import jsonify
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+class Startup:
+    """
+    Server start-up state behind the liveness and readiness endpoints.
+
+    The server is live as soon as it accepts requests. It is ready once every configured provider
+    has been probed (concurrently, each bounded by ``probe_timeout``) and all ``required_services``
+    answered; required services that fail are re-probed every ``retry_interval`` seconds.
+    Time to ready is measured from when the services started being built.
+    """
+
+    def __init__(self, services, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.services = services
+        self.probe_timeout = config.get('probe_timeout', 5)
+        self.retry_interval = config.get('retry_interval', 10)
+        self.required = list(config.get('required_services') or [])
+        self.providers: Dict[str, Dict[str, Any]] = {}
+        self.ready = False
+        self.time_to_ready: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def probe(self, name: str) -> Dict[str, Any]:
+        began = time.perf_counter()
+        try:
+            # Constructing a client may import its SDK; do that off the event loop
+            client = await asyncio.to_thread(self.services.service_clients.__getitem__, name)
+            list_models = client.list_models
+            # Sync clients are probed in a thread so a hanging one can't block the loop
+            call = list_models() if asyncio.iscoroutinefunction(list_models) else asyncio.to_thread(list_models)
+            models = await asyncio.wait_for(call, self.probe_timeout)
+            result = {"ok": bool(models), "models": len(models or [])}
+            if not models:
+                result["error"] = "No models available"
+        except asyncio.TimeoutError:
+            result = {"ok": False, "error": f"No response within {self.probe_timeout}s"}
+        except Exception as e:
+            result = {"ok": False, "error": str(e) or type(e).__name__}
+        result["seconds"] = round(time.perf_counter() - began, 3)
+        if result["ok"]:
+            logger.info("Successfully connected to %s. Available models: %s", name, result['models'])
+        else:
+            logger.error("Could not connect to %s server. Error: %s", name, result['error'])
+        return result
+
+    async def probe_all(self, names) -> None:
+        results = await asyncio.gather(*(self.probe(name) for name in names))
+        self.providers.update(zip(names, results))
+
+    async def run(self) -> None:
+        began = time.perf_counter()
+        await self.probe_all(list(self.services.service_clients))
+        self.services.phases['probes'] = time.perf_counter() - began
+        while True:
+            missing = [name for name in self.required if not self.providers.get(name, {}).get('ok')]
+            unknown = [name for name in missing if name not in self.services.service_clients]
+            if unknown:
+                logger.error("Required services are not configured: %s", ', '.join(unknown))
+                return
+            if not missing:
+                break
+            logger.warning("Not ready; waiting for %s", ', '.join(missing))
+            await asyncio.sleep(self.retry_interval)
+            await self.probe_all(missing)
+        self.ready = True
+        self.time_to_ready = time.perf_counter() - self.services.started
+        logger.info("Ready in %.2fs", self.time_to_ready)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "time_to_ready": round(self.time_to_ready, 3) if self.time_to_ready is not None else None,
+            "phases": {phase: round(seconds, 3) for phase, seconds in self.services.phases.items()},
+            "services": self.providers,
+        }
+
+def register_health_routes(app, startup: Startup) -> None:
+    """``/healthz`` (liveness) answers as long as the event loop does; ``/readyz`` only once started up."""
+    metrics.register_gauge('server_ready', lambda: int(startup.ready))
+    metrics.register_gauge('time_to_ready_seconds', lambda: startup.time_to_ready or 0)
+    metrics.register_gauge('service_up', lambda: [({"service": name}, int(result["ok"]))
+                                                  for name, result in startup.providers.items()])
+
+    @app.before_serving
+    async def probe_services():
+        startup.start()
+
+    @app.after_serving
+    async def stop_probes():
+        await startup.stop()
+
+    @app.route('/healthz', methods=['GET'])
+    async def healthz():
+        return jsonify({"status": "ok"})
+
+    @app.route('/readyz', methods=['GET'])
+    async def readyz():
+        return jsonify(startup.status()), 200 if startup.ready else 503
\ No newline at end of file
@@ -0,0 +1,251 @@
+# api/jobs.py
+
+import asyncio
+import ipaddress
+import itertools
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+import aiohttp
+from utils.logger import get_logger, set_request_id, reset_request_id
+from utils.metrics import metrics
+from utils.tracing import tracer
+from api.admission import AdmissionRejected
+from api.tenants import DEFAULT_TENANT
+
+logger = get_logger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+JobHandler = Callable[[Dict[str, Any], str], Awaitable[Any]]
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    params: Dict[str, Any]
+    priority: int
+    tenant: str = DEFAULT_TENANT
+    webhook: Optional[str] = None
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    # Span of the submitting request, so the job's spans join its trace
+    trace: Any = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def is_local_url(url: str) -> bool:
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return False
+    if parsed.hostname == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(parsed.hostname).is_loopback
+    except ValueError:
+        return False
+
+
+class JobManager:
+    """
+    Runs generation requests in the background so the submitting HTTP call returns at once.
+
+    Jobs wait in a bounded priority queue (lower ``priority`` runs first, FIFO within a priority)
+    and are executed by a fixed pool of workers. Results can be polled, long-polled or delivered
+    to a loopback webhook, and finished jobs are kept for ``result_ttl`` seconds.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.workers = config.get('workers', 4)
+        self.max_queued = config.get('max_queued', 256)
+        self.max_jobs = config.get('max_jobs', 10000)
+        self.result_ttl = config.get('result_ttl', 600)
+        self.max_wait = config.get('max_wait', 60)
+        self.default_priority = config.get('default_priority', 5)
+        self.webhook_timeout = config.get('webhook_timeout', 10)
+        self.handlers: Dict[str, JobHandler] = {}
+        self.required: Dict[str, Iterable[str]] = {}
+        self.jobs: Dict[str, Job] = {}
+        # Jobs with status QUEUED, counted as they enter and leave that status
+        self.queued_jobs = 0
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self.worker_tasks: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+
+    def reconfigure(self, config: Dict[str, Any]) -> None:
+        """Apply changed queue and retention limits; the number of workers only changes on restart."""
+        self.max_queued = config.get('max_queued', 256)
+        self.result_ttl = config.get('result_ttl', 600)
+        self.max_wait = config.get('max_wait', 60)
+        self.default_priority = config.get('default_priority', 5)
+
+    def register(self, kind: str, handler: JobHandler, required: Iterable[str] = ()) -> None:
+        self.handlers[kind] = handler
+        self.required[kind] = tuple(required)
+
+    def start(self) -> None:
+        if self.worker_tasks:
+            return
+        self.queue = asyncio.PriorityQueue()
+        self.worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Started %s job workers", self.workers)
+
+    async def stop(self) -> None:
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks = []
+
+    def queued(self) -> int:
+        return self.queued_jobs
+
+    def submit(self, kind: str, params: Dict[str, Any], priority: Optional[int] = None,
+               webhook: Optional[str] = None, tenant: str = DEFAULT_TENANT) -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job type: {kind}")
+        missing = [name for name in self.required[kind] if not params.get(name)]
+        if missing:
+            raise ValueError(f"Missing parameters for {kind}: {', '.join(missing)}")
+        if webhook and not is_local_url(webhook):
+            raise ValueError("Webhook must be an http(s) URL on a loopback address")
+        if self.queue is None:
+            raise RuntimeError("Job workers are not running")
+        self.purge()
+        queued = self.queued()
+        if queued >= self.max_queued or len(self.jobs) >= self.max_jobs:
+            metrics.increment('admission_rejected_total', scope='jobs')
+            raise AdmissionRejected('jobs', max(1, queued // max(1, self.workers)))
+
+        priority = self.default_priority if priority is None else int(priority)
+        job = Job(uuid.uuid4().hex, kind, params, priority, tenant, webhook, trace=tracer.current())
+        self.jobs[job.id] = job
+        self.queue.put_nowait((priority, next(self._sequence), job))
+        self.queued_jobs += 1
+        metrics.increment('jobs_submitted_total', kind=kind)
+        logger.debug("Queued job %s (%s, priority %s)", job.id, kind, priority)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self.purge()
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Long-poll: return the job once it finishes or after ``timeout`` seconds, whichever is first."""
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED or timeout <= 0:
+            return job
+        try:
+            await asyncio.wait_for(job.done.wait(), min(timeout, self.max_wait))
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Still queued; the worker skips it when it comes up
+            self._finish(job, CANCELLED)
+        return job
+
+    def purge(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            _, _, job = await self.queue.get()
+            if job.status != QUEUED:
+                continue
+            job.status = RUNNING
+            self.queued_jobs -= 1
+            job.started_at = time.time()
+            tracer.finish(tracer.start_span('job.queued', job.trace, int(job.created_at * 1e9)))
+            token = tracer.attach(job.trace)
+            log_token = set_request_id(job.id)
+            try:
+                job.task = asyncio.ensure_future(self._run(job))
+            finally:
+                reset_request_id(log_token)
+                tracer.detach(token)
+            try:
+                await asyncio.wait({job.task})
+            except asyncio.CancelledError:
+                # The pool is shutting down; do not leave the generation running
+                job.task.cancel()
+                self._finish(job, CANCELLED)
+                raise
+            if job.task.cancelled():
+                self._finish(job, CANCELLED)
+            elif job.task.exception() is not None:
+                error = job.task.exception()
+                logger.error("Job %s (%s) failed: %s", job.id, job.kind, error)
+                self._finish(job, FAILED, error=str(error) or type(error).__name__)
+            else:
+                self._finish(job, SUCCEEDED, result=job.task.result())
+            if job.webhook:
+                await self._deliver_webhook(job)
+
+    async def _run(self, job: Job) -> Any:
+        with tracer.span('job.run', **{"job.id": job.id, "job.kind": job.kind}):
+            return await self.handlers[job.kind](job.params, job.tenant)
+
+    def _finish(self, job: Job, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        if job.status == QUEUED:
+            self.queued_jobs -= 1
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.task = None
+        job.done.set()
+        metrics.increment('jobs_completed_total', kind=job.kind, status=status)
+
+    async def _deliver_webhook(self, job: Job) -> None:
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.webhook_timeout)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.post(job.webhook, json=job.to_dict()) as response:
+                    if response.status >= 400:
+                        raise RuntimeError(f"HTTP {response.status}")
+        except Exception as e:
+            metrics.increment('jobs_webhook_failed_total', kind=job.kind)
+            logger.warning("Webhook for job %s failed: %s", job.id, e)
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": len(self.worker_tasks), "jobs": counts}
\ No newline at end of file
@@ -11,7 +11,7 @@ def setup_routes(services, manager, game_engine, plugin_manager):
     def handle_exception(e):
         if isinstance(e, BadRequest):
             return jsonify({"error": "Bad request", "message": str(e)}), 400
-        app.logger.error(f"Unhandled exception: {str(e)}")
+        app.logger.error("Unhandled exception: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
     @app.route('/create_context', methods=['POST'])
@@ -98,7 +98,7 @@ def setup_routes(services, manager, game_engine, plugin_manager):
             result = plugin_manager.execute_plugin(plugin_name, *plugin_args, **plugin_kwargs)
             return jsonify({"result": result})
         except Exception as e:
-            app.logger.error(f"Failed to execute plugin {plugin_name}: {str(e)}")
+            app.logger.error("Failed to execute plugin %s: %s", plugin_name, e)
             return jsonify({"error": f"Failed to execute plugin {plugin_name}"}), 500
 
     return app
\ No newline at end of file
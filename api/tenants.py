@@ -0,0 +1,117 @@
+# api/tenants.py
+
+import math
+import time
+from typing import Any, Dict, Mapping, Optional
+from utils.metrics import metrics
+
+DEFAULT_TENANT = 'default'
+DEFAULT_TENANT_HEADER = 'X-API-Key'
+
+
+class TokenBudget:
+    """
+    Tokens-per-minute bucket. Usage is charged after a request completes, so a tenant may
+    overshoot by one request; further requests are refused until the bucket refills.
+    """
+
+    def __init__(self, tokens_per_minute: float):
+        self.capacity = float(tokens_per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self) -> int:
+        """Seconds until the bucket is positive again, 0 if a request may start now."""
+        self._refill()
+        if self.tokens > 0:
+            return 0
+        return max(1, math.ceil((1 - self.tokens) / self.rate))
+
+    def charge(self, tokens: float) -> None:
+        self._refill()
+        self.tokens -= tokens
+
+    def available(self) -> int:
+        self._refill()
+        return int(self.tokens)
+
+
+class TenantRegistry:
+    """
+    Maps API keys to tenants and holds their scheduling policy.
+
+    Callers are identified by the ``header`` (``X-API-Key`` by default). Keys that are not
+    listed in the configuration, and requests without a key, share the ``default`` tenant so
+    arbitrary keys cannot create unbounded per-tenant state.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.budgets: Dict[str, TokenBudget] = {}
+        self.configure(config)
+
+    def configure(self, config: Optional[Dict[str, Any]] = None) -> None:
+        """(Re)load the policies; budgets whose size is unchanged keep what they have used."""
+        config = config or {}
+        self.header = config.get('header', DEFAULT_TENANT_HEADER)
+        self.quantum = config.get('quantum', 1024)
+        self.default_policy = config.get('default', {})
+        self.policies: Dict[str, Dict[str, Any]] = {DEFAULT_TENANT: self.default_policy}
+        self.api_keys: Dict[str, str] = {}
+        for name, policy in config.get('consumers', {}).items():
+            self.policies[name] = policy
+            for api_key in policy.get('api_keys', []):
+                self.api_keys[api_key] = name
+        budgets = {}
+        for name, policy in self.policies.items():
+            if policy.get('tokens_per_minute'):
+                budget = self.budgets.get(name)
+                if budget is None or budget.capacity != float(policy['tokens_per_minute']):
+                    budget = TokenBudget(policy['tokens_per_minute'])
+                budgets[name] = budget
+        self.budgets = budgets
+
+    def identify(self, headers: Optional[Mapping[str, str]]) -> str:
+        api_key = headers.get(self.header) if headers else None
+        return self.api_keys.get(api_key, DEFAULT_TENANT)
+
+    def policy(self, tenant: str) -> Dict[str, Any]:
+        return self.policies.get(tenant, self.default_policy)
+
+    def weight(self, tenant: str) -> float:
+        return float(self.policy(tenant).get('weight', 1))
+
+    def retry_after(self, tenant: str) -> int:
+        budget = self.budgets.get(tenant)
+        return budget.retry_after() if budget else 0
+
+    def charge(self, tenant: str, tokens: int) -> None:
+        metrics.increment('tenant_tokens_total', tokens, tenant=tenant)
+        budget = self.budgets.get(tenant)
+        if budget:
+            budget.charge(tokens)
+
+    def record_admitted(self, tenant: str, queue_wait: float) -> None:
+        metrics.increment('tenant_requests_total', tenant=tenant)
+        metrics.increment('tenant_queue_wait_seconds_total', queue_wait, tenant=tenant)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for tenant in self.policies:
+            requests = metrics.get('tenant_requests_total', tenant=tenant)
+            wait = metrics.get('tenant_queue_wait_seconds_total', tenant=tenant)
+            stats[tenant] = {
+                "weight": self.weight(tenant),
+                "requests": int(requests),
+                "tokens": int(metrics.get('tenant_tokens_total', tenant=tenant)),
+                "avg_queue_wait_s": round(wait / requests, 4) if requests else 0.0,
+                "rejected": int(metrics.get('admission_rejected_total', scope=f"tenant:{tenant}")),
+            }
+            if tenant in self.budgets:
+                stats[tenant]["tokens_available"] = self.budgets[tenant].available()
+        return stats
\ No newline at end of file
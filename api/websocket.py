@@ -0,0 +1,179 @@
+# api/websocket.py
+
+import asyncio
+import json
+from typing import Any, Dict, Optional
+from utils.logger import get_logger
+from utils.metrics import metrics
+from utils.tracing import tracer
+from utils.deadline import Deadline, DeadlineExceeded, deadline_from_request, set_deadline
+from api.admission import AdmissionRejected
+from utils.tokens import estimate_context_tokens
+from api.tenants import DEFAULT_TENANT
+
+logger = get_logger(__name__)
+
+WS_GAME_PATH = '/ws/game/'
+
+# Close codes in the application range (4000-4999)
+CLOSE_SUPERSEDED = 4001
+CLOSE_UNKNOWN_CONTEXT = 4004
+
+
+class GameSocketSession:
+    """A single WebSocket connection bound to one game session (context)."""
+
+    def __init__(self, context_name: str, websocket, loop: asyncio.AbstractEventLoop, tenant: str = DEFAULT_TENANT):
+        self.context_name = context_name
+        self.tenant = tenant
+        self.websocket = websocket
+        self.loop = loop
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.turn_task: Optional[asyncio.Task] = None
+
+    def push(self, event: Dict[str, Any]) -> None:
+        # Game events may be emitted from worker threads (plugins, console helpers),
+        # so everything goes through call_soon_threadsafe to keep ordering and loop affinity.
+        self.loop.call_soon_threadsafe(self.outbox.put_nowait, event)
+
+    def close(self, code: int = 1000) -> None:
+        self.loop.call_soon_threadsafe(self.outbox.put_nowait, {"type": "close", "code": code})
+
+    async def run_sender(self) -> None:
+        while True:
+            event = await self.outbox.get()
+            if event.get("type") == "close":
+                await self.websocket.close(event["code"])
+                return
+            await self.websocket.send(json.dumps(event))
+
+
+class GameSocketHub:
+    """
+    Serves one WebSocket per game session at ``/ws/game/<context_name>``.
+
+    Clients send ``{"type": "start"}``, ``{"type": "action", "action": "..."}`` (both accept an
+    optional ``timeout`` in seconds) or ``{"type": "state"}``; the server streams ``delta`` events
+    followed by a ``state`` event and also pushes game events raised elsewhere (HTTP turns,
+    console, background work).
+    """
+
+    def __init__(self, game_engine, deadline_config: Optional[Dict[str, Any]] = None, admission=None):
+        self.game_engine = game_engine
+        self.deadline_config = deadline_config or {}
+        self.admission = admission
+        self.sessions: Dict[str, GameSocketSession] = {}
+        self.game_engine.add_listener(self._on_game_event)
+
+    def _on_game_event(self, context_name: str, event: Dict[str, Any], source: Any) -> None:
+        session = self.sessions.get(context_name)
+        if session is not None and session is not source:
+            session.push(event)
+
+    def close_all(self, code: int = 1001) -> None:
+        for session in list(self.sessions.values()):
+            session.close(code)
+
+    async def serve(self, context_name: str, websocket) -> None:
+        if not context_name or not await self.game_engine.conversation_manager.load_context(context_name):
+            await websocket.close(CLOSE_UNKNOWN_CONTEXT)
+            return
+
+        await websocket.accept()
+        tenant = self.admission.identify(getattr(websocket, 'headers', None)) if self.admission else DEFAULT_TENANT
+        session = GameSocketSession(context_name, websocket, asyncio.get_running_loop(), tenant)
+        previous = self.sessions.get(context_name)
+        self.sessions[context_name] = session
+        if previous is not None:
+            logger.info("Replacing existing game socket for context: %s", context_name)
+            previous.close(CLOSE_SUPERSEDED)
+        sender = asyncio.create_task(session.run_sender())
+        session.push({
+            "type": "connected",
+            "context_name": context_name,
+            "active": await self.game_engine.has_game(context_name),
+        })
+        logger.info("Game socket connected for context: %s", context_name)
+
+        try:
+            # The server cancels this coroutine when the client disconnects
+            while not sender.done():
+                receive_task = asyncio.ensure_future(websocket.receive())
+                await asyncio.wait({receive_task, sender}, return_when=asyncio.FIRST_COMPLETED)
+                if not receive_task.done():
+                    receive_task.cancel()
+                    break
+                self.handle_message(session, receive_task.result())
+        finally:
+            if self.sessions.get(context_name) is session:
+                del self.sessions[context_name]
+            if session.turn_task is not None and not session.turn_task.done():
+                # The player is gone; stop the provider stream instead of generating into the void
+                session.turn_task.cancel()
+                metrics.increment('requests_cancelled_total', route=WS_GAME_PATH)
+                try:
+                    await session.turn_task
+                except asyncio.CancelledError:
+                    pass
+            if not sender.done():
+                sender.cancel()
+            logger.info("Game socket closed for context: %s", context_name)
+
+    def handle_message(self, session: GameSocketSession, raw) -> None:
+        try:
+            message = json.loads(raw)
+            message_type = message.get('type')
+        except (ValueError, AttributeError):
+            session.push({"type": "error", "error": "Messages must be JSON objects"})
+            return
+
+        if message_type == 'ping':
+            session.push({"type": "pong"})
+        elif message_type == 'state':
+            # Reading the game may wait on shared storage
+            asyncio.ensure_future(self.push_state(session))
+        elif message_type in ('start', 'action'):
+            action = message.get('action')
+            if message_type == 'action' and not action:
+                session.push({"type": "error", "error": "Missing action"})
+            elif session.turn_task is not None and not session.turn_task.done():
+                session.push({"type": "error", "error": "A turn is already in progress"})
+            else:
+                try:
+                    deadline = deadline_from_request(WS_GAME_PATH, {}, message, self.deadline_config)
+                except (TypeError, ValueError):
+                    session.push({"type": "error", "error": "Invalid timeout"})
+                    return
+                session.turn_task = asyncio.ensure_future(
+                    self.run_turn(session, action if message_type == 'action' else None, deadline)
+                )
+        else:
+            session.push({"type": "error", "error": f"Unknown message type: {message_type}"})
+
+    async def push_state(self, session: GameSocketSession) -> None:
+        session.push({"type": "state", "state": await self.game_engine.get_game_state(session.context_name)})
+
+    async def run_turn(self, session: GameSocketSession, action: Optional[str], deadline: Optional[Deadline] = None) -> None:
+        # Runs in its own task, so the deadline and the trace only apply to this turn
+        set_deadline(deadline)
+        with tracer.trace(f"WS {WS_GAME_PATH}", **{"game.context": session.context_name, "game.start": action is None}):
+            await self.admit_turn(session, action)
+
+    async def admit_turn(self, session: GameSocketSession, action: Optional[str]) -> None:
+        if self.admission is None:
+            await self.stream_turn(session, action)
+            return
+        context = await self.game_engine.conversation_manager.load_context(session.context_name)
+        cost = estimate_context_tokens(context, action)
+        try:
+            async with self.admission.admit(context.service if context else None, session.tenant, cost) as ticket:
+                await self.stream_turn(session, action)
+                ticket.record_tokens(estimate_context_tokens(context))
+        except AdmissionRejected as e:
+            session.push({"type": "error", "error": str(e), "retry_after": e.retry_after})
+        except DeadlineExceeded as e:
+            session.push({"type": "error", "error": str(e), "stage": e.stage})
+
+    async def stream_turn(self, session: GameSocketSession, action: Optional[str]) -> None:
+        async for event in self.game_engine.stream_game(session.context_name, action, source=session):
+            session.push(event)
\ No newline at end of file
@@ -0,0 +1,3 @@
+from .runner import BatchRunner
+
+__all__ = ['BatchRunner']
\ No newline at end of file
@@ -0,0 +1,6 @@
+# batch/__main__.py
+
+from .runner import main
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,285 @@
+# batch/runner.py
+
+"""
+Offline batch inference over a JSONL file.
+
+Each input line is a JSON object with a ``prompt`` and either a ``context`` (the name of an
+existing context, whose system prompt, history and settings are used) or an inline template
+with ``service``, ``model`` and optional ``system_prompt``. Optional fields are ``id`` (unique;
+defaults to the line number), ``settings`` (overrides applied on top of the context's settings)
+and ``variables`` (substituted for ``{name}`` placeholders in the prompt; other braces, such as a
+JSON example, are left as they are). Rows never modify the stored contexts.
+
+Results are appended to the output JSONL as they complete. The output file is also the
+checkpoint: on restart, rows that already have a successful result are skipped; rows whose
+provider call failed are run again.
+
+    python -m batch prompts.jsonl results.jsonl --concurrency ollama=2 --concurrency groq=8
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from conversation_manager import ConversationContext
+from game_settings import get_default_settings
+from utils.logger import get_logger
+from utils.metrics import metrics
+from utils.deadline import Deadline, set_deadline, with_deadline
+from utils.instrumentation import timed_generate
+from utils.tokens import estimate_context_tokens, estimate_tokens
+from api.tenants import DEFAULT_TENANT
+
+logger = get_logger(__name__)
+
+PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+def read_rows(path: str) -> Iterator[Tuple[int, Any]]:
+    """Yield ``(line_number, row)`` lazily; rows that are not valid JSON are yielded as the exception."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, e
+
+
+def row_key(line_number: int, row: Any) -> str:
+    return str(row.get('id', line_number)) if isinstance(row, dict) else str(line_number)
+
+
+def check_unique_ids(path: str) -> None:
+    """Raise ValueError if two rows share an id; resuming would skip all but the first of them."""
+    seen: Dict[str, int] = {}
+    for line_number, row in read_rows(path):
+        key = row_key(line_number, row)
+        if key in seen:
+            raise ValueError(f"Row id {key!r} on line {line_number} is already used on line {seen[key]}")
+        seen[key] = line_number
+
+
+def completed_rows(path: str) -> Set[str]:
+    """Ids of rows with a successful result in an existing output file."""
+    completed: Set[str] = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            if result.get('status') == 'ok':
+                completed.add(str(result.get('id')))
+    return completed
+
+
+def fill_placeholders(prompt: str, variables: Dict[str, Any]) -> str:
+    """Replace each ``{name}`` in ``prompt`` that names one of ``variables``; anything else is kept."""
+    return PLACEHOLDER.sub(lambda m: str(variables[m.group(1)]) if m.group(1) in variables else m.group(0), prompt)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class BatchRunner:
+    """
+    Executes batch rows through the existing service clients with bounded concurrency per provider.
+
+    :param manager: ConversationManager providing contexts and service clients
+    :param concurrency: Maximum in-flight rows per service, with an optional ``default`` entry
+    :param row_timeout: Deadline in seconds for each row, including time spent waiting for admission
+    :param admission: Optional AdmissionController, so server-side batches share capacity fairly
+    :param tenant: Tenant the rows are admitted as
+    """
+
+    def __init__(self, manager, concurrency: Optional[Dict[str, int]] = None, row_timeout: float = 120,
+                 admission=None, tenant: str = DEFAULT_TENANT):
+        self.manager = manager
+        self.concurrency = dict(concurrency or {})
+        self.default_concurrency = self.concurrency.pop('default', 4)
+        self.row_timeout = row_timeout
+        self.admission = admission
+        self.tenant = tenant
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def semaphore(self, service: str) -> asyncio.Semaphore:
+        if service not in self.semaphores:
+            self.semaphores[service] = asyncio.Semaphore(self.concurrency.get(service, self.default_concurrency))
+        return self.semaphores[service]
+
+    def build_context(self, row: Dict[str, Any]) -> ConversationContext:
+        if row.get('context'):
+            source = self.manager.get_context_snapshot(row['context'])
+            if source is None:
+                raise ValueError(f"Context '{row['context']}' does not exist")
+            context = ConversationContext(
+                source.name, source.service, source.model, source.system_prompt,
+                copy.copy(source.settings), [dict(message) for message in source.history]
+            )
+        elif row.get('service') and row.get('model'):
+            system_prompt = row.get('system_prompt', '')
+            context = ConversationContext(
+                'batch', row['service'], row['model'], system_prompt, get_default_settings(row['service'])
+            )
+            if system_prompt:
+                context.add_message('system', system_prompt)
+        else:
+            raise ValueError("Row needs a 'context' or a 'service' and 'model'")
+
+        for key, value in (row.get('settings') or {}).items():
+            setattr(context.settings, key, value)
+        # Batch rows want the whole response, not a stream printed to the console
+        context.settings.stream = False
+        prompt = row.get('prompt')
+        if not prompt:
+            raise ValueError("Row has no prompt")
+        if row.get('variables'):
+            prompt = fill_placeholders(prompt, row['variables'])
+        context.add_message('user', prompt)
+        return context
+
+    async def run_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        context = self.build_context(row)
+        client = self.manager.get_service_client(context.service)
+        async with self.semaphore(context.service):
+            # Each row runs in its own task, so this deadline only covers this row
+            set_deadline(Deadline(self.row_timeout))
+            started = time.perf_counter()
+            if self.admission is None:
+                response = await with_deadline(timed_generate(client, context), 'provider')
+            else:
+                cost = estimate_context_tokens(context)
+                async with self.admission.admit(context.service, self.tenant, cost) as ticket:
+                    response = await with_deadline(timed_generate(client, context), 'provider')
+                    ticket.record_tokens(cost + estimate_tokens(response))
+            latency = time.perf_counter() - started
+        return {"service": context.service, "model": context.model, "response": response, "latency_s": round(latency, 4)}
+
+    async def _execute(self, key: str, line_number: int, row: Any, output, results: List[Dict[str, Any]],
+                       in_flight: asyncio.Semaphore) -> None:
+        result: Dict[str, Any] = {"id": key, "line": line_number}
+        try:
+            if isinstance(row, Exception):
+                raise ValueError(f"Invalid JSON: {str(row)}")
+            result.update(await self.run_row(row))
+            result["status"] = "ok"
+        except Exception as e:
+            result.update({"status": "error", "error": str(e) or type(e).__name__})
+            logger.warning("Batch row %s (line %s) failed: %s", key, line_number, result['error'])
+        finally:
+            in_flight.release()
+        metrics.increment('batch_rows_total', status=result["status"])
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+        results.append(result)
+
+    async def run(self, input_path: str, output_path: str, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Run every unfinished row of ``input_path`` and return a throughput/latency summary."""
+        check_unique_ids(input_path)
+        done = completed_rows(output_path)
+        results: List[Dict[str, Any]] = []
+        skipped = 0
+        submitted = 0
+        # Bound how far the reader runs ahead of the slowest provider
+        in_flight = asyncio.Semaphore(sum(self.concurrency.values()) + self.default_concurrency)
+        pending: Set[asyncio.Task] = set()
+        started = time.perf_counter()
+
+        needs_newline = os.path.exists(output_path) and os.path.getsize(output_path) > 0
+        if needs_newline:
+            with open(output_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+
+        with open(output_path, 'a', encoding='utf-8') as output:
+            if needs_newline:
+                output.write('\n')
+            try:
+                for line_number, row in read_rows(input_path):
+                    key = row_key(line_number, row)
+                    if key in done:
+                        skipped += 1
+                        continue
+                    if limit is not None and submitted >= limit:
+                        break
+                    await in_flight.acquire()
+                    task = asyncio.create_task(self._execute(key, line_number, row, output, results, in_flight))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                    submitted += 1
+                await asyncio.gather(*pending)
+            except asyncio.CancelledError:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                raise
+
+        elapsed = time.perf_counter() - started
+        return self.summarize(results, skipped, elapsed)
+
+    @staticmethod
+    def summarize(results: List[Dict[str, Any]], skipped: int, elapsed: float) -> Dict[str, Any]:
+        latencies = sorted(r["latency_s"] for r in results if r["status"] == "ok")
+        by_service: Dict[str, int] = {}
+        for r in results:
+            if r["status"] == "ok":
+                by_service[r["service"]] = by_service.get(r["service"], 0) + 1
+        return {
+            "rows": len(results),
+            "succeeded": len(latencies),
+            "failed": len(results) - len(latencies),
+            "skipped": skipped,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rows_per_s": round(len(results) / elapsed, 3) if elapsed > 0 else 0.0,
+            "latency_p50_s": percentile(latencies, 0.5),
+            "latency_p90_s": percentile(latencies, 0.9),
+            "latency_p99_s": percentile(latencies, 0.99),
+            "latency_max_s": latencies[-1] if latencies else 0.0,
+            "by_service": by_service,
+        }
+
+
+def parse_concurrency(values: List[str]) -> Dict[str, int]:
+    concurrency = {}
+    for value in values:
+        service, _, limit = value.partition('=')
+        concurrency[service.strip()] = int(limit)
+    return concurrency
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run a JSONL file of prompts through the configured services')
+    parser.add_argument('input', help='Input JSONL file')
+    parser.add_argument('output', help='Output JSONL file; also used as the resume checkpoint')
+    parser.add_argument('--concurrency', action='append', default=[], metavar='SERVICE=N',
+                        help='In-flight rows per service (use "default=N" for the rest); repeatable')
+    parser.add_argument('--row-timeout', type=float, help='Deadline per row in seconds')
+    parser.add_argument('--limit', type=int, help='Run at most this many unfinished rows')
+    args = parser.parse_args()
+
+    # Imported here: only the command line builds the shared services; the server passes its own manager
+    from config.config_loader import get_batch_config
+    from manager_instance import manager
+
+    config = get_batch_config()
+    concurrency = {**config.get('concurrency', {}), **parse_concurrency(args.concurrency)}
+    runner = BatchRunner(manager, concurrency, args.row_timeout or config.get('row_timeout', 120))
+    try:
+        summary = asyncio.run(runner.run(args.input, args.output, args.limit))
+    except ValueError as e:
+        parser.error(str(e))
+    print(json.dumps(summary, indent=2))
\ No newline at end of file
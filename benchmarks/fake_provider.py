@@ -0,0 +1,282 @@
+# benchmarks/fake_provider.py
+
+"""
+Deterministic stand-in for the LLM providers, for load tests without network access or API costs.
+
+It serves the OpenAI-style chat completions API used by Groq (under /openai/v1) and Cerebras
+(under /v1), and Ollama's /api/chat and /api/tags, streamed or not. Replies are built from a seed
+and the request's sequence number, so repeating a run repeats its replies, delays and errors.
+Game prompts (starting or continuing the adventure) are answered with a JSON game state, taken
+in turn from the script file if one is given.
+
+Settings come from the fake_provider section of config/services.yaml, overridden by options:
+
+    python -m benchmarks.fake_provider --port 8900 --ttft 0.2 --token-delay 0.02 --tokens 200 --rate-limit-rate 0.05
+
+The clients are pointed at it purely through config/services.yaml:
+
+    services:
+      groq:     {api_key: fake, base_url: "http://127.0.0.1:8900", max_retries: 0}
+      cerebras: {api_key: fake, base_url: "http://127.0.0.1:8900", max_retries: 0}
+      ollama:   {host: 127.0.0.1, port: 8900}
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from quart import Quart, Response, jsonify, request
+
+DEFAULTS = {
+    'host': '127.0.0.1',
+    'port': 8900,
+    'seed': 0,
+    'ttft': 0.2,
+    'token_delay': 0.02,
+    'tokens': 64,
+    'error_rate': 0.0,
+    'rate_limit_rate': 0.0,
+    'retry_after': 1,
+    'models': ['fake-model'],
+    'script': None,
+}
+
+WORDS = ('the', 'party', 'crosses', 'a', 'quiet', 'forest', 'where', 'lanterns', 'drift', 'between', 'ancient',
+         'trees', 'and', 'a', 'voice', 'calls', 'from', 'the', 'river', 'beyond', 'old', 'stone', 'walls')
+
+# Phrases in GameEngine's start and turn prompts
+GAME_PROMPTS = ('adventure game', 'The player takes the following action')
+
+
+def pieces(text: str) -> List[str]:
+    """The text split the way it is streamed: one word, with its trailing space, per token."""
+    return re.findall(r'\S+\s*', text) or [text]
+
+
+class FakeProvider:
+    """
+    Generates the replies and failures; the app built by ``create_app`` only encodes them.
+
+    :param config: ``seed``, ``ttft`` and ``token_delay`` (seconds), ``tokens`` (reply length),
+        ``error_rate`` and ``rate_limit_rate`` (fractions of requests answered with 500 and 429),
+        ``retry_after``, ``models`` and ``script`` (a JSON file holding a list of game states)
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = {**DEFAULTS, **(config or {})}
+        self.seed = config['seed']
+        self.ttft = config['ttft']
+        self.token_delay = config['token_delay']
+        self.tokens = config['tokens']
+        self.error_rate = config['error_rate']
+        self.rate_limit_rate = config['rate_limit_rate']
+        self.retry_after = config['retry_after']
+        self.models = list(config['models'])
+        self.script: List[Dict[str, Any]] = []
+        if config['script']:
+            with open(config['script'], 'r') as file:
+                self.script = json.load(file)
+        self.sequence = itertools.count()
+        self.game_turns = itertools.count()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def plan(self, messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> Tuple[Optional[int], List[str]]:
+        """
+        The failure status (500 or 429, or None) and reply pieces for the next request.
+
+        Everything is drawn from a generator seeded with the request's sequence number, so the
+        n-th request of a run is answered the same way every time.
+        """
+        rng = random.Random(self.seed * 1_000_003 + next(self.sequence))
+        self.stats["requests"] += 1
+        draw = rng.random()
+        if draw < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            return 429, []
+        if draw < self.rate_limit_rate + self.error_rate:
+            self.stats["errors"] += 1
+            return 500, []
+
+        prompt = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+        if any(phrase in prompt for phrase in GAME_PROMPTS):
+            return None, pieces(json.dumps(self.game_state(rng)))
+        count = max(1, min(self.tokens, max_tokens or self.tokens))
+        return None, [rng.choice(WORDS) + ' ' for _ in range(count - 1)] + [rng.choice(WORDS) + '.']
+
+    def game_state(self, rng: random.Random) -> Dict[str, Any]:
+        turn = next(self.game_turns)
+        if self.script:
+            return self.script[turn % len(self.script)]
+        words = max(1, self.tokens - 20)
+        return {
+            "turn": turn,
+            "description": ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.',
+            "location": rng.choice(('forest', 'village', 'castle', 'river')),
+            "health": 100 - turn % 10,
+            "options": ["Look around", "Follow the voice", "Rest by the river"],
+        }
+
+    async def emit(self, parts: List[str]) -> AsyncIterator[str]:
+        """Yield the pieces after the time to first token and then one per ``token_delay``."""
+        await asyncio.sleep(self.ttft)
+        for index, part in enumerate(parts):
+            if index:
+                await asyncio.sleep(self.token_delay)
+            yield part
+
+    async def complete(self, parts: List[str]) -> str:
+        await asyncio.sleep(self.ttft + self.token_delay * max(0, len(parts) - 1))
+        return ''.join(parts)
+
+
+def count_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(message.get('content') or '') for message in messages) // 4
+
+
+def create_app(provider: FakeProvider) -> Quart:
+    app = Quart(__name__)
+
+    def openai_error(status: int):
+        if status == 429:
+            body = {"error": {"message": "Rate limit reached (fake provider)", "type": "rate_limit_exceeded",
+                              "code": "rate_limit_exceeded"}}
+            return jsonify(body), 429, {"Retry-After": str(provider.retry_after)}
+        return jsonify({"error": {"message": "Internal server error (fake provider)", "type": "server_error"}}), 500
+
+    async def chat_completions():
+        data = await request.get_json() or {}
+        messages = data.get('messages') or []
+        model = data.get('model') or provider.models[0]
+        status, parts = provider.plan(messages, data.get('max_tokens') or data.get('max_completion_tokens'))
+        if status:
+            return openai_error(status)
+        completion_id = f"chatcmpl-fake-{provider.stats['requests']}"
+        created = int(time.time())
+        usage = {"prompt_tokens": count_tokens(messages), "completion_tokens": len(parts),
+                 "total_tokens": count_tokens(messages) + len(parts)}
+
+        if not data.get('stream'):
+            text = await provider.complete(parts)
+            return jsonify({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "system_fingerprint": "fake-provider",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop", "logprobs": None}],
+                "usage": usage,
+            })
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            # system_fingerprint is required by Cerebras' SDK to recognise a chunk
+            event = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "system_fingerprint": "fake-provider",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}]}
+            return f"data: {json.dumps(event)}\n\n"
+
+        async def stream():
+            first = True
+            async for part in provider.emit(parts):
+                yield chunk({"role": "assistant", "content": part} if first else {"content": part})
+                first = False
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return Response(stream(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
+
+    async def list_models():
+        return jsonify({"object": "list", "data": [
+            {"id": model, "object": "model", "created": 0, "owned_by": "fake-provider"} for model in provider.models
+        ]})
+
+    async def tcp_warming():
+        # Cerebras' SDK requests this when a client is created
+        return "ok"
+
+    for prefix in ('/openai/v1', '/v1'):
+        app.add_url_rule(f"{prefix}/chat/completions", f"chat_completions{prefix}", chat_completions, methods=['POST'])
+        app.add_url_rule(f"{prefix}/models", f"list_models{prefix}", list_models, methods=['GET'])
+    app.add_url_rule('/v1/tcp_warming', 'tcp_warming', tcp_warming, methods=['GET'])
+
+    @app.route('/api/chat', methods=['POST'])
+    async def ollama_chat():
+        data = await request.get_json() or {}
+        messages = data.get('messages') or []
+        model = data.get('model') or provider.models[0]
+        status, parts = provider.plan(messages, (data.get('options') or {}).get('num_predict'))
+        if status:
+            headers = {"Retry-After": str(provider.retry_after)} if status == 429 else {}
+            return jsonify({"error": "Rate limit reached" if status == 429 else "Internal server error"}), status, headers
+
+        def message(content: str, done: bool) -> Dict[str, Any]:
+            body = {"model": model, "created_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    "message": {"role": "assistant", "content": content}, "done": done}
+            if done:
+                body.update({"done_reason": "stop", "prompt_eval_count": count_tokens(messages), "eval_count": len(parts)})
+            return body
+
+        # Ollama streams unless told not to
+        if not data.get('stream', True):
+            return jsonify(message(await provider.complete(parts), True))
+
+        async def stream():
+            async for part in provider.emit(parts):
+                yield json.dumps(message(part, False)) + '\n'
+            yield json.dumps(message('', True)) + '\n'
+
+        return Response(stream(), mimetype='application/x-ndjson')
+
+    @app.route('/api/tags', methods=['GET'])
+    async def ollama_tags():
+        return jsonify({"models": [
+            {"name": model, "model": model, "modified_at": "2024-01-01T00:00:00Z", "size": 0, "digest": "fake",
+             "details": {"format": "gguf", "family": "fake", "parameter_size": "0B", "quantization_level": "none"}}
+            for model in provider.models
+        ]})
+
+    @app.route('/stats', methods=['GET'])
+    async def stats():
+        return jsonify(provider.stats)
+
+    return app
+
+
+async def serve(app: Quart, host: str, port: int, shutdown_trigger=None) -> None:
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"{host}:{port}"]
+    config.accesslog = None
+    await hypercorn_serve(app, config, shutdown_trigger=shutdown_trigger)
+
+
+def main() -> None:
+    from config.config_loader import get_fake_provider_config
+
+    config = {**DEFAULTS, **get_fake_provider_config()}
+    parser = argparse.ArgumentParser(description='Deterministic fake LLM provider for load tests')
+    parser.add_argument('--host', default=config['host'], help='Address to listen on')
+    parser.add_argument('--port', type=int, default=config['port'], help='Port to listen on')
+    parser.add_argument('--seed', type=int, default=config['seed'], help='Seed for replies, delays and failures')
+    parser.add_argument('--ttft', type=float, default=config['ttft'], help='Seconds before the first token')
+    parser.add_argument('--token-delay', type=float, default=config['token_delay'], help='Seconds between tokens')
+    parser.add_argument('--tokens', type=int, default=config['tokens'], help='Tokens per reply')
+    parser.add_argument('--error-rate', type=float, default=config['error_rate'], help='Fraction of requests failing with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=config['rate_limit_rate'],
+                        help='Fraction of requests refused with 429')
+    parser.add_argument('--retry-after', type=int, default=config['retry_after'], help='Retry-After seconds on 429')
+    parser.add_argument('--models', nargs='+', default=config['models'], help='Model names to report')
+    parser.add_argument('--script', default=config['script'], help='JSON file with a list of game states to answer with')
+    args = parser.parse_args()
+
+    provider = FakeProvider(vars(args))
+    print(f"Fake provider listening on http://{args.host}:{args.port}")
+    asyncio.run(serve(create_app(provider), args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
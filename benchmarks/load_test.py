@@ -0,0 +1,419 @@
+# benchmarks/load_test.py
+
+"""
+HTTP load test of the server's routes, reported as JSON so runs can be compared across changes.
+
+It creates ``--contexts`` contexts (and starts a game on each when the mix has game turns), then
+sends a weighted mix of /send_prompt, /game_turn, /start_game, /list_contexts, /create_context
+and /fan_out requests for ``--duration`` seconds (or ``--requests`` requests). In a closed loop
+``--concurrency`` clients each send the next request when the last one finished; with ``--rate``
+requests arrive on a Poisson schedule however slowly the server answers, and latency is counted
+from when a request was due so a stalled server can't hide its queueing.
+
+The report has p50/p90/p99/max latency and time to first byte per route, throughput, errors by
+route and cause, and the server's resident memory (with --spawn or --server-pid, on Linux).
+
+With --spawn it starts the fake provider and a server configured to use it, on their own ports
+and with a throw-away context file:
+
+    python -m benchmarks.load_test --spawn --contexts 64 --concurrency 32 --duration 30 --output run.json
+    python -m benchmarks.load_test --spawn --rate 200 --mix send_prompt=6,game_turn=3,list_contexts=1 --ttft 0.3
+
+or point it at a running server with --url (contexts are created there).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+import yaml
+
+OPERATIONS = ('send_prompt', 'game_turn', 'start_game', 'list_contexts', 'create_context', 'fan_out')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACTIONS = ('Look around', 'Follow the voice', 'Open the door', 'Talk to the innkeeper', 'Rest by the river')
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p90/p99/max/mean in milliseconds (nearest rank)."""
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+    return {
+        "p50": round(rank(0.50) * 1000, 2),
+        "p90": round(rank(0.90) * 1000, 2),
+        "p99": round(rank(0.99) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+    }
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}'; choose from {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Recorder:
+    """Latency and time to first byte per route, and errors by route and cause."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.ttfb: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    def record(self, route: str, latency: float, ttfb: Optional[float], error: Optional[str] = None) -> None:
+        self.latencies[route].append(latency)
+        if ttfb is not None:
+            self.ttfb[route].append(ttfb)
+        if error:
+            self.errors[f"{route}: {error}"] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        total = sum(len(values) for values in self.latencies.values())
+        errors = sum(self.errors.values())
+        routes = {}
+        for route, values in sorted(self.latencies.items()):
+            route_errors = sum(count for key, count in self.errors.items() if key.startswith(f"{route}:"))
+            routes[route] = {
+                "requests": len(values),
+                "errors": route_errors,
+                "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+                "latency_ms": percentiles(values),
+                "ttfb_ms": percentiles(self.ttfb[route]),
+            }
+        return {
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+            "successful_rps": round((total - errors) / elapsed, 2) if elapsed else None,
+            "latency_ms": percentiles([value for values in self.latencies.values() for value in values]),
+            "routes": routes,
+            "errors_by_cause": dict(self.errors.most_common()),
+        }
+
+
+def read_rss(pid: int) -> Optional[float]:
+    """Resident set size of ``pid`` in MiB, from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class RssSampler:
+    def __init__(self, pid: Optional[int], interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[float] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.pid:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            rss = read_rss(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            await asyncio.sleep(self.interval)
+
+    async def stop(self) -> Optional[Dict[str, float]]:
+        if self.task is None:
+            return None
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        rss = read_rss(self.pid)
+        if rss is not None:
+            self.samples.append(rss)
+        if not self.samples:
+            return None
+        return {"start": round(self.samples[0], 1), "peak": round(max(self.samples), 1), "end": round(self.samples[-1], 1)}
+
+
+def response_error(status: int, body: bytes) -> Optional[str]:
+    """The cause of a failed request: its HTTP status, or an error reported in a 200 response."""
+    if status != 200:
+        return f"HTTP {status}"
+    try:
+        data = json.loads(body)
+    except ValueError:
+        # /fan_out streams NDJSON; a target's failure is reported in its result event
+        events = [json.loads(line) for line in body.splitlines() if line.strip()]
+        failed = [event['status'] for event in events if event.get('type') == 'result' and event.get('status') != 'ok']
+        return f"target {failed[0]}" if failed else None
+    if isinstance(data, dict):
+        result = data.get('game_response') or data.get('initial_state') or data
+        if isinstance(result, dict) and (result.get('error') or result.get('success') is False):
+            return "error in response"
+    return None
+
+
+class LoadTest:
+    """
+    Drives a server at ``url``.
+
+    :param options: ``contexts``, ``concurrency``, ``rate`` (requests per second; open loop when
+        set), ``duration``, ``requests``, ``mix`` (operation weights), ``service``, ``model``,
+        ``timeout``, ``seed``, ``max_in_flight`` and ``server_pid``
+    """
+
+    def __init__(self, url: str, options: Dict[str, Any]):
+        self.url = url.rstrip('/')
+        self.contexts = options.get('contexts', 32)
+        self.concurrency = options.get('concurrency', 16)
+        self.rate = options.get('rate')
+        self.duration = options.get('duration', 30)
+        self.requests = options.get('requests')
+        self.mix = options.get('mix') or {'send_prompt': 1}
+        self.service = options.get('service', 'groq')
+        self.model = options.get('model', 'fake-model')
+        self.timeout = options.get('timeout', 120)
+        self.max_in_flight = options.get('max_in_flight', 1000)
+        self.rng = random.Random(options.get('seed', 0))
+        self.server_pid = options.get('server_pid')
+        self.run_id = f"{int(time.time()) % 100000:05d}"
+        self.issued = 0
+        self.setup = Recorder()
+        self.load = Recorder()
+
+    def context_name(self, index: int) -> str:
+        return f"load-{self.run_id}-{index}"
+
+    async def call(self, session: aiohttp.ClientSession, recorder: Recorder, route: str, method: str = 'POST',
+                   payload: Optional[Dict[str, Any]] = None, started: Optional[float] = None) -> None:
+        started = started if started is not None else time.perf_counter()
+        ttfb = None
+        try:
+            async with session.request(method, f"{self.url}{route}", json=payload) as response:
+                first = await response.content.readany()
+                ttfb = time.perf_counter() - started
+                body = first + await response.content.read()
+                error = response_error(response.status, body)
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except aiohttp.ClientError as e:
+            error = type(e).__name__
+        recorder.record(route.lstrip('/'), time.perf_counter() - started, ttfb, error)
+
+    def request_for(self, operation: str) -> Tuple[str, str, Optional[Dict[str, Any]]]:
+        name = self.context_name(self.rng.randrange(self.contexts))
+        if operation == 'send_prompt':
+            return '/send_prompt', 'POST', {"name": name, "prompt": f"Request {self.issued}: what happens next?"}
+        if operation == 'game_turn':
+            return '/game_turn', 'POST', {"context_name": name, "user_input": self.rng.choice(ACTIONS)}
+        if operation == 'start_game':
+            return '/start_game', 'POST', {"context_name": name}
+        if operation == 'list_contexts':
+            return '/list_contexts', 'GET', None
+        if operation == 'create_context':
+            return '/create_context', 'POST', {"name": f"load-{self.run_id}-extra-{self.issued}", "service": self.service,
+                                               "model": self.model, "system_prompt": "You are a load test."}
+        other = self.context_name(self.rng.randrange(self.contexts))
+        return '/fan_out', 'POST', {"prompt": "Summarise the story so far.", "targets": [{"context": name}, {"context": other}]}
+
+    def next_request(self) -> Tuple[str, str, Optional[Dict[str, Any]]]:
+        operation = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        self.issued += 1
+        return self.request_for(operation)
+
+    async def prepare(self, session: aiohttp.ClientSession) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(route, payload):
+            async with semaphore:
+                await self.call(session, self.setup, route, 'POST', payload)
+
+        await asyncio.gather(*(bounded('/create_context', {
+            "name": self.context_name(i), "service": self.service, "model": self.model,
+            "system_prompt": "You are the game master of a text adventure. Reply in JSON.",
+        }) for i in range(self.contexts)))
+        if 'game_turn' in self.mix:
+            await asyncio.gather(*(bounded('/start_game', {"context_name": self.context_name(i)}) for i in range(self.contexts)))
+
+    def done(self, ends: float) -> bool:
+        return time.perf_counter() >= ends or (self.requests is not None and self.issued >= self.requests)
+
+    async def closed_loop(self, session: aiohttp.ClientSession, ends: float) -> None:
+        async def client():
+            while not self.done(ends):
+                route, method, payload = self.next_request()
+                await self.call(session, self.load, route, method, payload)
+
+        await asyncio.gather(*(client() for _ in range(self.concurrency)))
+
+    async def open_loop(self, session: aiohttp.ClientSession, ends: float) -> None:
+        in_flight = set()
+        due = time.perf_counter()
+        while not self.done(ends):
+            due += self.rng.expovariate(self.rate)
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            route, method, payload = self.next_request()
+            if len(in_flight) >= self.max_in_flight:
+                self.load.record(route.lstrip('/'), 0.0, None, "client overloaded")
+                continue
+            task = asyncio.ensure_future(self.call(session, self.load, route, method, payload, started=due))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        await asyncio.gather(*in_flight)
+
+    async def run(self) -> Dict[str, Any]:
+        rss = RssSampler(self.server_pid)
+        connector = aiohttp.TCPConnector(limit=0 if self.rate else self.concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            rss.start()
+            began = time.perf_counter()
+            await self.prepare(session)
+            setup_elapsed = time.perf_counter() - began
+
+            began = time.perf_counter()
+            ends = began + self.duration
+            await (self.open_loop(session, ends) if self.rate else self.closed_loop(session, ends))
+            elapsed = time.perf_counter() - began
+        return {
+            "mode": "open" if self.rate else "closed",
+            "options": {"contexts": self.contexts, "concurrency": self.concurrency, "rate": self.rate,
+                        "duration": self.duration, "requests": self.requests, "mix": self.mix,
+                        "service": self.service, "model": self.model},
+            "load": self.load.report(elapsed),
+            "setup": self.setup.report(setup_elapsed),
+            "server_rss_mb": await rss.stop(),
+        }
+
+
+def write_server_config(directory: str, provider_port: int, service: str) -> str:
+    """A copy of the configuration with every provider pointed at the fake provider."""
+    from config.config_loader import load_config
+
+    config = load_config()
+    fake = {'api_key': 'fake', 'base_url': f"http://127.0.0.1:{provider_port}", 'max_retries': 0}
+    config['services'] = {'groq': dict(fake), 'cerebras': dict(fake), 'ollama': {'host': '127.0.0.1', 'port': provider_port}}
+    config['storage'] = {'backend': 'tinydb', 'path': os.path.join(directory, 'contexts.json')}
+    config['logging'] = {**config.get('logging', {}), 'level': 'WARNING', 'file': os.path.join(directory, 'server.log')}
+    config['config'] = {'reload_interval': 0}
+    config['startup'] = {**config.get('startup', {}), 'required_services': [service]}
+    path = os.path.join(directory, 'services.yaml')
+    with open(path, 'w') as file:
+        yaml.safe_dump(config, file)
+    return path
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {process.returncode}")
+            try:
+                async with session.get(f"{url}/readyz") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{url} was not ready within {timeout}s")
+            await asyncio.sleep(0.2)
+
+
+async def spawn_and_run(args, options: Dict[str, Any]) -> Dict[str, Any]:
+    from config.config_loader import CONFIG_PATH_ENV
+
+    with tempfile.TemporaryDirectory(prefix='load-test-') as directory:
+        env = {**os.environ, CONFIG_PATH_ENV: write_server_config(directory, args.provider_port, args.service)}
+        provider = subprocess.Popen([
+            sys.executable, '-m', 'benchmarks.fake_provider', '--port', str(args.provider_port),
+            '--ttft', str(args.ttft), '--token-delay', str(args.token_delay), '--tokens', str(args.tokens),
+            '--error-rate', str(args.error_rate), '--rate-limit-rate', str(args.rate_limit_rate),
+            '--seed', str(args.seed),
+        ], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        server = subprocess.Popen([sys.executable, 'main.py', '--no-console', '--host', '127.0.0.1', '--port', str(args.port)],
+                                  cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            url = f"http://127.0.0.1:{args.port}"
+            await wait_until_ready(url, server)
+            report = await LoadTest(url, {**options, 'server_pid': server.pid}).run()
+            report["fake_provider"] = {"ttft": args.ttft, "token_delay": args.token_delay, "tokens": args.tokens,
+                                       "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate}
+            return report
+        finally:
+            for process in (server, provider):
+                process.terminate()
+            for process in (server, provider):
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='HTTP load test with latency percentiles and throughput')
+    parser.add_argument('--url', help='Server to drive, e.g. http://127.0.0.1:5000')
+    parser.add_argument('--spawn', action='store_true', help='Start the fake provider and a server configured for it')
+    parser.add_argument('--contexts', type=int, default=32, help='Contexts to create and spread requests over')
+    parser.add_argument('--concurrency', type=int, default=16, help='Clients in the closed loop (and for set-up)')
+    parser.add_argument('--rate', type=float, help='Requests per second; switches to an open loop')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run the load for')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests')
+    parser.add_argument('--mix', default='send_prompt=6,game_turn=3,list_contexts=1',
+                        help=f"Weighted operations from {', '.join(OPERATIONS)}")
+    parser.add_argument('--service', default='groq', help='Service for the contexts')
+    parser.add_argument('--model', default='fake-model', help='Model for the contexts')
+    parser.add_argument('--timeout', type=float, default=120, help='Per-request timeout in seconds')
+    parser.add_argument('--max-in-flight', type=int, default=1000, help='Open loop: requests in flight before counting arrivals as dropped')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the request mix and the fake provider')
+    parser.add_argument('--server-pid', type=int, help='Process to report resident memory for (with --url)')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    spawn = parser.add_argument_group('--spawn')
+    spawn.add_argument('--port', type=int, default=5200, help='Port for the spawned server')
+    spawn.add_argument('--provider-port', type=int, default=8901, help='Port for the fake provider')
+    spawn.add_argument('--ttft', type=float, default=0.2, help='Fake provider time to first token')
+    spawn.add_argument('--token-delay', type=float, default=0.02, help='Fake provider delay between tokens')
+    spawn.add_argument('--tokens', type=int, default=64, help='Fake provider reply length')
+    spawn.add_argument('--error-rate', type=float, default=0.0, help='Fake provider fraction of 500s')
+    spawn.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fake provider fraction of 429s')
+    args = parser.parse_args()
+    if not args.url and not args.spawn:
+        parser.error('pass --url or --spawn')
+
+    options = {
+        'contexts': args.contexts, 'concurrency': args.concurrency, 'rate': args.rate, 'duration': args.duration,
+        'requests': args.requests, 'mix': parse_mix(args.mix), 'service': args.service, 'model': args.model,
+        'timeout': args.timeout, 'max_in_flight': args.max_in_flight, 'seed': args.seed, 'server_pid': args.server_pid,
+    }
+    report = await (spawn_and_run(args, options) if args.spawn else LoadTest(args.url, options).run())
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
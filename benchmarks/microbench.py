@@ -0,0 +1,314 @@
+# benchmarks/microbench.py
+
+"""
+Microbenchmarks for the hot paths behind every request: context (de)serialisation, message
+preparation, TinyDB storage, copying contexts, parsing game replies and game state history.
+
+Each case is timed with timeit (auto-ranged loops, best and median of --repeat runs) and then run
+once more under tracemalloc for its peak memory and the memory retained by what it returns (for
+``game.session`` cases, a whole game of that many turns). Save a run as a baseline and compare
+later runs against it; cases slower, or using more memory, than the baseline by more than
+--threshold are flagged and the exit status is 1:
+
+    python -m benchmarks.microbench --save baseline.json
+    python -m benchmarks.microbench --compare baseline.json --threshold 0.15
+    python -m benchmarks.microbench --filter storage --contexts 1000,10000 --history 2,16
+
+Storage cases at 100k contexts write files of hundreds of megabytes; combinations whose file would
+exceed --max-db-mb are reported as skipped.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from benchmarks.fake_provider import WORDS
+from conversation_manager import ConversationContext, ConversationManager
+from game.engine import GameEngine
+from game.state import GameState
+from game_settings import get_default_settings
+from services.base_client import ServiceClient
+from storage.tinydb_storage import TinyDBStorage
+
+Case = Tuple[str, Callable[[], Any]]
+
+CLEAN_GAME_REPLY = json.dumps({
+    "description": "You wake in a meadow under two moons. A path leads to a village; smoke rises beyond the hills.",
+    "location": "Moonlit meadow",
+    "inventory": ["worn cloak", "bread", "strange amulet"],
+    "stats": {"health": 100, "mana": 40, "level": 1},
+    "options": ["Walk to the village", "Investigate the smoke", "Examine the amulet"],
+})
+MESSY_GAME_REPLY = (
+    "Sure! Here is the next part of the adventure.\n\n```json\n" + CLEAN_GAME_REPLY +
+    "\n```\n\nLet me know what you would like to do next!"
+)
+
+
+class BenchClient(ServiceClient):
+    """A provider client with no SDK behind it, for the shared ServiceClient code."""
+
+    async def generate_response(self, context: Any) -> str:
+        return ""
+
+    async def list_models(self) -> List[str]:
+        return []
+
+    async def get_model_info(self, model_name: str) -> Dict[str, Any]:
+        return {}
+
+
+def make_context(name: str, messages: int, chars: int) -> ConversationContext:
+    context = ConversationContext(name, 'groq', 'bench-model', 'You are a benchmark.', get_default_settings('groq'))
+    context.add_message('system', 'You are a benchmark.')
+    text = ('lorem ipsum dolor sit amet ' * (chars // 27 + 1))[:chars]
+    for i in range(messages):
+        context.add_message('user' if i % 2 == 0 else 'assistant', f"{i} {text}")
+    return context
+
+
+def write_tinydb(path: str, contexts: int, messages: int, chars: int) -> None:
+    """Write a TinyDB file of ``contexts`` contexts directly, much faster than ``contexts`` upserts."""
+    template = make_context('template', messages, chars).to_dict()
+    with open(path, 'w') as file:
+        file.write('{"_default": {')
+        for i in range(contexts):
+            if i:
+                file.write(', ')
+            file.write(f'"{i + 1}": ')
+            json.dump({**template, 'name': f"ctx-{i}"}, file)
+        file.write('}}')
+
+
+def context_cases(options) -> Iterator[Case]:
+    for messages in options.history:
+        context = make_context('bench', messages, options.chars)
+        data = context.to_dict()
+        yield f"context.to_dict[history={messages}]", context.to_dict
+        yield f"context.from_dict[history={messages}]", lambda data=data: ConversationContext.from_dict(data)
+    growing = make_context('growing', 0, options.chars)
+    yield "context.add_message", lambda: growing.add_message('user', 'What happens next?')
+
+
+def prepare_messages_cases(options) -> Iterator[Case]:
+    client = BenchClient({})
+    for messages in sorted({*options.history, 256}):
+        context = make_context('bench', messages, options.chars)
+        yield f"client.prepare_messages[history={messages}]", lambda context=context: client.prepare_messages(context)
+
+
+def copy_context_cases(options) -> Iterator[Case]:
+    manager = ConversationManager()
+    names = itertools.count()
+    for messages in sorted({*options.history, 256}):
+        manager.contexts[f"source-{messages}"] = make_context(f"source-{messages}", messages, options.chars)
+
+        def copy(messages=messages, keep=None):
+            name = f"copy-{next(names)}"
+            manager.copy_context(f"source-{messages}", name, keep)
+            manager.contexts.pop(name)
+
+        yield f"manager.copy_context[history={messages}]", copy
+        yield f"manager.copy_context[history={messages},keep=8]", lambda copy=copy: copy(keep=8)
+
+
+def storage_cases(options, directory: str) -> Iterator[Case]:
+    for contexts, messages in itertools.product(options.contexts, options.history):
+        label = f"contexts={contexts},history={messages}"
+        estimate = len(json.dumps(make_context('x', messages, options.chars).to_dict())) * contexts / 2 ** 20
+        if estimate > options.max_db_mb:
+            yield f"storage.save[{label}]", None
+            yield f"storage.load_all[{label}]", None
+            continue
+        path = os.path.join(directory, f"tinydb-{contexts}-{messages}.json")
+        write_tinydb(path, contexts, messages, options.chars)
+        storage = TinyDBStorage(path)
+        updated = make_context(f"ctx-{contexts // 2}", messages + 2, options.chars).to_dict()
+        yield f"storage.save[{label}]", lambda storage=storage, updated=updated: storage.save(updated['name'], updated)
+        yield f"storage.load_all[{label}]", storage.load_all
+
+
+def game_parse_cases(options) -> Iterator[Case]:
+    engine = GameEngine(ConversationManager())
+
+    def parse_failure():
+        try:
+            engine._parse_response("The story continues, but no state was returned this time.")
+        except ValueError:
+            pass
+
+    yield "game.parse[clean]", lambda: engine._parse_response(CLEAN_GAME_REPLY)
+    yield "game.parse[messy]", lambda: engine._parse_response(MESSY_GAME_REPLY)
+    yield "game.parse[no json]", parse_failure
+
+
+def game_turn_state(turn: int) -> Dict[str, Any]:
+    """A game reply as parsed from a provider: a long narration and image prompt, and slowly changing state."""
+    state = {
+        "narration": f"Turn {turn}. " + ' '.join(WORDS[(turn + i) % len(WORDS)] for i in range(120)),
+        "image": {"top": "Moonlit meadow", "bottom": f"Turn {turn}", "prompt": f"anime fantasy landscape, turn {turn}, "
+                  + ' '.join(WORDS[(turn * 3 + i) % len(WORDS)] for i in range(40))},
+        "location": ("meadow", "village", "forest", "castle")[turn // 25 % 4],
+        "inventory": ["worn cloak", "bread"] + ["silver coin"] * (turn // 10),
+        "stats": {"health": 100 - turn % 30, "mana": 40 + turn % 7, "level": 1 + turn // 50},
+        "actions": [{"description": "Look around"}, {"description": "Talk to the stranger"},
+                    {"description": f"Take the path to the {('north', 'east', 'south', 'west')[turn % 4]}"}],
+    }
+    return json.loads(json.dumps(state))
+
+
+def game_history_cases(options) -> Iterator[Case]:
+    for turns in options.turns:
+        states = [game_turn_state(turn) for turn in range(turns)]
+
+        def session(states=states):
+            game = GameState('bench', states[0])
+            for state in states[1:]:
+                game.update(state)
+            return game
+
+        game = session()
+        replacement = game_turn_state(turns)
+
+        def rollback(game=game, replacement=replacement):
+            game.rollback(1)
+            game.update(replacement)
+
+        yield f"game.session[turns={turns}]", session
+        # What a game's history held before it was delta-encoded: every parsed reply
+        yield f"game.session[turns={turns},plain list]", lambda states=states: [json.loads(json.dumps(state)) for state in states]
+        yield f"game.rollback+update[turns={turns}]", rollback
+        yield f"game.history[turns={turns}]", game.get_history
+
+
+def measure(func: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, Any]:
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+    runs = [elapsed / number] + [total / number for total in timer.repeat(max(0, repeat - 1), number)]
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = func()
+        after, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+    return {
+        "loops": number,
+        "best_us": round(min(runs) * 1e6, 3),
+        "median_us": round(statistics.median(runs) * 1e6, 3),
+        "ops_per_s": round(1 / min(runs), 1) if min(runs) else None,
+        "peak_kib": round((peak - before) / 1024, 2),
+        "retained_kib": round((after - before) / 1024, 2),
+    }
+
+
+def run(options) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix='microbench-') as directory:
+        cases = itertools.chain(context_cases(options), prepare_messages_cases(options), copy_context_cases(options),
+                                storage_cases(options, directory), game_parse_cases(options),
+                                game_history_cases(options))
+        for name, func in cases:
+            if options.filter and not any(part in name for part in options.filter):
+                continue
+            if func is None:
+                results[name] = {"skipped": f"file larger than {options.max_db_mb} MiB"}
+            else:
+                results[name] = measure(func, options.repeat, options.min_time)
+            print(f"{name:<55} {format_result(results[name])}", file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"contexts": options.contexts, "history": options.history, "turns": options.turns, "chars": options.chars},
+        "results": results,
+    }
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    if "skipped" in result:
+        return f"skipped ({result['skipped']})"
+    return f"{result['median_us']:>14,.2f} us/op  peak {result['peak_kib']:>10,.1f} KiB"
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_memory_kib: float = 4.0) -> List[Dict[str, Any]]:
+    """
+    Cases whose median time, or peak memory, grew by more than ``threshold`` over the baseline.
+
+    Memory differences smaller than ``min_memory_kib`` are ignored as noise.
+    """
+    regressions = []
+    for name, result in results.get("results", {}).items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "skipped" in result or "skipped" in base:
+            continue
+        time_ratio = result["median_us"] / base["median_us"] if base["median_us"] else 1.0
+        if time_ratio > 1 + threshold:
+            regressions.append({"case": name, "metric": "median_us", "baseline": base["median_us"],
+                                "current": result["median_us"], "change": round(time_ratio - 1, 3)})
+        grown = result["peak_kib"] - base["peak_kib"]
+        if grown > min_memory_kib and result["peak_kib"] > base["peak_kib"] * (1 + threshold):
+            regressions.append({"case": name, "metric": "peak_kib", "baseline": base["peak_kib"],
+                                "current": result["peak_kib"],
+                                "change": round(grown / base["peak_kib"], 3) if base["peak_kib"] else None})
+    return regressions
+
+
+def int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(',') if part]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Microbenchmarks for contexts, storage and game parsing')
+    parser.add_argument('--contexts', type=int_list, default=[1000, 10000, 100000], help='Stored contexts for storage cases')
+    parser.add_argument('--history', type=int_list, default=[2, 16], help='Messages per context')
+    parser.add_argument('--turns', type=int_list, default=[300, 800], help='Turns per game for game history cases')
+    parser.add_argument('--chars', type=int, default=120, help='Characters per message')
+    parser.add_argument('--max-db-mb', type=float, default=256, help='Skip storage cases with larger files')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Seconds each timed run should take at least')
+    parser.add_argument('--filter', action='append', help='Only run cases whose name contains this (repeatable)')
+    parser.add_argument('--output', help='Write the JSON results here instead of stdout')
+    parser.add_argument('--save', help='Also write the results as a baseline file')
+    parser.add_argument('--compare', help='Baseline file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slow-down or memory growth, as a fraction')
+    options = parser.parse_args(argv)
+
+    report = run(options)
+    status = 0
+    if options.compare:
+        with open(options.compare) as file:
+            regressions = compare(report, json.load(file), options.threshold)
+        report["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']}: {regression['metric']} {regression['baseline']} -> "
+                  f"{regression['current']}", file=sys.stderr)
+        status = 1 if regressions else 0
+    output = json.dumps(report, indent=2)
+    for path in (options.output, options.save):
+        if path:
+            with open(path, 'w') as file:
+                file.write(output + '\n')
+    if not options.output:
+        print(output)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
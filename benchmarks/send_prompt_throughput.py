@@ -0,0 +1,173 @@
+# benchmarks/send_prompt_throughput.py
+
+"""
+Concurrent /send_prompt throughput benchmark.
+
+By default it compares the previous HTTP layer (Flask async views behind hypercorn's WSGI
+bridge) with the native Quart app. Both run in-process against a simulated provider, so the
+numbers show how much concurrency the HTTP layer allows rather than provider speed:
+
+    python -m benchmarks.send_prompt_throughput --concurrency 64 --requests 2000 --latency 0.05
+
+Pass --url to drive an already running server instead (contexts are created on it first):
+
+    python -m benchmarks.send_prompt_throughput --url http://127.0.0.1:5000 --service ollama --model llama2
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+import aiohttp
+
+from conversation_manager import ConversationManager
+
+
+class SimulatedClient:
+    """Stands in for a provider: waits ``latency`` seconds without blocking the loop."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def generate_response(self, context: Any) -> str:
+        await asyncio.sleep(self.latency)
+        return "ok"
+
+
+def build_manager(latency: float, contexts: int) -> ConversationManager:
+    manager = ConversationManager(service_clients={'groq': SimulatedClient(latency)})
+    for i in range(contexts):
+        manager.create_context(f"bench-{i}", 'groq', 'bench-model', 'You are a benchmark.')
+    return manager
+
+
+def build_flask_app(manager: ConversationManager):
+    from flask import Flask, request, jsonify
+    from hypercorn.middleware import AsyncioWSGIMiddleware
+
+    app = Flask(__name__)
+
+    @app.route('/send_prompt', methods=['POST'])
+    async def send_prompt():
+        data = request.json
+        return jsonify(await manager.send_prompt(data['name'], data['prompt']))
+
+    return AsyncioWSGIMiddleware(app)
+
+
+def build_quart_app(manager: ConversationManager):
+    from quart import Quart, request, jsonify
+
+    app = Quart(__name__)
+
+    @app.route('/send_prompt', methods=['POST'])
+    async def send_prompt():
+        data = await request.get_json()
+        return jsonify(await manager.send_prompt(data['name'], data['prompt']))
+
+    return app
+
+
+async def drive(url: str, concurrency: int, total: int, contexts: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    request_ids = iter(range(total))
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        async def worker():
+            nonlocal errors
+            for i in request_ids:
+                payload = {"name": f"bench-{i % contexts}", "prompt": "ping"}
+                start = time.perf_counter()
+                try:
+                    async with session.post(f"{url}/send_prompt", json=payload) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "latency_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+    }
+
+
+async def wait_until_listening(host: str, port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def run_in_process(name: str, app, args) -> Dict[str, Any]:
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{args.port}"]
+    config.accesslog = None
+    shutdown = asyncio.Event()
+    server = asyncio.ensure_future(serve(app, config, shutdown_trigger=shutdown.wait))
+    try:
+        await wait_until_listening('127.0.0.1', args.port)
+        result = await drive(f"http://127.0.0.1:{args.port}", args.concurrency, args.requests, args.contexts)
+    finally:
+        shutdown.set()
+        await server
+    return {"app": name, **result}
+
+
+async def prepare_remote(args) -> None:
+    async with aiohttp.ClientSession() as session:
+        for i in range(args.contexts):
+            await session.post(f"{args.url}/create_context", json={
+                "name": f"bench-{i}", "service": args.service, "model": args.model,
+                "system_prompt": "You are a benchmark.",
+            })
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Concurrent /send_prompt throughput benchmark')
+    parser.add_argument('--concurrency', type=int, default=64, help='Concurrent client connections')
+    parser.add_argument('--requests', type=int, default=2000, help='Total requests per run')
+    parser.add_argument('--contexts', type=int, default=64, help='Number of contexts to spread prompts over')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated provider latency in seconds')
+    parser.add_argument('--port', type=int, default=5099, help='Port for the in-process servers')
+    parser.add_argument('--url', help='Benchmark a running server instead of the in-process apps')
+    parser.add_argument('--service', default='ollama', help='Service for contexts created with --url')
+    parser.add_argument('--model', default='llama2', help='Model for contexts created with --url')
+    args = parser.parse_args()
+
+    if args.url:
+        await prepare_remote(args)
+        results = [{"app": args.url, **await drive(args.url, args.concurrency, args.requests, args.contexts)}]
+    else:
+        results = [
+            await run_in_process('flask-wsgi', build_flask_app(build_manager(args.latency, args.contexts)), args),
+            await run_in_process('quart-asgi', build_quart_app(build_manager(args.latency, args.contexts)), args),
+        ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,14 @@
+# Set in worker processes to the worker's id; read by code that must behave differently in a worker
+WORKER_ID_ENV = 'LLMSERVER_WORKER_ID'
+
+def __getattr__(name):
+    # The dispatcher and worker routes pull in quart and aiohttp; import them only when used
+    if name == 'Dispatcher':
+        from .dispatcher import Dispatcher
+        return Dispatcher
+    if name == 'register_worker_routes':
+        from .worker import register_worker_routes
+        return register_worker_routes
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+__all__ = ['Dispatcher', 'register_worker_routes', 'WORKER_ID_ENV']
\ No newline at end of file
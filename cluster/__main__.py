@@ -0,0 +1,34 @@
+# cluster/__main__.py
+
+import argparse
+import asyncio
+from config.config_loader import get_api_config, get_cluster_config, get_logging_config
+from utils.logger import setup_logging
+from .dispatcher import Dispatcher
+
+
+async def serve(dispatcher: Dispatcher, host: str, port: int) -> None:
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"{host}:{port}"]
+    await hypercorn_serve(dispatcher.app, config)
+
+
+def main() -> None:
+    api_config = get_api_config()
+    cluster_config = get_cluster_config()
+    parser = argparse.ArgumentParser(description='LLM Server in multi-process mode')
+    parser.add_argument('--workers', type=int, default=cluster_config.get('workers', 4), help='Number of worker processes')
+    parser.add_argument('--host', default=api_config.get('host', '127.0.0.1'), help='Address for the dispatcher')
+    parser.add_argument('--port', type=int, default=api_config.get('port', 5000), help='Port for the dispatcher')
+    args = parser.parse_args()
+
+    setup_logging(get_logging_config())
+    dispatcher = Dispatcher({**cluster_config, 'workers': args.workers})
+    asyncio.run(serve(dispatcher, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,488 @@
+# cluster/dispatcher.py
+
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set
+import aiohttp
+from quart import Quart, Response, request, jsonify, websocket
+from utils.logger import get_logger
+from utils.hash_ring import HashRing
+from cluster.worker import WORKER_ID_ENV
+
+logger = get_logger(__name__)
+
+# JSON field that names the context for routes handled by the context's owner
+CONTEXT_FIELDS = {
+    '/create_context': 'name',
+    '/delete_context': 'name',
+    '/send_prompt': 'name',
+    '/copy_context': 'source_name',
+    '/start_game': 'context_name',
+    '/game_turn': 'context_name',
+}
+# Routes whose results are gathered from every worker
+MERGED_ROUTES = {'/list_contexts', '/admission_stats', '/jobs'}
+HOP_HEADERS = {'host', 'content-length', 'transfer-encoding', 'connection', 'keep-alive', 'upgrade'}
+PASSED_RESPONSE_HEADERS = ('Content-Type', 'Retry-After')
+CLOSE_SERVICE_RESTART = 1012
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def with_label(sample: str, label: str, value: str) -> str:
+    """Add ``label="value"`` to one Prometheus sample line."""
+    name, brace, rest = sample.partition('{')
+    if brace:
+        return f'{name}{{{label}="{value}",{rest}'
+    name, _, number = sample.partition(' ')
+    return f'{name}{{{label}="{value}"}} {number}'
+
+
+class WorkerProcess:
+    def __init__(self, worker_id: str, port: int):
+        self.id = worker_id
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.monitor: Optional[asyncio.Task] = None
+        self.stopping = False
+
+    def exited(self) -> bool:
+        return self.process is not None and self.process.returncode is not None
+
+
+class Dispatcher:
+    """
+    Front process for multi-worker mode.
+
+    Starts N copies of the server (``main.py --worker``) on loopback ports and routes each
+    request to the worker that owns its context on a consistent hash ring, so every context
+    lives in exactly one worker's ConversationManager. When workers are added, removed or
+    crash, routing pauses, in-flight requests drain, and the contexts (and active games) whose
+    owner changed are released by their old worker and adopted by the new one.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.worker_count = config.get('workers', 2)
+        self.base_port = config.get('base_port', 5100)
+        self.start_timeout = config.get('start_timeout', 60)
+        self.drain_timeout = config.get('drain_timeout', 30)
+        self.restart_delay = config.get('restart_delay', 2)
+        self.admin_token = config.get('admin_token')
+        self.ring = HashRing(replicas=config.get('replicas', 100))
+        self.workers: Dict[str, WorkerProcess] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.in_flight = 0
+        self.rebalance_lock = asyncio.Lock()
+        self.sockets: Dict[asyncio.Task, tuple] = {}
+        self._ids = itertools.count()
+        self._round_robin = itertools.count()
+        self.app = self.create_app()
+
+    # Worker lifecycle
+
+    def _next_port(self) -> int:
+        used = {worker.port for worker in self.workers.values()}
+        port = self.base_port
+        while port in used:
+            port += 1
+        return port
+
+    async def spawn(self, worker: WorkerProcess) -> None:
+        env = dict(os.environ, **{WORKER_ID_ENV: worker.id})
+        worker.stopping = False
+        worker.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT_DIR, 'main.py'), '--worker', '--no-console',
+            '--host', '127.0.0.1', '--port', str(worker.port), cwd=ROOT_DIR, env=env,
+        )
+        started = time.monotonic()
+        while True:
+            if worker.process.returncode is not None:
+                raise RuntimeError(f"Worker {worker.id} exited during startup with code {worker.process.returncode}")
+            try:
+                await self.call(worker, 'GET', '/cluster/contexts')
+                break
+            except (aiohttp.ClientError, OSError):
+                if time.monotonic() - started > self.start_timeout:
+                    worker.process.terminate()
+                    raise RuntimeError(f"Worker {worker.id} did not start within {self.start_timeout}s")
+                await asyncio.sleep(0.2)
+        worker.monitor = asyncio.create_task(self.watch(worker))
+        logger.info("Worker %s ready on port %s (pid %s)", worker.id, worker.port, worker.process.pid)
+
+    async def add_worker(self) -> WorkerProcess:
+        worker = WorkerProcess(f"w{next(self._ids)}", self._next_port())
+        await self.spawn(worker)
+        self.workers[worker.id] = worker
+        await self.rebalance(add=worker.id)
+        return worker
+
+    async def remove_worker(self, worker_id: str) -> None:
+        worker = self.workers[worker_id]
+        # Hand its contexts over while it is still alive, then stop it
+        await self.rebalance(remove=worker_id, leaving=worker)
+        del self.workers[worker_id]
+        await self.stop_worker(worker)
+
+    async def stop_worker(self, worker: WorkerProcess) -> None:
+        worker.stopping = True
+        if worker.process and worker.process.returncode is None:
+            worker.process.terminate()
+            try:
+                await asyncio.wait_for(worker.process.wait(), 10)
+            except asyncio.TimeoutError:
+                worker.process.kill()
+        if worker.monitor and worker.monitor is not asyncio.current_task():
+            worker.monitor.cancel()
+
+    async def watch(self, worker: WorkerProcess) -> None:
+        code = await worker.process.wait()
+        if worker.stopping:
+            return
+        logger.error("Worker %s exited with code %s; its contexts move to the remaining workers", worker.id, code)
+        self.workers.pop(worker.id, None)
+        await self.rebalance(remove=worker.id)
+        await asyncio.sleep(self.restart_delay)
+        try:
+            await self.add_worker()
+        except Exception as e:
+            logger.error("Could not replace worker %s: %s", worker.id, e)
+
+    async def start(self) -> None:
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None))
+        for _ in range(self.worker_count):
+            worker = WorkerProcess(f"w{next(self._ids)}", self._next_port())
+            await self.spawn(worker)
+            self.workers[worker.id] = worker
+            self.ring.add(worker.id)
+        # Every worker loaded all stored contexts at startup; keep each one only on its owner
+        await self.rebalance()
+
+    async def stop(self) -> None:
+        for worker in list(self.workers.values()):
+            await self.stop_worker(worker)
+        self.workers.clear()
+        if self.session:
+            await self.session.close()
+
+    # Ownership
+
+    def owner(self, context_name: str) -> Optional[WorkerProcess]:
+        worker_id = self.ring.get(context_name)
+        return self.workers.get(worker_id) if worker_id else None
+
+    def any_worker(self) -> Optional[WorkerProcess]:
+        workers = [self.workers[worker_id] for worker_id in self.ring.nodes if worker_id in self.workers]
+        return workers[next(self._round_robin) % len(workers)] if workers else None
+
+    async def call(self, worker: WorkerProcess, method: str, path: str, payload: Any = None) -> Any:
+        async with self.session.request(method, worker.url + path, json=payload) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def drain(self) -> None:
+        started = time.monotonic()
+        while self.in_flight and time.monotonic() - started < self.drain_timeout:
+            await asyncio.sleep(0.05)
+        if self.in_flight:
+            logger.warning("Rebalancing with %s requests still in flight", self.in_flight)
+
+    async def rebalance(self, add: Optional[str] = None, remove: Optional[str] = None,
+                        leaving: Optional[WorkerProcess] = None) -> Dict[str, int]:
+        """
+        Apply a membership change and move every context whose owner changed; returns moves per new owner.
+
+        The ring only changes once routing is paused and in-flight requests have drained.
+        """
+        async with self.rebalance_lock:
+            self.gate.clear()
+            try:
+                await self.drain()
+                previous = self.ring.copy()
+                if add:
+                    self.ring.add(add)
+                if remove:
+                    self.ring.remove(remove)
+                self.close_moved_sockets()
+                sources = [worker for worker in self.workers.values() if not worker.exited()]
+                listings = {worker.id: await self.call(worker, 'GET', '/cluster/contexts') for worker in sources}
+                names: Set[str] = set()
+                for listing in listings.values():
+                    names.update(listing['stored'])
+                    names.update(listing['owned'])
+
+                contexts: Dict[str, Any] = {}
+                games: Dict[str, Any] = {}
+                for worker in sources:
+                    moving = [name for name in listings[worker.id]['owned'] if self.ring.get(name) != worker.id]
+                    if moving:
+                        released = await self.call(worker, 'POST', '/cluster/release', {"names": moving})
+                        # The previous owner's copy is authoritative; other copies are startup leftovers
+                        for name, data in released['contexts'].items():
+                            if previous.get(name) == worker.id or name not in contexts:
+                                contexts[name] = data
+                        for name, data in released['games'].items():
+                            if previous.get(name) == worker.id or name not in games:
+                                games[name] = data
+
+                moves: Dict[str, int] = {}
+                for worker in sources:
+                    if worker is leaving:
+                        continue
+                    owned = set(listings[worker.id]['owned'])
+                    wanted = [name for name in names if self.ring.get(name) == worker.id
+                              and (name not in owned or previous.get(name) != worker.id)]
+                    if wanted:
+                        await self.call(worker, 'POST', '/cluster/adopt', {
+                            "names": wanted,
+                            "contexts": {name: contexts[name] for name in wanted if name in contexts},
+                            "games": {name: games[name] for name in wanted if name in games},
+                        })
+                        moves[worker.id] = len(wanted)
+                logger.info("Rebalanced %s contexts over %s workers: %s", len(names), len(self.ring.nodes), moves)
+                return moves
+            finally:
+                self.gate.set()
+
+    def close_moved_sockets(self) -> None:
+        for task, (context_name, worker_id) in list(self.sockets.items()):
+            if self.ring.get(context_name) != worker_id:
+                task.cancel()
+
+    # Request routing
+
+    def create_app(self) -> Quart:
+        app = Quart(__name__)
+
+        @app.before_serving
+        async def start_workers():
+            await self.start()
+
+        @app.after_serving
+        async def stop_workers():
+            await self.stop()
+
+        @app.route('/cluster/status', methods=['GET'])
+        async def cluster_status():
+            return jsonify({
+                "workers": {worker.id: {"port": worker.port, "pid": worker.process.pid if worker.process else None}
+                            for worker in self.workers.values()},
+                "ring": list(self.ring.nodes),
+                "in_flight": self.in_flight,
+            })
+
+        @app.route('/cluster/workers', methods=['POST'])
+        async def cluster_add_worker():
+            if not self.authorized():
+                return jsonify({"error": "Forbidden"}), 403
+            worker = await self.add_worker()
+            return jsonify({"worker": worker.id, "port": worker.port})
+
+        @app.route('/cluster/workers/<worker_id>', methods=['DELETE'])
+        async def cluster_remove_worker(worker_id):
+            if not self.authorized():
+                return jsonify({"error": "Forbidden"}), 403
+            if worker_id not in self.workers:
+                return jsonify({"error": "Unknown worker"}), 404
+            if len(self.workers) == 1:
+                return jsonify({"error": "Cannot remove the last worker"}), 400
+            await self.remove_worker(worker_id)
+            return jsonify({"removed": worker_id})
+
+        @app.route('/metrics', methods=['GET'])
+        async def cluster_metrics():
+            return Response(await self.merged_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+        @app.route('/ws/game/<context_name>')
+        async def proxy_websocket(context_name):
+            await self.proxy_websocket(context_name)
+
+        app.add_url_rule('/<path:path>', 'proxy', self.route_request, methods=['GET', 'POST', 'DELETE'])
+        return app
+
+    def authorized(self) -> bool:
+        return bool(self.admin_token) and request.headers.get('X-Admin-Token') == self.admin_token
+
+    async def route_request(self, path: str):
+        path = '/' + path
+        body = await request.get_data()
+        data = None
+        if body:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                pass
+        await self.gate.wait()
+
+        if request.method == 'GET' and path in MERGED_ROUTES:
+            return await self.merged(path)
+        if path.startswith('/jobs/'):
+            worker_id, _, job_id = path[len('/jobs/'):].partition('.')
+            worker = self.workers.get(worker_id)
+            if worker is None or not job_id:
+                return jsonify({"error": "Unknown or expired job"}), 404
+            return await self.forward(worker, f"/jobs/{job_id}", body, rewrite_job=True)
+
+        context_name = self.context_of(path, data)
+        worker = self.owner(context_name) if context_name else self.any_worker()
+        if worker is None:
+            return jsonify({"error": "No workers available"}), 503
+        response = await self.forward(worker, path, body, rewrite_job=path in ('/jobs', '/batch'))
+        if path == '/copy_context' and isinstance(data, dict) and response.status_code == 200:
+            await self.place(data.get('new_name'), worker)
+        return response
+
+    @staticmethod
+    def context_of(path: str, data: Any) -> Optional[str]:
+        if not isinstance(data, dict):
+            return None
+        if path in CONTEXT_FIELDS:
+            return data.get(CONTEXT_FIELDS[path])
+        if path == '/jobs':
+            params = data.get('params') or {}
+            return params.get('name') or params.get('context_name') if isinstance(params, dict) else None
+        return None
+
+    async def place(self, context_name: Optional[str], holder: WorkerProcess) -> None:
+        """Move a context created on ``holder`` (e.g. by copy_context) to its owner."""
+        owner = self.owner(context_name) if context_name else None
+        if owner is None or owner is holder:
+            return
+        released = await self.call(holder, 'POST', '/cluster/release', {"names": [context_name]})
+        await self.call(owner, 'POST', '/cluster/adopt', {"names": [context_name], "contexts": released['contexts']})
+
+    def forward_headers(self) -> Dict[str, str]:
+        return {key: value for key, value in request.headers.items() if key.lower() not in HOP_HEADERS}
+
+    async def forward(self, worker: WorkerProcess, path: str, body: bytes, rewrite_job: bool = False):
+        self.in_flight += 1
+        try:
+            upstream = await self.session.request(
+                request.method, worker.url + path, params=request.args, headers=self.forward_headers(), data=body
+            )
+        except aiohttp.ClientError as e:
+            self.in_flight -= 1
+            logger.error("Worker %s unreachable: %s", worker.id, e)
+            response = jsonify({"error": "Worker unavailable"})
+            response.status_code = 502
+            return response
+        headers = {key: upstream.headers[key] for key in PASSED_RESPONSE_HEADERS if key in upstream.headers}
+
+        if upstream.headers.get('Content-Type', '').startswith('application/x-ndjson'):
+            async def stream():
+                try:
+                    async for chunk in upstream.content.iter_any():
+                        yield chunk
+                finally:
+                    upstream.release()
+                    self.in_flight -= 1
+            return Response(stream(), status=upstream.status, headers=headers)
+
+        try:
+            content = await upstream.read()
+        finally:
+            upstream.release()
+            self.in_flight -= 1
+        if rewrite_job and content:
+            content = self.rewrite_job(worker, content, headers)
+        return Response(content, status=upstream.status, headers=headers)
+
+    @staticmethod
+    def rewrite_job(worker: WorkerProcess, content: bytes, headers: Dict[str, str]) -> bytes:
+        # Job ids are local to a worker; prefix them so later polls reach the same worker
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return content
+        for key in ('job_id', 'id'):
+            if isinstance(data, dict) and data.get(key):
+                data[key] = f"{worker.id}.{data[key]}"
+                if 'location' in data:
+                    data['location'] = f"/jobs/{data[key]}"
+                    headers['Location'] = data['location']
+        return json.dumps(data).encode('utf-8')
+
+    async def merged(self, path: str):
+        results = {}
+        for worker in list(self.workers.values()):
+            try:
+                results[worker.id] = await self.call(worker, 'GET', path)
+            except (aiohttp.ClientError, OSError) as e:
+                results[worker.id] = {"error": str(e)}
+        if path == '/list_contexts':
+            contexts: List[Dict[str, Any]] = []
+            for result in results.values():
+                contexts.extend(result.get('contexts', []))
+            return jsonify({"success": True, "contexts": sorted(contexts, key=lambda c: c['name'])})
+        return jsonify({"workers": results})
+
+    async def merged_metrics(self) -> str:
+        """Every worker's /metrics, with a ``worker`` label added to each sample."""
+        types: Dict[str, str] = {}
+        samples: Dict[str, List[str]] = {}
+        for worker in list(self.workers.values()):
+            try:
+                async with self.session.get(f"http://127.0.0.1:{worker.port}/metrics") as response:
+                    text = await response.text()
+            except (aiohttp.ClientError, OSError) as e:
+                logger.warning("Could not collect metrics from worker %s: %s", worker.id, e)
+                continue
+            family = None
+            for line in text.splitlines():
+                if line.startswith('# TYPE '):
+                    family = line.split()[2]
+                    types.setdefault(family, line)
+                elif line and not line.startswith('#'):
+                    samples.setdefault(family, []).append(with_label(line, 'worker', worker.id))
+        lines: List[str] = []
+        for family, type_line in types.items():
+            lines.append(type_line)
+            lines.extend(samples.get(family, []))
+        return '\n'.join(lines) + '\n'
+
+    async def proxy_websocket(self, context_name: str) -> None:
+        await self.gate.wait()
+        worker = self.owner(context_name)
+        if worker is None:
+            await websocket.close(1013)
+            return
+        task = asyncio.current_task()
+        self.sockets[task] = (context_name, worker.id)
+        try:
+            ws_url = f"ws://127.0.0.1:{worker.port}/ws/game/{context_name}"
+            async with self.session.ws_connect(ws_url, headers=self.forward_headers_ws()) as upstream:
+                await websocket.accept()
+
+                async def client_to_worker():
+                    while True:
+                        await upstream.send_str(await websocket.receive())
+
+                relay = asyncio.create_task(client_to_worker())
+                try:
+                    async for message in upstream:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            await websocket.send(message.data)
+                        else:
+                            break
+                    await websocket.close(upstream.close_code or 1000)
+                finally:
+                    relay.cancel()
+        except asyncio.CancelledError:
+            if not self.ring.get(context_name) == worker.id:
+                # The context moved to another worker; the client should reconnect
+                await websocket.close(CLOSE_SERVICE_RESTART)
+            raise
+        finally:
+            self.sockets.pop(task, None)
+
+    def forward_headers_ws(self) -> Dict[str, str]:
+        return {key: value for key, value in websocket.headers.items()
+                if key.lower() not in HOP_HEADERS and not key.lower().startswith('sec-websocket')}
\ No newline at end of file
@@ -0,0 +1,75 @@
+# cluster/worker.py
+
+import asyncio
+import os
+from typing import List
+from quart import request, jsonify
+from utils.logger import get_logger
+from . import WORKER_ID_ENV
+
+logger = get_logger(__name__)
+
+
+def owned_contexts(manager, game_engine=None) -> List[str]:
+    """The contexts this worker owns: those in memory, and those hibernated to storage with their games."""
+    names = set(manager.contexts) | set(manager.hibernated)
+    if game_engine is not None:
+        names |= game_engine.hibernated
+    return sorted(names)
+
+
+def register_worker_routes(app, manager, game_engine, admission=None, drain_timeout: float = 30):
+    """
+    Endpoints the dispatcher uses to move context ownership between workers.
+
+    Only registered in worker mode; workers listen on the loopback interface.
+    """
+    parent_pid = os.getppid()
+    watchers = []
+
+    async def watch_parent():
+        # If the dispatcher dies without stopping us, don't linger holding the port
+        while os.getppid() == parent_pid:
+            await asyncio.sleep(1)
+        logger.warning("Dispatcher exited; stopping worker")
+        os._exit(0)
+
+    @app.before_serving
+    async def exit_with_dispatcher():
+        watchers.append(asyncio.create_task(watch_parent()))
+
+    @app.route('/cluster/contexts', methods=['GET'])
+    async def cluster_contexts():
+        # Polled on every rebalance; storage may wait on a file lock or Redis, so keep it off the loop
+        stored = await asyncio.to_thread(manager.storage_backend.list_names) if manager.storage_backend else []
+        # Hibernated contexts are listed too, so they are released when their owner changes
+        return jsonify({"owned": owned_contexts(manager, game_engine), "stored": stored})
+
+    @app.route('/cluster/release', methods=['POST'])
+    async def cluster_release():
+        data = await request.get_json() or {}
+        # Background jobs may still be generating on these contexts; let them finish and save first
+        if admission is not None and not await admission.wait_idle(drain_timeout):
+            logger.warning("Releasing contexts while generations are still in flight")
+        contexts, games = {}, {}
+        for name in data.get('names', []):
+            context = manager.release_context(name)
+            if context is not None:
+                contexts[name] = context
+            game = game_engine.export_state(name)
+            if game is not None:
+                games[name] = game
+        logger.info("Released %s contexts and %s games", len(contexts), len(games))
+        return jsonify({"contexts": contexts, "games": games})
+
+    @app.route('/cluster/adopt', methods=['POST'])
+    async def cluster_adopt():
+        data = await request.get_json() or {}
+        contexts = data.get('contexts') or {}
+        games = data.get('games') or {}
+        adopted = [name for name in data.get('names', []) if manager.adopt_context(name, contexts.get(name))]
+        for name, game in games.items():
+            if name in manager.contexts:
+                game_engine.import_state(name, game)
+        logger.info("Adopted %s contexts", len(adopted))
+        return jsonify({"adopted": adopted})
\ No newline at end of file
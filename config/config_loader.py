@@ -1,15 +1,76 @@
    # config/config_loader.py
 
+import asyncio
+import copy
+import fnmatch
 import os
+import threading
 import yaml
-from typing import Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from utils.logger import get_logger
 
-def load_config(config_path: str = 'config/services.yaml') -> Dict[str, Any]:
+logger = get_logger(__name__)
+
+# Another configuration file can be used by setting this variable, e.g. for a load test's server
+CONFIG_PATH_ENV = 'LLMSERVER_CONFIG'
+DEFAULT_CONFIG_PATH = os.getenv(CONFIG_PATH_ENV, 'config/services.yaml')
+
+# Settings that are read while the server runs, so edits to them are applied without a restart.
+# A key covers everything below it.
+RUNTIME_KEYS = (
+    'logging.level', 'logging.sampling', 'logging.rate_limits',
+    'admission.enabled', 'admission.global', 'admission.default_service', 'admission.services', 'admission.tenants',
+    'deadlines',
+    'jobs.max_queued', 'jobs.result_ttl', 'jobs.max_wait', 'jobs.default_priority',
+    'batch.row_timeout', 'batch.concurrency',
+    'fan_out.max_targets',
+    'game_prompt',
+    'tracing.sample_rate', 'tracing.slow_request_seconds',
+)
+
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _is_count(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 1
+
+# (dotted key pattern, check, what the value must be) for keys whose values can be checked on reload
+RULES: Tuple[Tuple[str, Callable[[Any], bool], str], ...] = (
+    ('logging.level', lambda value: value in LOG_LEVELS, f"one of {', '.join(LOG_LEVELS)}"),
+    ('logging.sampling.*', lambda value: _is_number(value) and 0 <= value <= 1, "a fraction between 0 and 1"),
+    ('logging.rate_limits.*', lambda value: _is_number(value) and value > 0, "a positive number"),
+    ('admission.*.limit', _is_count, "a positive integer"),
+    ('admission.*.max_queue', lambda value: _is_count(value) or value == 0, "a non-negative integer"),
+    ('admission.tenants.*.weight', lambda value: _is_number(value) and value > 0, "a positive number"),
+    ('admission.tenants.*.max_concurrency', lambda value: _is_count(value) or value == 0, "a non-negative integer"),
+    ('deadlines.*', lambda value: value is None or (_is_number(value) and value > 0), "a positive number of seconds"),
+    ('jobs.max_queued', _is_count, "a positive integer"),
+    ('batch.concurrency.*', _is_count, "a positive integer"),
+    ('fan_out.max_targets', _is_count, "a positive integer"),
+    ('game_prompt.*_turns', lambda value: _is_count(value) or value == 0, "a non-negative integer"),
+    ('game_prompt.narration_chars', lambda value: _is_count(value) or value == 0, "a non-negative integer"),
+    ('tracing.sample_rate', lambda value: _is_number(value) and 0 <= value <= 1, "a fraction between 0 and 1"),
+)
+
+_MISSING = object()
+
+class ConfigError(ValueError):
+    """The configuration file is invalid, or a value has the wrong type."""
+
+def parse_config(config_path: str = DEFAULT_CONFIG_PATH) -> Dict[str, Any]:
+    """Read and parse the YAML file; raises OSError, yaml.YAMLError or ConfigError."""
+    with open(config_path, 'r') as file:
+        config = yaml.safe_load(file)
+    if not isinstance(config, dict):
+        raise ConfigError(f"{config_path} must contain a mapping of sections")
+    return _replace_env_vars(config)
+
+def load_config(config_path: str = DEFAULT_CONFIG_PATH) -> Dict[str, Any]:
     """Load the configuration from the YAML file."""
     try:
-        with open(config_path, 'r') as file:
-            config = yaml.safe_load(file)
-        return _replace_env_vars(config)
+        return parse_config(config_path)
     except FileNotFoundError:
         print(f"Configuration file not found: {config_path}")
         print("Please make sure the file exists and the path is correct.")
@@ -31,27 +92,258 @@ def _replace_env_vars(config: Dict[str, Any]) -> Dict[str, Any]:
             config[key] = os.getenv(env_var, value)
     return config
 
+def _flatten(config: Any, prefix: str = '') -> Dict[str, Any]:
+    """Leaf values by dotted key; empty sections count as leaves."""
+    if not isinstance(config, dict) or not config:
+        return {prefix: config} if prefix else {}
+    leaves = {}
+    for key, value in config.items():
+        leaves.update(_flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    return leaves
+
+def _lookup(config: Dict[str, Any], key: str) -> Any:
+    value: Any = config
+    for part in key.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+def _assign(config: Dict[str, Any], key: str, value: Any) -> None:
+    *parents, last = key.split('.')
+    for part in parents:
+        if not isinstance(config.get(part), dict):
+            if value is _MISSING:
+                return
+            config[part] = {}
+        config = config[part]
+    if value is _MISSING:
+        config.pop(last, None)
+    else:
+        config[last] = value
+
+def _is_runtime(key: str) -> bool:
+    return any(key == runtime or key.startswith(runtime + '.') for runtime in RUNTIME_KEYS)
+
+def validate_config(new: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """Problems that make ``new`` unusable in place of ``current``; empty if it can be applied."""
+    problems = []
+    for section, value in current.items():
+        if isinstance(value, dict) and not isinstance(new.get(section, {}), dict):
+            problems.append(f"{section} must be a mapping")
+    current_leaves = _flatten(current)
+    for key, value in _flatten(new).items():
+        old = current_leaves.get(key)
+        # Values may be cleared, but not change type: a quoted number or a typo'd list is a mistake
+        if value is not None and old is not None and not isinstance(old, dict):
+            if (_is_number(old) and not _is_number(value)) or (not _is_number(old) and type(value) is not type(old)):
+                problems.append(f"{key} must be of type {type(old).__name__}, got {value!r}")
+                continue
+        for pattern, check, expected in RULES:
+            if fnmatch.fnmatchcase(key, pattern) and not check(value):
+                problems.append(f"{key} must be {expected}, got {value!r}")
+    return problems
+
+class Config:
+    """
+    The configuration file, parsed once and shared by every ``get_*_config`` call.
+
+    ``reload()`` (run by ``watch()`` whenever the file's modification time changes) re-reads
+    the file and applies edits to the keys in ``RUNTIME_KEYS`` straight away; subscribers of
+    the affected sections are told so they can update their running objects. Other edits are
+    logged and take effect on the next start. A file that does not parse or validate is
+    rejected as a whole and the current configuration is kept.
+    """
+
+    def __init__(self, path: str = DEFAULT_CONFIG_PATH):
+        self.path = path
+        self.mtime = self._mtime()
+        self.data: Dict[str, Any] = load_config(path)
+        self.subscribers: List[Tuple[str, Callable[[Dict[str, Any]], None]]] = []
+        self.lock = threading.Lock()
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """The value at a dotted ``key`` such as ``api.port``, or ``default`` if it is not set."""
+        value = _lookup(self.data, key)
+        return default if value is _MISSING or value is None else value
+
+    def get_int(self, key: str, default: Optional[int] = None) -> int:
+        value = self.get(key, default)
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ConfigError(f"{key} must be an integer, got {value!r}")
+        return value
+
+    def get_float(self, key: str, default: Optional[float] = None) -> float:
+        value = self.get(key, default)
+        if not _is_number(value):
+            raise ConfigError(f"{key} must be a number, got {value!r}")
+        return float(value)
+
+    def get_bool(self, key: str, default: Optional[bool] = None) -> bool:
+        value = self.get(key, default)
+        if not isinstance(value, bool):
+            raise ConfigError(f"{key} must be true or false, got {value!r}")
+        return value
+
+    def get_str(self, key: str, default: Optional[str] = None) -> str:
+        value = self.get(key, default)
+        if not isinstance(value, str):
+            raise ConfigError(f"{key} must be a string, got {value!r}")
+        return value
+
+    def section(self, name: str, default: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """A copy of section ``name`` (or of ``default``), so callers can't change the shared config."""
+        value = self.get(name)
+        if value is None:
+            value = default if default is not None else {}
+        if not isinstance(value, dict):
+            raise ConfigError(f"{name} must be a mapping, got {value!r}")
+        return copy.deepcopy(value)
+
+    def subscribe(self, section: str, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """Call ``callback(section)`` after a reload changes it; returns a function that unsubscribes."""
+        entry = (section, callback)
+        self.subscribers.append(entry)
+        return lambda: self.subscribers.remove(entry) if entry in self.subscribers else None
+
+    def reload(self) -> List[str]:
+        """
+        Re-read the file and apply the runtime keys that changed, which are returned.
+
+        Raises ConfigError, leaving the current configuration in place, if the file can't be read
+        or fails validation.
+        """
+        with self.lock:
+            self.mtime = self._mtime()
+            try:
+                new = parse_config(self.path)
+            except (OSError, yaml.YAMLError) as e:
+                raise ConfigError(f"Could not read {self.path}: {e}") from e
+            problems = validate_config(new, self.data)
+            if problems:
+                raise ConfigError('; '.join(problems))
+
+            current = self.data
+            applied = [key for key in RUNTIME_KEYS if _lookup(current, key) != _lookup(new, key)]
+            current_leaves, new_leaves = _flatten(current), _flatten(new)
+            pending = sorted(key for key in current_leaves.keys() | new_leaves.keys()
+                             if not _is_runtime(key) and current_leaves.get(key, _MISSING) != new_leaves.get(key, _MISSING))
+            if pending:
+                logger.warning("Configuration changes need a restart to take effect: %s", ', '.join(pending))
+            if not applied:
+                return []
+            data = copy.deepcopy(current)
+            for key in applied:
+                _assign(data, key, copy.deepcopy(_lookup(new, key)))
+            self.data = data
+
+        logger.info("Applied configuration changes: %s", ', '.join(applied))
+        sections = {key.split('.')[0] for key in applied}
+        for section, callback in list(self.subscribers):
+            if section in sections:
+                try:
+                    callback(self.section(section))
+                except Exception:
+                    logger.exception("Could not apply the new %s configuration", section)
+        return applied
+
+    def changed(self) -> bool:
+        return self._mtime() != self.mtime
+
+    async def watch(self, interval: float = 2.0) -> None:
+        """Reload whenever the file's modification time changes, checking every ``interval`` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            if not self.changed():
+                continue
+            try:
+                self.reload()
+            except ConfigError as e:
+                logger.error("Rejected configuration change, keeping the current configuration: %s", e)
+
+_config: Optional[Config] = None
+
+def get_config() -> Config:
+    """The process-wide configuration, parsed on first use."""
+    global _config
+    if _config is None:
+        _config = Config()
+    return _config
+
 def get_service_config(service_name: str) -> Dict[str, Any]:
     """Get the configuration for a specific service."""
-    config = load_config()
-    return config.get('services', {}).get(service_name, {})
+    return get_config().section('services').get(service_name, {})
 
 def get_api_config() -> Dict[str, Any]:
     """Get the API server configuration."""
-    config = load_config()
-    return config.get('api', {'host': '127.0.0.1', 'port': 5000})
+    return get_config().section('api', {'host': '127.0.0.1', 'port': 5000})
 
 def get_console_config() -> Dict[str, Any]:
     """Get the console configuration."""
-    config = load_config()
-    return config.get('console', {'enabled': True})
+    return get_config().section('console', {'enabled': True})
 
 def get_logging_config() -> Dict[str, Any]:
     """Get the logging configuration."""
-    config = load_config()
-    return config.get('logging', {'level': 'INFO', 'file': 'llmserver.log'})
+    return get_config().section('logging', {'level': 'INFO', 'file': 'llmserver.log'})
+
+def get_cancellation_config() -> Dict[str, Any]:
+    """Get the configuration for cancelled generations."""
+    return get_config().section('cancellation', {'persist_incomplete': False})
+
+def get_deadline_config() -> Dict[str, Any]:
+    """Get the request deadline configuration (timeouts in seconds)."""
+    return get_config().section('deadlines', {'default': 60})
+
+def get_admission_config() -> Dict[str, Any]:
+    """Get the admission control configuration."""
+    return get_config().section('admission')
+
+def get_jobs_config() -> Dict[str, Any]:
+    """Get the background job configuration."""
+    return get_config().section('jobs')
+
+def get_batch_config() -> Dict[str, Any]:
+    """Get the batch runner configuration."""
+    return get_config().section('batch')
+
+def get_fan_out_config() -> Dict[str, Any]:
+    """Get the fan-out endpoint configuration."""
+    return get_config().section('fan_out')
+
+def get_game_prompt_config() -> Dict[str, Any]:
+    """Get how much of a game's history is sent with each turn."""
+    return get_config().section('game_prompt')
+
+def get_cluster_config() -> Dict[str, Any]:
+    """Get the multi-worker (cluster) configuration."""
+    return get_config().section('cluster')
+
+def get_storage_config() -> Dict[str, Any]:
+    """Get the context and game storage configuration."""
+    return get_config().section('storage')
+
+def get_tracing_config() -> Dict[str, Any]:
+    """Get the request tracing configuration."""
+    return get_config().section('tracing')
+
+def get_profiling_config() -> Dict[str, Any]:
+    """Get the on-demand profiling configuration."""
+    return get_config().section('profiling')
+
+def get_startup_config() -> Dict[str, Any]:
+    """Get the start-up and readiness configuration."""
+    return get_config().section('startup')
+
+def get_fake_provider_config() -> Dict[str, Any]:
+    """Get the settings of the fake provider used for load tests."""
+    return get_config().section('fake_provider')
 
 def get_plugin_config() -> Dict[str, Any]:
     """Get the plugin configuration."""
-    config = load_config()
-    return config.get('plugins', {})
\ No newline at end of file
+    return get_config().section('plugins')
\ No newline at end of file
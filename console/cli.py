@@ -1,24 +1,28 @@
 # console/cli.py
 
 import asyncio
+import time
 from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import WordCompleter
 from prompt_toolkit.styles import Style
 from utils.logger import get_logger
 from utils.error_handler import ErrorHandler
+from utils.profiling import Profiler, ProfilerBusy, footprint
+from config.config_loader import get_profiling_config
 
 logger = get_logger(__name__)
 
 class CLI:
-    def __init__(self, conversation_manager, game_engine, plugin_manager):
+    def __init__(self, conversation_manager, game_engine, plugin_manager, profiler=None):
         self.manager = conversation_manager
         self.game_engine = game_engine
         self.plugin_manager = plugin_manager
+        self.profiler = profiler or Profiler(get_profiling_config(), lambda: footprint(self.manager, self.game_engine))
         self.session = PromptSession()
         self.command_completer = WordCompleter([
             'help', 'create_context', 'list_contexts', 'delete_context',
             'send_prompt', 'list_models', 'start_game', 'game_turn',
-            'execute_plugin', 'exit'
+            'execute_plugin', 'profile', 'exit'
         ])
         self.style = Style.from_dict({
             'prompt': '#ansibrightcyan bold',
@@ -69,6 +73,8 @@ class CLI:
                 await self.game_turn(args)
             elif cmd == 'execute_plugin':
                 await self.execute_plugin(args)
+            elif cmd == 'profile':
+                await self.profile(args)
             else:
                 print("Unknown command. Type 'help' for a list of commands.")
         except Exception as e:
@@ -91,6 +97,8 @@ Available commands:
                               - Take a turn in an active game
   execute_plugin <name> [args]
                               - Execute a plugin with optional arguments
+  profile <seconds> [sampling|cprofile|yappi] [top|collapsed|pstats] [memory]
+                              - Profile the running server; collapsed and pstats are written to a file
   exit                       - Exit the console
 """
         print(help_text)
@@ -191,13 +199,35 @@ Available commands:
         else:
             self.print_error(f"Error executing plugin {plugin_name}")
 
+    async def profile(self, args):
+        if not args:
+            self.print_error("Usage: profile <seconds> [sampling|cprofile|yappi] [top|collapsed|pstats] [memory]")
+            return
+        options = [arg.lower() for arg in args[1:]]
+        memory = 'memory' in options
+        options = [option for option in options if option != 'memory']
+        mode = options[0] if options else 'sampling'
+        output = options[1] if len(options) > 1 else 'top'
+        self.print_output(f"Profiling for {args[0]} seconds...")
+        try:
+            body, _ = await self.profiler.run(args[0], mode, output, memory=memory)
+        except (ValueError, ProfilerBusy) as e:
+            self.print_error(str(e))
+            return
+        if output == 'top':
+            print(body)
+            return
+        path = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.{output}"
+        with open(path, 'wb' if output == 'pstats' else 'w') as f:
+            f.write(body)
+        self.print_output(f"Profile written to {path}")
+
     def print_output(self, message):
         print(self.style.output(message))
 
     def print_error(self, message):
         print(self.style.error(f"Error: {message}"))
 
-async def start_console(conversation_manager, game_engine, plugin_manager):
-    cli = CLI(conversation_manager, game_engine, plugin_manager)
-    await cli.run()
-
+async def start_console(conversation_manager, game_engine, plugin_manager, profiler=None):
+    cli = CLI(conversation_manager, game_engine, plugin_manager, profiler)
+    await cli.run()
\ No newline at end of file
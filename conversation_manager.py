@@ -1,11 +1,16 @@
 # conversation_manager.py
 
+import asyncio
 import json
-from typing import Dict, Any, Optional, List
+import weakref
+from typing import Callable, Dict, Any, Optional, List
 from dataclasses import dataclass, field, asdict
 from game_settings import get_default_settings
 from utils.logger import get_logger
 from utils.error_handler import ErrorHandler
+from utils.metrics import metrics
+from utils.deadline import DeadlineExceeded, with_deadline
+from utils.instrumentation import timed_generate, timed_stream
 
 logger = get_logger(__name__)
 
@@ -46,9 +51,24 @@ class ConversationContext:
         )
 
 class ConversationManager:
-    def __init__(self, storage_backend=None):
+    def __init__(self, storage_backend=None, service_clients: Optional[Dict[str, Any]] = None,
+                 persist_incomplete: bool = False, replicated: bool = False):
         self.contexts: Dict[str, ConversationContext] = {}
         self.storage_backend = storage_backend
+        self.service_clients: Dict[str, Any] = service_clients if service_clients is not None else {}
+        # When True, a cancelled generation is kept as an assistant message marked incomplete
+        self.persist_incomplete = persist_incomplete
+        # When True, other replicas write to the same storage: ``contexts`` is only a cache,
+        # kept fresh through the backend's invalidation messages, and turns are locked per context
+        self.replicated = replicated
+        # Otherwise turns are serialised in process; a lock lives only while a turn holds or awaits it
+        self.turn_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        # Contexts saved and dropped from memory by ``hibernate_context``, with what ``list_contexts`` shows of them
+        self.hibernated: Dict[str, Dict[str, Any]] = {}
+        # Called with the name of each deleted context, e.g. to end its game
+        self.delete_listeners: List[Callable[[str], None]] = []
+        if replicated:
+            storage_backend.subscribe(self.invalidate)
         self.load_all_contexts()
 
     def load_all_contexts(self):
@@ -58,21 +78,21 @@ class ConversationManager:
                 for context_data in stored_contexts:
                     context = ConversationContext.from_dict(context_data)
                     self.contexts[context.name] = context
-                logger.info(f"Loaded {len(self.contexts)} contexts from storage")
+                logger.info("Loaded %s contexts from storage", len(self.contexts))
             except Exception as e:
-                logger.error(f"Error loading contexts: {str(e)}")
+                logger.error("Error loading contexts: %s", e)
 
     def save_context(self, context: ConversationContext):
         if self.storage_backend:
             try:
                 self.storage_backend.save(context.name, context.to_dict())
-                logger.debug(f"Saved context: {context.name}")
+                logger.debug("Saved context: %s", context.name)
             except Exception as e:
-                logger.error(f"Error saving context {context.name}: {str(e)}")
+                logger.error("Error saving context %s: %s", context.name, e)
 
     def create_context(self, name: str, service: str, model: str, system_prompt: str, settings: Any = None) -> Dict[str, Any]:
         try:
-            if name in self.contexts:
+            if self.get_context(name):
                 return {"success": False, "message": f"Context '{name}' already exists."}
 
             if settings is None:
@@ -88,60 +108,219 @@ class ConversationManager:
 
     def list_contexts(self) -> Dict[str, Any]:
         try:
+            if self.replicated:
+                for name in self.storage_backend.list_names():
+                    self.get_context(name)
             return {
                 "success": True,
-                "contexts": [
-                    {
-                        "name": ctx.name,
-                        "service": ctx.service,
-                        "model": ctx.model,
-                        "system_prompt": ctx.system_prompt[:50] + '...' if len(ctx.system_prompt) > 50 else ctx.system_prompt
-                    } for ctx in self.contexts.values()
-                ]
+                "contexts": [self._summary(ctx) for ctx in self.contexts.values()] + list(self.hibernated.values())
             }
         except Exception as e:
             return ErrorHandler.handle_error(e, "Error listing contexts")
 
-    def delete_context(self, name: str) -> Dict[str, Any]:
+    @staticmethod
+    def _summary(ctx: ConversationContext) -> Dict[str, Any]:
+        return {
+            "name": ctx.name,
+            "service": ctx.service,
+            "model": ctx.model,
+            "system_prompt": ctx.system_prompt[:50] + '...' if len(ctx.system_prompt) > 50 else ctx.system_prompt
+        }
+
+    def delete_context(self, name: str, notify: bool = True) -> Dict[str, Any]:
+        """Delete a context; the delete listeners are called unless ``notify`` is False."""
         try:
-            if name in self.contexts:
-                del self.contexts[name]
+            if self.get_context(name):
+                self.contexts.pop(name, None)
                 if self.storage_backend:
                     self.storage_backend.delete(name)
+                if notify:
+                    self._notify_deleted(name)
                 return {"success": True, "message": f"Context '{name}' deleted."}
             return {"success": False, "message": f"Context '{name}' does not exist."}
         except Exception as e:
             return ErrorHandler.handle_error(e, f"Error deleting context '{name}'")
 
+    async def remove_context(self, name: str) -> Dict[str, Any]:
+        """
+        ``delete_context`` for async code: shared storage is written on a worker thread, and the delete
+        listeners are then called back on the event loop.
+        """
+        if not self.replicated:
+            return self.delete_context(name)
+        result = await asyncio.to_thread(self.delete_context, name, False)
+        if result.get("success"):
+            self._notify_deleted(name)
+        return result
+
+    def _notify_deleted(self, name: str) -> None:
+        for listener in list(self.delete_listeners):
+            listener(name)
+
+    def add_delete_listener(self, listener: Callable[[str], None]) -> None:
+        self.delete_listeners.append(listener)
+
     def get_context(self, name: str) -> Optional[ConversationContext]:
-        return self.contexts.get(name)
+        context = self.contexts.get(name)
+        if self.replicated:
+            metrics.increment('context_cache_total', result='miss' if context is None else 'hit')
+        if context is None and self.replicated:
+            data = self.storage_backend.load(name)
+            if data:
+                context = self.contexts[name] = ConversationContext.from_dict(data)
+        elif context is None and self.hibernated.pop(name, None) is not None:
+            data = self.storage_backend.load(name)
+            if data:
+                context = self.contexts[name] = ConversationContext.from_dict(data)
+                logger.debug("Rehydrated context: %s", name)
+        return context
+
+    def hibernate_context(self, name: str) -> bool:
+        """
+        Save a context and drop it from memory; ``get_context`` loads it back when it is next used.
+        Returns False, keeping the context, when it is not in memory or cannot be saved.
+        """
+        context = self.contexts.get(name)
+        if context is None or not self.storage_backend:
+            return False
+        if not self.replicated:
+            try:
+                self.storage_backend.save(name, context.to_dict())
+            except Exception as e:
+                logger.error("Error hibernating context %s: %s", name, e)
+                return False
+            self.hibernated[name] = self._summary(context)
+        # With replicated storage every turn is already saved and the cached copy can simply go
+        del self.contexts[name]
+        return True
+
+    def refresh_context(self, name: str) -> Optional[ConversationContext]:
+        """Like ``get_context``, but re-read from shared storage: the cached copy may miss another replica's turn."""
+        if self.replicated:
+            self.contexts.pop(name, None)
+        return self.get_context(name)
+
+    async def load_context(self, name: str, refresh: bool = False) -> Optional[ConversationContext]:
+        """``get_context`` (``refresh_context`` with ``refresh``) for async code: shared storage is read on a worker thread."""
+        if self.replicated and (refresh or name not in self.contexts):
+            return await asyncio.to_thread(self.refresh_context if refresh else self.get_context, name)
+        return self.get_context(name)
+
+    async def store_context(self, context: ConversationContext) -> None:
+        """``save_context`` for async code: shared storage is written on a worker thread."""
+        if self.replicated:
+            await asyncio.to_thread(self.save_context, context)
+        else:
+            self.save_context(context)
+
+    def invalidate(self, kind: str, name: str) -> None:
+        if kind == 'context':
+            self.contexts.pop(name, None)
+
+    def context_lock(self, name: str):
+        """Async context manager serialising turns on one context, across replicas when replicated."""
+        if self.replicated:
+            return self.storage_backend.lock(name)
+        lock = self.turn_locks.get(name)
+        if lock is None:
+            lock = self.turn_locks[name] = asyncio.Lock()
+        return lock
+
+    def get_context_snapshot(self, name: str) -> Optional[ConversationContext]:
+        """Read-only view of a context, loaded from storage when another worker owns it."""
+        context = self.contexts.get(name)
+        if context is None and self.storage_backend:
+            data = self.storage_backend.load(name)
+            if data:
+                context = ConversationContext.from_dict(data)
+        return context
+
+    def release_context(self, name: str) -> Optional[Dict[str, Any]]:
+        """Drop a context from memory (it stays in storage) and return it for the next owner."""
+        context = self.contexts.pop(name, None)
+        # A hibernated context is already in storage, where the next owner loads it from
+        self.hibernated.pop(name, None)
+        return context.to_dict() if context else None
+
+    def adopt_context(self, name: str, data: Optional[Dict[str, Any]] = None) -> bool:
+        """Take ownership of a context handed over by another worker, or load it from storage."""
+        if data is None and self.storage_backend:
+            data = self.storage_backend.load(name)
+        if not data:
+            return False
+        self.contexts[name] = ConversationContext.from_dict(data)
+        return True
 
-    async def send_prompt(self, name: str, prompt: str, service_client) -> Dict[str, Any]:
+    def get_service_client(self, service_name: str):
+        client = self.service_clients.get(service_name)
+        if not client:
+            raise ValueError(f"No client available for service: {service_name}")
+        return client
+
+    async def send_prompt(self, name: str, prompt: str, service_client=None) -> Dict[str, Any]:
         try:
-            if name not in self.contexts:
-                return {"success": False, "message": f"Context '{name}' does not exist.", "response": None}
-
-            context = self.contexts[name]
-            context.add_message("user", prompt)
-            
-            response = await service_client.generate_response(context)
-
-            if response:
-                context.add_message("assistant", response)
-                self.save_context(context)
-                return {"success": True, "response": response}
-            return {"success": False, "message": "Failed to get a response.", "response": None}
+            async with self.context_lock(name):
+                context = await self.load_context(name, refresh=True)
+                if context is None:
+                    return {"success": False, "message": f"Context '{name}' does not exist.", "response": None}
+
+                if service_client is None:
+                    service_client = self.get_service_client(context.service)
+                turn_start = len(context.history)
+                context.add_message("user", prompt)
+
+                partial: List[str] = []
+                try:
+                    response = await with_deadline(self.generate(service_client, context, partial), 'provider')
+                except asyncio.CancelledError:
+                    await self.cancel_turn(context, turn_start, "".join(partial))
+                    raise
+                except DeadlineExceeded:
+                    await self.cancel_turn(context, turn_start, "".join(partial), reason='deadline')
+                    raise
+                except Exception:
+                    # The provider failed; the prompt is dropped so the turn can be retried
+                    del context.history[turn_start:]
+                    raise
+
+                if response:
+                    context.add_message("assistant", response)
+                    await self.store_context(context)
+                    return {"success": True, "response": response}
+                return {"success": False, "message": "Failed to get a response.", "response": None}
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             return ErrorHandler.handle_error(e, f"Error sending prompt for context '{name}'")
 
+    async def generate(self, service_client, context: ConversationContext, partial: List[str]) -> str:
+        """Run a generation, collecting streamed chunks in ``partial`` when incomplete turns are persisted."""
+        if not self.persist_incomplete:
+            return await timed_generate(service_client, context)
+        async for chunk in timed_stream(service_client, context):
+            partial.append(chunk)
+        return "".join(partial)
+
+    async def cancel_turn(self, context: ConversationContext, turn_start: int, partial_response: str = "",
+                          reason: str = 'disconnect') -> None:
+        """Roll back or mark incomplete a turn whose generation was cancelled before it finished."""
+        metrics.increment('generations_cancelled_total', service=context.service, reason=reason)
+        if self.persist_incomplete:
+            context.history.append({"role": "assistant", "content": partial_response, "incomplete": True})
+            await self.store_context(context)
+            logger.info("Saved incomplete turn for cancelled generation in context: %s", context.name)
+        else:
+            del context.history[turn_start:]
+            logger.info("Discarded cancelled turn in context: %s", context.name)
+
     def copy_context(self, source_name: str, new_name: str, num_messages: Optional[int] = None) -> Dict[str, Any]:
         try:
-            if source_name not in self.contexts:
+            source_context = self.get_context(source_name)
+            if source_context is None:
                 return {"success": False, "message": f"Source context '{source_name}' does not exist."}
-            if new_name in self.contexts:
+            if self.get_context(new_name):
                 return {"success": False, "message": f"Context '{new_name}' already exists."}
 
-            source_context = self.contexts[source_name]
             new_context = ConversationContext(
                 name=new_name,
                 service=source_context.service,
@@ -1,72 +1,250 @@
 # game/engine.py
 
+import asyncio
 import json
-from .state import GameState
+import time
+from .projection import GamePromptView, HistoryProjection
+from .state import GameState, diff_state
 from utils.logger import get_logger
+from utils.metrics import metrics
 from utils.error_handler import ErrorHandler
-from typing import Dict, Any, List  # Add List to this import
+from utils.deadline import DeadlineExceeded, with_deadline, iterate_with_deadline
+from utils.instrumentation import timed_stream
+from utils.tracing import tracer
+from typing import Dict, Any, List, AsyncIterator, Callable, Optional
 
 logger = get_logger(__name__)
 
 class GameEngine:
-    def __init__(self, conversation_manager):
+    """
+    Runs the adventure game on top of a conversation context.
+
+    With a local storage backend, games survive restarts: each is stored as a checkpoint plus one
+    delta per turn, and a new checkpoint is written every ``checkpoint_interval`` turns so that
+    restoring one replays a bounded number of deltas. Stored games are loaded on their next use.
+    Games keep every turn, or only about the last ``max_turns`` when it is set (see ``GameState``).
+
+    A sweeper hibernates games unused for ``idle_timeout`` seconds, and the least recently used
+    beyond ``max_resident``: the game and its context are saved and dropped from memory, and loaded
+    back on their next turn. Games in the middle of a turn are left alone.
+
+    The history sent with each turn is slimmed by ``projection`` (see ``HistoryProjection``); the
+    stored history keeps every reply in full.
+
+    :param config: ``persist`` (default True), ``checkpoint_interval`` (default 20), ``max_turns``,
+        ``idle_timeout`` (default 1800), ``max_resident`` (default 1000) and ``sweep_interval``
+        (default 60), of which 0 disables the last four, and ``projection``
+    """
+
+    def __init__(self, conversation_manager, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
         self.conversation_manager = conversation_manager
         self.states: Dict[str, GameState] = {}
+        self.listeners: List[Callable[[str, Dict[str, Any], Any], None]] = []
+        # With replicated storage, ``states`` is a cache of the games kept in the shared backend
+        self.replicated = getattr(conversation_manager, 'replicated', False) is True
+        if self.replicated:
+            conversation_manager.storage_backend.subscribe(self.invalidate)
+        storage = getattr(conversation_manager, 'storage_backend', None)
+        self.persistent = (not self.replicated and config.get('persist', True)
+                           and hasattr(storage, 'append_game_delta'))
+        self.checkpoint_interval = max(1, config.get('checkpoint_interval', 20))
+        self.max_turns = config.get('max_turns', 0) or None
+        # Deltas stored since each game's last checkpoint; a game missing here is checkpointed next
+        self.pending_deltas: Dict[str, int] = {}
+        self.idle_timeout = config.get('idle_timeout', 1800)
+        self.max_resident = config.get('max_resident', 1000)
+        self.sweep_interval = config.get('sweep_interval', 60)
+        # time.monotonic() of each resident game's last use
+        self.last_used: Dict[str, float] = {}
+        # Games in storage but not in memory; after a restart, every stored game
+        self.hibernated = set(storage.list_games()) if self.persistent else set()
+        self.counts = {"hibernated": 0, "rehydrated": 0}
+        self.sweeper: Optional[asyncio.Task] = None
+        self.projection = HistoryProjection(config.get('projection'))
+        if hasattr(conversation_manager, 'add_delete_listener'):
+            conversation_manager.add_delete_listener(self.discard_game)
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any], Any], None]) -> None:
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, Dict[str, Any], Any], None]) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _emit(self, context_name: str, event: Dict[str, Any], source: Any = None) -> None:
+        for listener in list(self.listeners):
+            try:
+                listener(context_name, event, source)
+            except Exception as e:
+                logger.error("Game event listener failed for context %s: %s", context_name, e)
 
     async def start_game(self, context_name: str) -> Dict[str, Any]:
         try:
-            context = self.conversation_manager.get_context(context_name)
-            if not context:
-                raise ValueError(f"Context '{context_name}' does not exist.")
-
-            initial_prompt = (
-                "Start a new isekai anime-themed adventure game. "
-                "Describe the opening scene where the player is transported to a fantasy world. "
-                "Provide a vivid description, suggest initial actions, and set the stage for the adventure."
-            )
-
-            response = await self._generate_response(context, initial_prompt)
-            game_state = GameState(context_name, response)
-            self.states[context_name] = game_state
-            logger.info(f"Started new game for context: {context_name}")
+            async with self.conversation_manager.context_lock(context_name):
+                context = await self.conversation_manager.load_context(context_name, refresh=True)
+                if not context:
+                    raise ValueError(f"Context '{context_name}' does not exist.")
+
+                response = await self._generate_response(context, self._start_prompt())
+                game_state = GameState(context_name, response, max_turns=self.max_turns)
+                self.states[context_name] = game_state
+                self.last_used[context_name] = time.monotonic()
+                self.pending_deltas.pop(context_name, None)
+                await self._save_state(context_name)
+            logger.info("Started new game for context: %s", context_name)
+            self._emit(context_name, {"type": "game_started", "state": game_state.get_current_state()})
             return game_state.get_current_state()
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             error_info = ErrorHandler.handle_error(e, f"Error starting game for context '{context_name}'")
-            logger.error(f"Game start error: {error_info}")
+            logger.error("Game start error: %s", error_info)
             return {"error": str(e)}
 
     async def process_turn(self, context_name: str, action: str) -> Dict[str, Any]:
         try:
-            if context_name not in self.states:
-                raise ValueError(f"No active game for context: {context_name}")
-            
-            game_state = self.states[context_name]
-            context = self.conversation_manager.get_context(context_name)
-            
-            prompt = (
-                f"The player takes the following action: {action}\n\n"
-                "Continue the story based on this action. Describe the outcome, "
-                "the new situation, and provide new action options for the player. "
-                "Remember to maintain consistency with the previous state and the game world."
-            )
-            
-            response = await self._generate_response(context, prompt)
-            game_state.update(response)
-            logger.info(f"Processed turn for game in context: {context_name}")
+            async with self.conversation_manager.context_lock(context_name):
+                game_state = await self.load_game(context_name, refresh=True)
+                if game_state is None:
+                    raise ValueError(f"No active game for context: {context_name}")
+
+                context = await self.conversation_manager.load_context(context_name, refresh=True)
+                response = await self._generate_response(context, self._turn_prompt(action))
+                previous = game_state.get_current_state()
+                game_state.update(response)
+                await self._save_state(context_name, previous)
+            logger.info("Processed turn for game in context: %s", context_name)
+            self._emit(context_name, {"type": "turn_processed", "state": game_state.get_current_state()})
             return game_state.get_current_state()
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             error_info = ErrorHandler.handle_error(e, f"Error processing turn for context '{context_name}'")
-            logger.error(f"Game turn error: {error_info}")
+            logger.error("Game turn error: %s", error_info)
             return {"error": str(e)}
 
+    async def stream_game(self, context_name: str, action: Optional[str] = None, source: Any = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Start a game (no action) or take a turn, streaming narration deltas before the parsed state.
+
+        Yields ``{"type": "delta", "text": ...}`` events while the model generates, then a single
+        ``{"type": "state", "state": ...}`` or ``{"type": "error", "error": ...}`` event.
+        """
+        try:
+            async with self.conversation_manager.context_lock(context_name):
+                context = await self.conversation_manager.load_context(context_name, refresh=True)
+                if not context:
+                    raise ValueError(f"Context '{context_name}' does not exist.")
+                if action is not None and await self.load_game(context_name, refresh=True) is None:
+                    raise ValueError(f"No active game for context: {context_name}")
+
+                prompt = self._start_prompt() if action is None else self._turn_prompt(action)
+                service_client = self.conversation_manager.get_service_client(context.service)
+                turn_start = len(context.history)
+                context.add_message("user", prompt)
+
+                chunks = []
+                try:
+                    async for chunk in iterate_with_deadline(timed_stream(service_client, self._prompt_view(context)), 'provider'):
+                        chunks.append(chunk)
+                        yield {"type": "delta", "text": chunk}
+                except (asyncio.CancelledError, GeneratorExit):
+                    await self.conversation_manager.cancel_turn(context, turn_start, "".join(chunks))
+                    raise
+                except DeadlineExceeded:
+                    await self.conversation_manager.cancel_turn(context, turn_start, "".join(chunks), reason='deadline')
+                    raise
+                except Exception:
+                    # The provider failed; nothing of the turn is kept
+                    del context.history[turn_start:]
+                    raise
+                response = "".join(chunks)
+                context.add_message("assistant", response)
+                await self.conversation_manager.store_context(context)
+
+                new_state = self._parse_response(response)
+                previous = None
+                if action is None:
+                    self.states[context_name] = GameState(context_name, new_state, max_turns=self.max_turns)
+                    self.last_used[context_name] = time.monotonic()
+                    self.pending_deltas.pop(context_name, None)
+                    event_type = "game_started"
+                else:
+                    previous = self.states[context_name].get_current_state()
+                    self.states[context_name].update(new_state)
+                    event_type = "turn_processed"
+                await self._save_state(context_name, previous)
+            logger.info("Streamed %s for game in context: %s", event_type, context_name)
+            self._emit(context_name, {"type": event_type, "state": new_state}, source)
+            yield {"type": "state", "state": new_state}
+        except DeadlineExceeded as e:
+            yield {"type": "error", "error": str(e), "stage": e.stage}
+        except Exception as e:
+            ErrorHandler.handle_error(e, f"Error streaming game for context '{context_name}'")
+            yield {"type": "error", "error": str(e)}
+
+    def _start_prompt(self) -> str:
+        return (
+            "Start a new isekai anime-themed adventure game. "
+            "Describe the opening scene where the player is transported to a fantasy world. "
+            "Provide a vivid description, suggest initial actions, and set the stage for the adventure."
+        )
+
+    def _turn_prompt(self, action: str) -> str:
+        return (
+            f"The player takes the following action: {action}\n\n"
+            "Continue the story based on this action. Describe the outcome, "
+            "the new situation, and provide new action options for the player. "
+            "Remember to maintain consistency with the previous state and the game world."
+        )
+
+    def _action_of(self, prompt: str) -> Optional[str]:
+        """The player's action in a prompt made by ``_start_prompt`` or ``_turn_prompt``; None for other messages."""
+        if prompt == self._start_prompt():
+            return "start the adventure"
+        prefix, suffix = self._turn_prompt('\0').split('\0')
+        if prompt.startswith(prefix) and prompt.endswith(suffix) and len(prompt) >= len(prefix) + len(suffix):
+            return prompt[len(prefix):len(prompt) - len(suffix)]
+        return None
+
+    def _prompt_view(self, context) -> GamePromptView:
+        return GamePromptView(context.name, context.service, context.model, context.settings,
+                              self.projection.project(context.history, self._action_of))
+
     async def _generate_response(self, context, prompt: str) -> Dict[str, Any]:
         try:
             service_client = self.conversation_manager.get_service_client(context.service)
-            response = await service_client.generate_response(context)
-            
+            turn_start = len(context.history)
+            context.add_message("user", prompt)
+            partial: List[str] = []
+            try:
+                response = await with_deadline(
+                    self.conversation_manager.generate(service_client, self._prompt_view(context), partial), 'provider'
+                )
+            except asyncio.CancelledError:
+                await self.conversation_manager.cancel_turn(context, turn_start, "".join(partial))
+                raise
+            except DeadlineExceeded:
+                await self.conversation_manager.cancel_turn(context, turn_start, "".join(partial), reason='deadline')
+                raise
+            except Exception:
+                del context.history[turn_start:]
+                raise
+            context.add_message("assistant", response)
+            await self.conversation_manager.store_context(context)
+            return self._parse_response(response)
+        except Exception as e:
+            logger.error("Error generating response: %s", e)
+            raise
+
+    def _parse_response(self, response: str) -> Dict[str, Any]:
+        with tracer.span('game.parse', chars=len(response)) as span:
             try:
                 return json.loads(response)
             except json.JSONDecodeError:
+                if span:
+                    span.set_attribute('repaired', True)
                 # If the response isn't valid JSON, try to extract JSON from it
                 start = response.find('{')
                 end = response.rfind('}') + 1
@@ -77,23 +255,195 @@ class GameEngine:
                         raise ValueError("Could not parse response as JSON")
                 else:
                     raise ValueError("No JSON object found in response")
-        except Exception as e:
-            logger.error(f"Error generating response: {str(e)}")
-            raise
 
-    def end_game(self, context_name: str) -> None:
-        if context_name in self.states:
-            del self.states[context_name]
-            logger.info(f"Ended game for context: {context_name}")
+    async def end_game(self, context_name: str) -> None:
+        if await self.load_game(context_name) is not None:
+            self._forget(context_name)
+            if self.replicated or self.persistent:
+                await self._call_storage(self.conversation_manager.storage_backend.delete_game, context_name)
+            logger.info("Ended game for context: %s", context_name)
+            self._emit(context_name, {"type": "game_ended"})
         else:
-            logger.warning(f"Attempted to end non-existent game for context: {context_name}")
+            logger.warning("Attempted to end non-existent game for context: %s", context_name)
 
-    def get_game_state(self, context_name: str) -> Dict[str, Any]:
-        if context_name in self.states:
-            return self.states[context_name].get_current_state()
+    def discard_game(self, context_name: str) -> None:
+        """
+        End the game of a deleted context, resident, hibernated or only stored, without loading it.
+        Shared storage already dropped the game with its context (see ``RedisStorage.delete``).
+        """
+        had_game = context_name in self.states or context_name in self.hibernated
+        self._forget(context_name)
+        if self.persistent:
+            try:
+                self.conversation_manager.storage_backend.delete_game(context_name)
+            except Exception as e:
+                logger.error("Error deleting game for context %s: %s", context_name, e)
+        if had_game:
+            logger.info("Ended game for deleted context: %s", context_name)
+            self._emit(context_name, {"type": "game_ended"})
+
+    async def get_game_state(self, context_name: str) -> Dict[str, Any]:
+        game_state = await self.load_game(context_name)
+        if game_state is not None:
+            return game_state.get_current_state()
         else:
-            logger.warning(f"Attempted to get state for non-existent game in context: {context_name}")
+            logger.warning("Attempted to get state for non-existent game in context: %s", context_name)
             return {"error": "No active game for this context"}
 
     def list_active_games(self) -> List[str]:
-        return list(self.states.keys())
\ No newline at end of file
+        if self.persistent:
+            return sorted(set(self.states) | set(self.conversation_manager.storage_backend.list_games()))
+        return list(self.states.keys())
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Turns and approximate bytes held by each game in memory."""
+        games = {name: game_state.memory_usage() for name, game_state in list(self.states.items())}
+        return {"games": games, "bytes": sum(usage["bytes"] for usage in games.values()), **self.session_counts()}
+
+    def session_counts(self) -> Dict[str, int]:
+        return {"resident": len(self.states), "hibernated": len(self.hibernated),
+                "hibernated_total": self.counts["hibernated"], "rehydrated_total": self.counts["rehydrated"]}
+
+    async def has_game(self, context_name: str) -> bool:
+        return await self.load_game(context_name) is not None
+
+    def export_state(self, context_name: str) -> Optional[Dict[str, Any]]:
+        """Remove a game from this engine and return it, so another worker can continue it."""
+        game_state = self.states.get(context_name)
+        self._forget(context_name)
+        return game_state.to_dict() if game_state else None
+
+    def import_state(self, context_name: str, data: Dict[str, Any]) -> None:
+        self.states[context_name] = GameState.from_dict(context_name, data, self.max_turns)
+        self.pending_deltas.pop(context_name, None)
+        self.last_used[context_name] = time.monotonic()
+        self.hibernated.discard(context_name)
+
+    async def load_game(self, context_name: str, refresh: bool = False) -> Optional[GameState]:
+        """
+        The game for a context, loaded from shared storage when it is not cached (or ``refresh`` is set),
+        or from local storage when it was saved before a restart.
+        """
+        if self.replicated and (refresh or context_name not in self.states):
+            data = await self._call_storage(self.conversation_manager.storage_backend.load_game, context_name)
+            if data:
+                self.states[context_name] = GameState.from_dict(context_name, data, self.max_turns)
+            else:
+                self.states.pop(context_name, None)
+        elif self.persistent and context_name not in self.states:
+            data = self.conversation_manager.storage_backend.load_game(context_name)
+            if data:
+                self.states[context_name] = GameState.from_dict(context_name, data, self.max_turns)
+                self.pending_deltas[context_name] = len(data.get('deltas', ()))
+                logger.info("Restored game for context %s from storage", context_name)
+        game_state = self.states.get(context_name)
+        if game_state is not None:
+            self.last_used[context_name] = time.monotonic()
+            if context_name in self.hibernated:
+                self.hibernated.discard(context_name)
+                self.counts["rehydrated"] += 1
+                metrics.increment('games_rehydrated_total')
+        return game_state
+
+    async def _call_storage(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Call a storage method; shared storage is called on a worker thread, keeping the event loop free."""
+        if self.replicated:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def _forget(self, context_name: str) -> None:
+        self.states.pop(context_name, None)
+        self.pending_deltas.pop(context_name, None)
+        self.last_used.pop(context_name, None)
+        self.hibernated.discard(context_name)
+
+    def hibernate(self, context_name: str) -> bool:
+        """
+        Save a game and its context and drop both from memory. Returns False, leaving the game
+        resident, when it is in the middle of a turn or there is no storage to keep it in.
+        """
+        game_state = self.states.get(context_name)
+        if game_state is None or not (self.replicated or self.persistent):
+            return False
+        if not self.replicated and self.conversation_manager.context_lock(context_name).locked():
+            return False
+        if self.persistent and self.pending_deltas.get(context_name) != 0:
+            # A checkpoint makes the game quicker to load back
+            try:
+                self.conversation_manager.storage_backend.save_game(context_name, game_state.to_dict())
+                self.pending_deltas[context_name] = 0
+            except Exception as e:
+                logger.error("Error hibernating game for context %s: %s", context_name, e)
+                return False
+        self.conversation_manager.hibernate_context(context_name)
+        self._forget(context_name)
+        self.hibernated.add(context_name)
+        self.counts["hibernated"] += 1
+        metrics.increment('games_hibernated_total')
+        logger.debug("Hibernated game for context: %s", context_name)
+        return True
+
+    async def sweep(self, now: Optional[float] = None) -> List[str]:
+        """Hibernate games idle for ``idle_timeout``, then the least recently used beyond ``max_resident``."""
+        now = time.monotonic() if now is None else now
+        oldest_first = sorted(self.states, key=lambda name: self.last_used.get(name, now))
+        excess = len(oldest_first) - self.max_resident if self.max_resident else 0
+        hibernated = []
+        for index, name in enumerate(oldest_first):
+            idle = self.idle_timeout and now - self.last_used.get(name, now) >= self.idle_timeout
+            if not idle and index >= excess:
+                break
+            if name in self.states and self.hibernate(name):
+                hibernated.append(name)
+                # TinyDB writes block; let requests through between games
+                await asyncio.sleep(0)
+        if hibernated:
+            logger.info("Hibernated %s idle games; %s resident", len(hibernated), len(self.states))
+        return hibernated
+
+    def start_sweeper(self) -> None:
+        if self.sweeper is not None or not self.sweep_interval or not (self.replicated or self.persistent):
+            return
+        self.sweeper = asyncio.create_task(self._sweep_periodically())
+
+    async def stop_sweeper(self) -> None:
+        if self.sweeper is not None:
+            self.sweeper.cancel()
+            await asyncio.gather(self.sweeper, return_exceptions=True)
+            self.sweeper = None
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("Error sweeping idle games: %s", e)
+
+    async def _save_state(self, context_name: str, previous: Any = None) -> None:
+        """Store a game after a turn; ``previous`` is its state before the turn, None for a new game."""
+        game_state = self.states[context_name]
+        if self.replicated:
+            await self._call_storage(self.conversation_manager.storage_backend.save_game, context_name, game_state.to_dict())
+        elif self.persistent:
+            try:
+                self._persist(context_name, game_state, previous)
+            except Exception as e:
+                # The game goes on in memory; the next save writes a full checkpoint
+                self.pending_deltas.pop(context_name, None)
+                logger.error("Error saving game for context %s: %s", context_name, e)
+
+    def _persist(self, context_name: str, game_state: GameState, previous: Any) -> None:
+        storage = self.conversation_manager.storage_backend
+        pending = self.pending_deltas.get(context_name)
+        if previous is None or pending is None or pending + 1 >= self.checkpoint_interval:
+            storage.save_game(context_name, game_state.to_dict())
+            self.pending_deltas[context_name] = 0
+        else:
+            storage.append_game_delta(context_name, diff_state(previous, game_state.get_current_state()))
+            self.pending_deltas[context_name] = pending + 1
+
+    def invalidate(self, kind: str, name: str) -> None:
+        if kind == 'game':
+            self.states.pop(name, None)
+            self.last_used.pop(name, None)
\ No newline at end of file
@@ -0,0 +1,103 @@
+# game/projection.py
+
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+@dataclass
+class GamePromptView:
+    """
+    A read-only view of a game context for one generation.
+
+    ``prepared_messages`` is handed to the service client as-is (see
+    ``ServiceClient.prepare_messages``); the context and its stored history are not changed.
+    """
+    name: str
+    service: str
+    model: str
+    settings: Any
+    prepared_messages: List[Dict[str, str]]
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        return self.prepared_messages
+
+def parse_state(text: str) -> Optional[Dict[str, Any]]:
+    """The JSON object in a game reply, also when surrounded by prose; None if there is none."""
+    start, end = text.find('{'), text.rfind('}') + 1
+    if start == -1 or end <= start:
+        return None
+    try:
+        state = json.loads(text[start:end])
+    except json.JSONDecodeError:
+        return None
+    return state if isinstance(state, dict) else None
+
+class HistoryProjection:
+    """
+    Slims a game context's history before it is sent to the provider.
+
+    The last ``verbatim_turns`` game turns are sent as they are. Older turns become the player's
+    action and a compact state: the narration cut to ``narration_chars`` and the state without
+    ``drop_keys`` (image prompts and captions, the actions offered). Only the last
+    ``summarized_turns`` of those are sent, so the prompt stops growing once a session is that
+    long; the latest verbatim turn carries the whole current state. System prompts and messages
+    that are not game turns are sent as they are.
+
+    :param config: the ``game_prompt`` section: ``enabled``, ``verbatim_turns``, ``summarized_turns``,
+        ``narration_chars``, ``narration_keys`` and ``drop_keys``
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.configure(config)
+
+    def configure(self, config: Optional[Dict[str, Any]]) -> None:
+        config = config or {}
+        self.enabled = config.get('enabled', True)
+        self.verbatim_turns = max(0, config.get('verbatim_turns', 2))
+        self.summarized_turns = max(0, config.get('summarized_turns', 20))
+        self.narration_chars = config.get('narration_chars', 400)
+        self.narration_keys = tuple(config.get('narration_keys') or ('narration', 'description'))
+        self.drop_keys = frozenset(config.get('drop_keys', ('image', 'actions', 'options')) or ())
+
+    def project(self, history: List[Dict[str, Any]], action_of: Callable[[str], Optional[str]]) -> List[Dict[str, str]]:
+        """
+        The messages to send for ``history``. ``action_of`` returns the player's action for a
+        game prompt, and None for any other user message.
+        """
+        messages = [{"role": message["role"], "content": message["content"]} for message in history]
+        if not self.enabled:
+            return messages
+
+        # (index of the prompt, its action) for each game turn that has been answered
+        turns: List[Tuple[int, str]] = []
+        for index in range(len(messages) - 1):
+            if messages[index]["role"] == 'user' and messages[index + 1]["role"] == 'assistant':
+                action = action_of(messages[index]["content"])
+                if action is not None:
+                    turns.append((index, action))
+        older = turns[:max(0, len(turns) - self.verbatim_turns)]
+        if not older:
+            return messages
+
+        cut = max(0, len(older) - self.summarized_turns)
+        dropped = set()
+        for index, _ in older[:cut]:
+            dropped.update((index, index + 1))
+        for index, action in older[cut:]:
+            messages[index] = {"role": "user", "content": f"Player action: {action}"}
+            messages[index + 1] = {"role": "assistant", "content": self.summarize(messages[index + 1]["content"])}
+        return [message for index, message in enumerate(messages) if index not in dropped]
+
+    def summarize(self, reply: str) -> str:
+        state = parse_state(reply)
+        if state is None:
+            return self.shorten(reply)
+        summary = {key: self.shorten(value) if key in self.narration_keys and isinstance(value, str) else value
+                   for key, value in state.items() if key not in self.drop_keys}
+        return json.dumps(summary, ensure_ascii=False)
+
+    def shorten(self, text: str) -> str:
+        if not self.narration_chars or len(text) <= self.narration_chars:
+            return text
+        return text[:self.narration_chars].rsplit(' ', 1)[0] + '...'
\ No newline at end of file
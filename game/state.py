@@ -1,22 +1,240 @@
+import itertools
+import sys
+from collections import deque
+from collections.abc import Sequence
+
+# Strings up to this length are interned, so locations, options and item names repeated across turns are stored once
+INTERN_MAX_CHARS = 256
+# A full snapshot is kept every SNAPSHOT_INTERVAL turns, for the last MAX_SNAPSHOTS of them
+SNAPSHOT_INTERVAL = 16
+MAX_SNAPSHOTS = 8
+
+def intern_strings(value):
+    if isinstance(value, str):
+        return sys.intern(value) if len(value) <= INTERN_MAX_CHARS else value
+    if isinstance(value, dict):
+        return {sys.intern(key) if isinstance(key, str) else key: intern_strings(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [intern_strings(item) for item in value]
+    return value
+
+def diff_state(old, new):
+    """
+    The structural change from one game state to the next.
+
+    Between dicts it holds ``set`` (added or replaced keys), ``unset`` (removed keys) and ``nested``
+    (a delta per changed dict or list value); a list that only grew gives ``extend``; anything else
+    ``replace``.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changed, nested = {}, {}
+        for key, value in new.items():
+            if key not in old:
+                changed[key] = value
+            elif old[key] is not value and old[key] != value:
+                inner = diff_state(old[key], value)
+                if "replace" in inner:
+                    changed[key] = value
+                else:
+                    nested[key] = inner
+        removed = [key for key in old if key not in new]
+        delta = {}
+        if changed:
+            delta["set"] = changed
+        if removed:
+            delta["unset"] = removed
+        if nested:
+            delta["nested"] = nested
+        return delta
+    if isinstance(old, list) and isinstance(new, list) and len(new) >= len(old) and new[:len(old)] == old:
+        return {"extend": new[len(old):]}
+    return {"replace": new}
+
+def apply_delta(state, delta):
+    """The state after ``delta``; values it does not change are shared with ``state``, not copied."""
+    if "replace" in delta:
+        return delta["replace"]
+    if "extend" in delta:
+        return state + delta["extend"]
+    unset = delta.get("unset", ())
+    new_state = {key: value for key, value in state.items() if key not in unset}
+    for key, inner in delta.get("nested", {}).items():
+        new_state[key] = apply_delta(state[key], inner)
+    new_state.update(delta.get("set", {}))
+    return new_state
+
+def _deep_size(value):
+    """Bytes held by ``value`` and everything it references, each object counted once."""
+    seen, total, stack = set(), 0, [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, deque)):
+            stack.extend(item)
+    return total
+
+class GameHistory(Sequence):
+    """A read-only view of a game's states from ``first_turn``; each is rebuilt when it is read."""
+
+    def __init__(self, game_state):
+        self.game_state = game_state
+
+    def __len__(self):
+        return self.game_state.position - self.game_state.first_turn + 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("game history index out of range")
+        return self.game_state.state_at(self.game_state.first_turn + index)
+
+    def __iter__(self):
+        game_state = self.game_state
+        state = game_state.initial_state
+        yield state
+        for delta in itertools.islice(game_state.deltas, 0, game_state.position - game_state.first_turn):
+            state = apply_delta(state, delta)
+            yield state
+
 class GameState:
-    def __init__(self, context_name, initial_state):
+    """
+    The states of a game, one per turn, stored compactly.
+
+    Only the current state is held in full. Earlier ones are rebuilt from the structural deltas
+    between turns (see ``diff_state``), starting at the initial state or at the nearest of a ring
+    of full snapshots; states share the values a turn did not change, and short strings are
+    interned. ``rollback`` only moves the position back; the next ``update`` drops the turns after it.
+
+    Every turn is kept unless ``max_turns`` is set: then the oldest turns are dropped a snapshot
+    interval at a time, keeping between ``max_turns`` and ``max_turns + snapshot_interval`` of them,
+    and the state of ``first_turn`` becomes the initial state.
+    """
+
+    def __init__(self, context_name, initial_state, snapshot_interval=SNAPSHOT_INTERVAL, max_snapshots=MAX_SNAPSHOTS,
+                 first_turn=0, max_turns=None):
         self.context_name = context_name
-        self.current_state = initial_state
-        self.history = [initial_state]
+        self.snapshot_interval = snapshot_interval
+        self.max_turns = max_turns
+        self.initial_state = intern_strings(initial_state)
+        self.first_turn = first_turn
+        # deltas[i] turns the state of turn first_turn + i into that of the next turn
+        self.deltas = []
+        # (turn, state) pairs
+        self.snapshots = deque(maxlen=max_snapshots)
+        self.position = first_turn
+        self._current = self.initial_state
+
+    def __len__(self):
+        return self.position + 1
+
+    @property
+    def current_state(self):
+        if self._current is None:
+            self._current = self.state_at(self.position)
+        return self._current
+
+    @property
+    def history(self):
+        return GameHistory(self)
 
     def update(self, new_state):
-        self.current_state = new_state
-        self.history.append(new_state)
+        self._append(diff_state(self.current_state, intern_strings(new_state)))
+
+    def _append(self, delta):
+        previous = self.current_state
+        if len(self.deltas) > self.position - self.first_turn:
+            # Turns rolled back are replaced by this one
+            del self.deltas[self.position - self.first_turn:]
+            self._keep_snapshots(lambda turn: turn <= self.position)
+        self.deltas.append(delta)
+        self.position += 1
+        self._current = apply_delta(previous, delta)
+        if self.position % self.snapshot_interval == 0:
+            self.snapshots.append((self.position, self._current))
+        if self.max_turns and self.position - self.first_turn > self.max_turns:
+            self._trim()
+
+    def _trim(self):
+        """Drop the turns beyond ``max_turns``, up to a snapshot turn so the new initial state is usually at hand."""
+        first_turn = (self.position - self.max_turns) // self.snapshot_interval * self.snapshot_interval
+        if first_turn <= self.first_turn:
+            return
+        self.initial_state = self.state_at(first_turn)
+        del self.deltas[:first_turn - self.first_turn]
+        self.first_turn = first_turn
+        self._keep_snapshots(lambda turn: turn > first_turn)
+
+    def _keep_snapshots(self, keep):
+        kept = [snapshot for snapshot in self.snapshots if keep(snapshot[0])]
+        self.snapshots.clear()
+        self.snapshots.extend(kept)
 
     def get_current_state(self):
         return self.current_state
 
+    def state_at(self, turn):
+        if not self.first_turn <= turn <= self.position:
+            raise IndexError(f"No turn {turn} in a game at turn {self.position}")
+        if turn == self.position and self._current is not None:
+            return self._current
+        start, state = self.first_turn, self.initial_state
+        for index, snapshot in self.snapshots:
+            if start < index <= turn:
+                start, state = index, snapshot
+        for delta in itertools.islice(self.deltas, start - self.first_turn, turn - self.first_turn):
+            state = apply_delta(state, delta)
+        return state
+
     def get_history(self):
-        return self.history
+        """Every state from ``first_turn`` up to the current one, as a list; ``history`` reads them lazily."""
+        return list(self.history)
+
+    def memory_usage(self):
+        """Approximate bytes held by this game; interned strings shared with other games are included."""
+        return {
+            "turns": len(self),
+            "deltas": len(self.deltas),
+            "snapshots": len(self.snapshots),
+            "bytes": _deep_size([self.initial_state, self.deltas, self.snapshots, self._current]),
+        }
+
+    def to_dict(self):
+        """Every turn kept: ``base``, the state of turn ``first_turn``, and the ``turns`` (deltas) from it."""
+        return {"current_state": self.current_state, "first_turn": self.first_turn, "base": self.initial_state,
+                "turns": self.deltas[:self.position - self.first_turn]}
+
+    @classmethod
+    def from_dict(cls, context_name, data, max_turns=None):
+        """
+        Restore a game saved by ``to_dict`` (or, from older saves, its full ``history``); ``deltas``
+        (see ``diff_state``) are turns taken since ``current_state`` was saved.
+        """
+        if "base" in data:
+            game_state = cls(context_name, data["base"], first_turn=data.get("first_turn", 0), max_turns=max_turns)
+            for delta in data.get("turns", ()):
+                game_state._append(intern_strings(delta))
+        else:
+            history = data.get("history") or [data["current_state"]]
+            game_state = cls(context_name, history[0], max_turns=max_turns)
+            for state in history[1:]:
+                game_state.update(state)
+        for delta in data.get("deltas", ()):
+            game_state._append(intern_strings(delta))
+        return game_state
 
     def rollback(self, steps=1):
-        if len(self.history) > steps:
-            self.history = self.history[:-steps]
-            self.current_state = self.history[-1]
+        """Go back ``steps`` turns in O(1); the state is rebuilt when next read."""
+        if 0 <= steps <= self.position - self.first_turn:
+            self.position -= steps
+            self._current = None
         else:
             raise ValueError("Cannot rollback that many steps")
\ No newline at end of file
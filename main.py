@@ -1,117 +1,458 @@
 # main.py
 
+import os
+import json
+import re
+import time
 import asyncio
 import argparse
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from manager_instance import manager, send_prompt, plugin_manager
-from console.cli import start_console
-from game.engine import GameEngine
-from utils.logger import get_logger
-from config.config_loader import get_api_config, get_console_config
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+from quart import Quart, Response, g, request, jsonify, websocket
+from quart_cors import cors
+from werkzeug.exceptions import BadRequest
+from manager_instance import Services, create_services
+from api.websocket import GameSocketHub
+from api.health import Startup, register_health_routes
+from api.disconnect import cancel_on_disconnect
+from api.admission import AdmissionController, AdmissionRejected
+from api.jobs import JobManager
+from batch import BatchRunner
+from api.fan_out import FanOut, prepare_targets
+from cluster.worker import register_worker_routes
+from utils.logger import get_logger, set_request_id, reset_request_id, dropped_records, update_logging
+from utils.metrics import metrics
+from utils.tracing import tracer
+from utils.profiling import Profiler, ProfilerBusy, footprint
+from utils.async_utils import run_sync_or_async
+from utils.tokens import estimate_context_tokens
+from utils.deadline import Deadline, DeadlineExceeded, deadline_from_request, set_deadline, reset_deadline, check_deadline, with_deadline
+from config.config_loader import get_config, get_deadline_config, get_admission_config, get_jobs_config, get_batch_config, get_fan_out_config, get_cluster_config, get_tracing_config, get_profiling_config, get_startup_config
 
 logger = get_logger(__name__)
 
-# Flask server configuration
-api_config = get_api_config()
-FLASK_HOST = api_config.get('host', '127.0.0.1')
-FLASK_PORT = api_config.get('port', 5000)
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
-game_engine = GameEngine(manager)
-
-def create_route(route, methods, func, endpoint=None):
-    endpoint = endpoint or f"{func.__name__}_{route}"
-    @app.route(route, methods=methods, endpoint=endpoint)
-    async def wrapper():
-        if request.method == 'GET':
-            return jsonify(await func())
-        else:
-            data = request.json or {}
-            return jsonify(await func(**data))
-    return wrapper
-
-# Register API routes
-create_route('/create_context', ['POST'], manager.create_context)
-create_route('/list_contexts', ['GET'], manager.list_contexts)
-create_route('/delete_context', ['POST'], manager.delete_context)
-create_route('/send_prompt', ['POST'], send_prompt)
-create_route('/copy_context', ['POST'], manager.copy_context)
-
-@app.route('/list_models', methods=['GET'])
-async def list_models():
-    service = request.args.get('service', '').lower()
-    try:
-        client = manager.get_service_client(service)
-        models = await client.list_models()
-        return jsonify({"models": models})
-    except ValueError as e:
-        return jsonify({"error": str(e)}), 400
-    except Exception as e:
-        logger.error(f"Error listing models for {service}: {str(e)}")
-        return jsonify({"error": "An error occurred while listing models"}), 500
-
-@app.route('/start_game', methods=['POST'])
-async def start_game():
-    data = request.json
-    context_name = data.get('context_name')
-    if not context_name or context_name not in manager.contexts:
-        return jsonify({"error": "Invalid or missing context name"}), 400
-    
-    initial_state = await game_engine.start_game(context_name)
-    return jsonify({"initial_state": initial_state})
-
-@app.route('/game_turn', methods=['POST'])
-async def game_turn():
-    data = request.json
-    context_name = data.get('context_name')
-    user_input = data.get('user_input')
-    
-    if not context_name or context_name not in manager.contexts:
-        return jsonify({"error": "Invalid or missing context name"}), 400
-    if not user_input:
-        return jsonify({"error": "Missing user input"}), 400
-    
-    game_response = await game_engine.process_turn(context_name, user_input)
-    return jsonify({"game_response": game_response})
-
-@app.route('/execute_plugin', methods=['POST'])
-def execute_plugin():
-    data = request.json
-    plugin_name = data.get('plugin_name')
-    plugin_args = data.get('args', [])
-    plugin_kwargs = data.get('kwargs', {})
-    
-    if not plugin_name:
-        return jsonify({"error": "Missing plugin name"}), 400
-    
-    try:
-        result = plugin_manager.execute_plugin(plugin_name, *plugin_args, **plugin_kwargs)
-        return jsonify({"result": result})
-    except Exception as e:
-        return jsonify({"error": f"Failed to execute plugin {plugin_name}: {str(e)}"}), 500
-
-async def run_server():
+def create_app(services: Optional[Services] = None, profiler: Optional[Profiler] = None, worker: bool = False) -> Quart:
+    """
+    Build the Quart app around ``services`` (built from the configuration when omitted).
+
+    Nothing is contacted until the app is served: the before_serving hooks start the job workers
+    and probe the providers in the background, and ``/readyz`` reports when that has finished.
+    """
+    services = services or create_services()
+    manager = services.manager
+    plugin_manager = services.plugin_manager
+    game_engine = services.game_engine
+    send_prompt = services.send_prompt
+
+    deadline_config = get_deadline_config()
+    admission = AdmissionController(get_admission_config())
+    jobs = JobManager(get_jobs_config())
+    batch_config = get_batch_config()
+    fan_out_config = get_fan_out_config()
+
+    app = Quart(__name__)
+    app = cors(app)  # Enable CORS for all routes
+
+    game_socket_hub = GameSocketHub(game_engine, deadline_config, admission)
+    profiler = profiler or Profiler(get_profiling_config(), lambda: footprint(manager, game_engine))
+    startup = Startup(services, get_startup_config())
+    register_health_routes(app, startup)
+    if worker:
+        register_worker_routes(app, manager, game_engine, admission, get_cluster_config().get('drain_timeout', 30))
+
+    admission.register_metrics()
+    metrics.register_gauge('contexts_loaded', lambda: len(manager.contexts))
+    metrics.register_gauge('games_active', lambda: len(game_engine.states))
+    metrics.register_gauge('games_hibernated', lambda: len(game_engine.hibernated))
+    metrics.register_gauge('jobs_queued', lambda: jobs.queued())
+    metrics.register_gauge('log_records_dropped', dropped_records)
+
+    def request_route():
+        # The route pattern, not the path, so context names don't each become a series
+        return request.url_rule.rule if request.url_rule else 'unmatched'
+
+    @app.before_request
+    async def start_request():
+        g.request_started = time.perf_counter()
+        metrics.adjust_gauge('http_requests_in_flight', 1)
+        g.trace = tracer.start_trace(f"{request.method} {request_route()}", request.headers.get('traceparent'),
+                                     **{"http.method": request.method, "http.route": request_route()})
+        # A caller's X-Request-Id is reused if it is safe to write into logs; otherwise the trace id
+        request_id = request.headers.get('X-Request-Id', '')
+        if not re.fullmatch(r'[\w.:-]{1,64}', request_id):
+            span = tracer.current()
+            request_id = span.trace.id if span is not None else os.urandom(8).hex()
+        g.request_id = request_id
+        g.log_token = set_request_id(request_id)
+
+    @app.after_request
+    async def observe_request(response):
+        route = request_route()
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - g.request_started, route=route, method=request.method)
+        metrics.increment('http_requests_total', route=route, method=request.method, status=response.status_code)
+        response.headers['X-Request-Id'] = g.request_id
+        span = tracer.current()
+        if span is not None:
+            span.set_attribute('http.status_code', response.status_code)
+            response.headers['X-Trace-Id'] = span.trace.id
+        return response
+
+    @app.teardown_request
+    async def finish_request(exc):
+        metrics.adjust_gauge('http_requests_in_flight', -1)
+        tracer.end_trace(g.pop('trace', None), exc)
+        if 'log_token' in g:
+            reset_request_id(g.pop('log_token'))
+
+    def respond(payload):
+        with tracer.span('serialize'):
+            return jsonify(payload)
+
+    @app.errorhandler(DeadlineExceeded)
+    async def handle_deadline_exceeded(e):
+        return jsonify({"error": "Deadline exceeded", "stage": e.stage}), 504
+
+    @app.errorhandler(AdmissionRejected)
+    async def handle_admission_rejected(e):
+        response = jsonify({"error": "Too many requests", "scope": e.scope, "retry_after": e.retry_after})
+        return response, 429, {"Retry-After": str(e.retry_after)}
+
+    @asynccontextmanager
+    async def admit_generation(context_name, *extra, tenant=None):
+        """Admit a generation request on behalf of the calling tenant and charge the tokens it used."""
+        context = await manager.load_context(context_name) if context_name else None
+        tenant = tenant or admission.identify(request.headers)
+        cost = estimate_context_tokens(context, *extra)
+        async with admission.admit(context.service if context else None, tenant, cost) as ticket:
+            yield ticket
+            ticket.record_tokens(estimate_context_tokens(await manager.load_context(context_name)) if context else cost)
+
+    @contextmanager
+    def request_deadline(route, data=None, headers=None):
+        """Attach the caller's (or the route's default) deadline to this request and drop it if already expired."""
+        try:
+            deadline = deadline_from_request(route, request.headers if headers is None else headers, data, deadline_config)
+        except (TypeError, ValueError):
+            raise BadRequest("Invalid request deadline or timeout")
+        token = set_deadline(deadline)
+        try:
+            check_deadline('dispatch')
+            yield deadline
+        finally:
+            reset_deadline(token)
+
+    async def call_manager(func, **kwargs):
+        # With shared storage the context operations wait on Redis; keep that off the event loop
+        if manager.replicated and not asyncio.iscoroutinefunction(func):
+            return await asyncio.to_thread(func, **kwargs)
+        return await run_sync_or_async(func, **kwargs)
+
+    def create_route(route, methods, func, endpoint=None, generation=False):
+        endpoint = endpoint or f"{func.__name__}_{route}"
+        @app.route(route, methods=methods, endpoint=endpoint)
+        async def wrapper():
+            if request.method == 'GET':
+                return jsonify(await call_manager(func))
+            else:
+                data = await request.get_json() or {}
+                if generation:
+                    with request_deadline(route, data):
+                        async with admit_generation(data.get('name'), data.get('prompt')):
+                            return respond(await cancel_on_disconnect(func(**data), route))
+                return jsonify(await call_manager(func, **data))
+        return wrapper
+
+    # Register API routes
+    create_route('/create_context', ['POST'], manager.create_context)
+    create_route('/list_contexts', ['GET'], manager.list_contexts)
+    create_route('/delete_context', ['POST'], manager.remove_context, 'delete_context_/delete_context')
+    create_route('/send_prompt', ['POST'], send_prompt, generation=True)
+    create_route('/copy_context', ['POST'], manager.copy_context)
+
+    @app.route('/list_models', methods=['GET'])
+    async def list_models():
+        service = request.args.get('service', '').lower()
+        try:
+            client = manager.get_service_client(service)
+            with request_deadline('/list_models'):
+                models = await with_deadline(client.list_models(), 'provider')
+            return jsonify({"models": models})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error("Error listing models for %s: %s", service, e)
+            return jsonify({"error": "An error occurred while listing models"}), 500
+
+    @app.route('/start_game', methods=['POST'])
+    async def start_game():
+        data = await request.get_json()
+        context_name = data.get('context_name')
+        if not context_name or not await manager.load_context(context_name):
+            return jsonify({"error": "Invalid or missing context name"}), 400
+
+        with request_deadline('/start_game', data):
+            async with admit_generation(context_name):
+                initial_state = await cancel_on_disconnect(game_engine.start_game(context_name), '/start_game')
+        return respond({"initial_state": initial_state})
+
+    @app.route('/game_turn', methods=['POST'])
+    async def game_turn():
+        data = await request.get_json()
+        context_name = data.get('context_name')
+        user_input = data.get('user_input')
+
+        if not context_name or not await manager.load_context(context_name):
+            return jsonify({"error": "Invalid or missing context name"}), 400
+        if not user_input:
+            return jsonify({"error": "Missing user input"}), 400
+
+        with request_deadline('/game_turn', data):
+            async with admit_generation(context_name, user_input):
+                game_response = await cancel_on_disconnect(
+                    game_engine.process_turn(context_name, user_input), '/game_turn'
+                )
+        return respond({"game_response": game_response})
+
+    def job_handler(route, context_field, call, *input_fields):
+        """Run a job under the same deadline and admission rules as the synchronous ``route``."""
+        async def handler(params, tenant):
+            with request_deadline(route, dict(params), headers={}):
+                async with admit_generation(params.get(context_field), *(params.get(f) for f in input_fields), tenant=tenant):
+                    return await call(params)
+        return handler
+
+    jobs.register('send_prompt', job_handler(
+        '/send_prompt', 'name', lambda p: send_prompt(p['name'], p['prompt']), 'prompt'
+    ), required=('name', 'prompt'))
+    jobs.register('start_game', job_handler(
+        '/start_game', 'context_name', lambda p: game_engine.start_game(p['context_name'])
+    ), required=('context_name',))
+    jobs.register('game_turn', job_handler(
+        '/game_turn', 'context_name', lambda p: game_engine.process_turn(p['context_name'], p['user_input']), 'user_input'
+    ), required=('context_name', 'user_input'))
+
+    def batch_path(name):
+        """Resolve a batch file name inside the configured batch directory, refusing anything outside it."""
+        directory = os.path.realpath(batch_config.get('directory', 'batches'))
+        path = os.path.realpath(os.path.join(directory, name))
+        if os.path.commonpath([directory, path]) != directory:
+            raise ValueError(f"Batch files must be inside {directory}")
+        return path
+
+    async def run_batch_job(params, tenant):
+        concurrency = {**batch_config.get('concurrency', {}), **(params.get('concurrency') or {})}
+        runner = BatchRunner(manager, concurrency, params.get('row_timeout', batch_config.get('row_timeout', 120)),
+                             admission=admission, tenant=tenant)
+        return await runner.run(batch_path(params['input']), batch_path(params['output']), params.get('limit'))
+
+    jobs.register('batch', run_batch_job, required=('input', 'output'))
+
+    @app.route('/batch', methods=['POST'])
+    async def submit_batch():
+        data = await request.get_json() or {}
+        try:
+            for field in ('input', 'output'):
+                if data.get(field):
+                    batch_path(data[field])
+            if data.get('input') and not os.path.isfile(batch_path(data['input'])):
+                return jsonify({"error": f"Batch input not found: {data['input']}"}), 400
+            job = jobs.submit('batch', data, priority=data.pop('priority', None), tenant=admission.identify(request.headers))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        location = f"/jobs/{job.id}"
+        return jsonify({"job_id": job.id, "status": job.status, "location": location}), 202, {"Location": location}
+
+    @app.route('/jobs', methods=['POST'])
+    async def submit_job():
+        data = await request.get_json() or {}
+        try:
+            job = jobs.submit(
+                data.get('type'),
+                data.get('params') or {},
+                priority=data.get('priority'),
+                webhook=data.get('webhook'),
+                tenant=admission.identify(request.headers),
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        location = f"/jobs/{job.id}"
+        return jsonify({"job_id": job.id, "status": job.status, "location": location}), 202, {"Location": location}
+
+    @app.route('/jobs', methods=['GET'])
+    async def job_stats():
+        return jsonify(jobs.stats())
+
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    async def get_job(job_id):
+        try:
+            wait = float(request.args.get('wait', 0))
+        except ValueError:
+            return jsonify({"error": "Invalid wait"}), 400
+        job = await jobs.wait(job_id, wait)
+        if job is None:
+            return jsonify({"error": "Unknown or expired job"}), 404
+        return jsonify(job.to_dict())
+
+    @app.route('/jobs/<job_id>', methods=['DELETE'])
+    async def cancel_job(job_id):
+        job = jobs.cancel(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown or expired job"}), 404
+        return jsonify(job.to_dict())
+
+    @app.route('/admission_stats', methods=['GET'])
+    async def admission_stats():
+        return jsonify(admission.stats())
+
+    @app.route('/metrics', methods=['GET'])
+    async def prometheus_metrics():
+        return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    @app.route('/admin/profile', methods=['POST'])
+    async def admin_profile():
+        if not profiler.authorized(request.headers.get('X-Admin-Token')):
+            return jsonify({"error": "Forbidden"}), 403
+        data = await request.get_json(silent=True) or {}
+        try:
+            body, content_type = await profiler.run(data.get('seconds', 10), data.get('mode', 'sampling'),
+                                                    data.get('format', 'top'), data.get('top', 30), bool(data.get('memory')))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        except ProfilerBusy as e:
+            return jsonify({"error": str(e)}), 409
+        response = Response(body, content_type=content_type)
+        if data.get('format') == 'pstats':
+            response.headers['Content-Disposition'] = 'attachment; filename="profile.pstats"'
+        return response
+
+    @app.route('/admin/games', methods=['GET'])
+    async def admin_games():
+        if not profiler.authorized(request.headers.get('X-Admin-Token')):
+            return jsonify({"error": "Forbidden"}), 403
+        return jsonify(game_engine.memory_report())
+
+    @app.route('/fan_out', methods=['POST'])
+    async def fan_out():
+        data = await request.get_json() or {}
+        try:
+            targets = prepare_targets(manager, data.get('prompt'), data.get('targets'), data.get('system_prompt'),
+                                      fan_out_config.get('max_targets', 16))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        # The response is streamed after this handler returns, so the deadline is passed explicitly
+        with request_deadline('/fan_out', data) as deadline:
+            runner = FanOut(manager, deadline or Deadline(deadline_config.get('default', 60)),
+                            admission, admission.identify(request.headers))
+
+        async def stream():
+            async for event in runner.run(targets):
+                yield json.dumps(event) + '\n'
+
+        return Response(stream(), mimetype='application/x-ndjson')
+
+    @app.route('/execute_plugin', methods=['POST'])
+    async def execute_plugin():
+        data = await request.get_json()
+        plugin_name = data.get('plugin_name')
+        plugin_args = data.get('args', [])
+        plugin_kwargs = data.get('kwargs', {})
+
+        if not plugin_name:
+            return jsonify({"error": "Missing plugin name"}), 400
+
+        try:
+            # Plugins are synchronous; keep them off the event loop
+            result = await asyncio.to_thread(plugin_manager.execute_plugin, plugin_name, *plugin_args, **plugin_kwargs)
+            return jsonify({"result": result})
+        except Exception as e:
+            return jsonify({"error": f"Failed to execute plugin {plugin_name}: {str(e)}"}), 500
+
+    @app.websocket('/ws/game/<context_name>')
+    async def game_socket(context_name):
+        await game_socket_hub.serve(context_name, websocket)
+
+    @app.before_serving
+    async def start_job_workers():
+        tracer.configure(get_tracing_config())
+        jobs.start()
+        game_engine.start_sweeper()
+
+    @app.after_serving
+    async def close_game_sockets():
+        game_socket_hub.close_all()
+        await game_engine.stop_sweeper()
+        await jobs.stop()
+        tracer.shutdown()
+
+    settings = get_config()
+    reload_interval = settings.get_float('config.reload_interval', 2)
+    subscriptions = []
+    watchers = []
+
+    def replace(target):
+        # Routes and the socket hub hold these dicts, so they are updated in place
+        def apply(section):
+            target.clear()
+            target.update(section)
+        return apply
+
+    @app.before_serving
+    async def watch_config():
+        subscriptions.extend([
+            settings.subscribe('logging', update_logging),
+            settings.subscribe('admission', admission.reconfigure),
+            settings.subscribe('deadlines', replace(deadline_config)),
+            settings.subscribe('jobs', jobs.reconfigure),
+            settings.subscribe('batch', replace(batch_config)),
+            settings.subscribe('fan_out', replace(fan_out_config)),
+            settings.subscribe('game_prompt', game_engine.projection.configure),
+            settings.subscribe('tracing', tracer.reconfigure),
+        ])
+        if reload_interval > 0:
+            watchers.append(asyncio.create_task(settings.watch(reload_interval)))
+
+    @app.after_serving
+    async def stop_config_watch():
+        for unsubscribe in subscriptions:
+            unsubscribe()
+        for watcher in watchers:
+            watcher.cancel()
+        await asyncio.gather(*watchers, return_exceptions=True)
+        subscriptions.clear()
+        watchers.clear()
+
+    return app
+
+async def run_server(app, host='127.0.0.1', port=5000):
     from hypercorn.asyncio import serve
     from hypercorn.config import Config
 
     config = Config()
-    config.bind = [f"{FLASK_HOST}:{FLASK_PORT}"]
+    config.bind = [f"{host}:{port}"]
     await serve(app, config)
 
 async def main():
+    config = get_config()
     parser = argparse.ArgumentParser(description='LLM Server')
     parser.add_argument('--no-console', action='store_true', help='Disable console interface')
+    parser.add_argument('--host', default=config.get_str('api.host', '127.0.0.1'), help='Address to listen on')
+    parser.add_argument('--port', type=int, default=config.get_int('api.port', 5000), help='Port to listen on')
+    parser.add_argument('--worker', action='store_true', help='Run as a worker behind the cluster dispatcher')
     args = parser.parse_args()
 
-    console_config = get_console_config()
-    run_console = console_config.get('enabled', True) and not args.no_console
+    run_console = config.get_bool('console.enabled', True) and not args.no_console and not args.worker
+    services = create_services()
+    profiler = Profiler(get_profiling_config(), lambda: footprint(services.manager, services.game_engine))
+    app = create_app(services, profiler, worker=args.worker)
 
-    tasks = [run_server()]
+    tasks = [run_server(app, args.host, args.port)]
     if run_console:
-        tasks.append(start_console(manager, game_engine, plugin_manager))
+        # prompt_toolkit is only needed with the console
+        from console.cli import start_console
+        tasks.append(start_console(services.manager, services.game_engine, services.plugin_manager, profiler))
 
     await asyncio.gather(*tasks)
 
@@ -1,109 +1,149 @@
 # manager_instance.py
 
 import os
-import asyncio
+import time
+from typing import Any, Dict, Mapping, Optional
 from dotenv import load_dotenv
 from conversation_manager import ConversationManager
-from services.groq_client import GroqClient
-from services.ollama_client import OllamaClient
-from services.cerebras_client import CerebrasClient
+from game.engine import GameEngine
+from services import ServiceClients
 from storage.tinydb_storage import TinyDBStorage
-from config.config_loader import load_config, get_service_config, get_logging_config
+from config.config_loader import get_service_config, get_logging_config, get_cancellation_config, get_storage_config, get_game_prompt_config
 from utils.logger import setup_logging, get_logger
 from utils.error_handler import setup_global_error_handler
-from utils.async_utils import run_sync_or_async
+from cluster import WORKER_ID_ENV
 
-# Load environment variables
-load_dotenv()
-
-# Load configuration
-config = load_config()
-
-# Setup logging
-logging_config = get_logging_config()
-setup_logging(logging_config)
 logger = get_logger(__name__)
 
-# Setup global error handler
-setup_global_error_handler()
-
-# Initialize storage
-storage = TinyDBStorage('all_contexts.json')
-
-# Initialize ConversationManager
-manager = ConversationManager(storage_backend=storage)
-
-# Initialize service clients
-service_clients = {}
-
-# Groq setup
-groq_config = get_service_config('groq')
-if groq_config:
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY") or groq_config.get('api_key')
-    if GROQ_API_KEY:
-        service_clients['groq'] = GroqClient({'api_key': GROQ_API_KEY})
-        logger.info("Groq client initialized")
-    else:
-        logger.warning("GROQ_API_KEY is not set. Groq functionality will be limited.")
-
-# Ollama setup
-ollama_config = get_service_config('ollama')
-if ollama_config:
-    OLLAMA_HOST = ollama_config.get('host', 'http://localhost')
-    OLLAMA_PORT = ollama_config.get('port', 11434)
-    service_clients['ollama'] = OllamaClient({'host': OLLAMA_HOST, 'port': OLLAMA_PORT})
-    logger.info(f"Ollama client initialized with host {OLLAMA_HOST} and port {OLLAMA_PORT}")
-
-# Cerebras setup
-cerebras_config = get_service_config('cerebras')
-if cerebras_config:
-    CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY") or cerebras_config.get('api_key')
-    if CEREBRAS_API_KEY:
-        service_clients['cerebras'] = CerebrasClient({'api_key': CEREBRAS_API_KEY})
-        logger.info("Cerebras client initialized")
-    else:
-        logger.warning("CEREBRAS_API_KEY is not set. Cerebras functionality will be limited.")
-
-# Verify connections
-for service_name, client in service_clients.items():
-    try:
-        models = client.list_models()
-        logger.info(f"Successfully connected to {service_name}. Available models: {len(models)}")
-    except Exception as e:
-        logger.error(f"Could not connect to {service_name} server. Error: {str(e)}")
-
-# Plugin setup
-from plugins import PluginManager
-plugin_manager = PluginManager()
-logger.info(f"Loaded plugins: {plugin_manager.list_plugins()}")
-
-logger.info("ConversationManager instance and services created and configured.")
+class Services:
+    """
+    The long-lived objects shared by the HTTP app, the console and the batch runner.
+
+    :param started: ``time.perf_counter()`` when building them began; time to ready is measured from it
+    """
+
+    def __init__(self, manager: ConversationManager, plugin_manager=None, storage=None,
+                 started: Optional[float] = None, game_config: Optional[Dict[str, Any]] = None):
+        self.manager = manager
+        self.plugin_manager = plugin_manager
+        self.storage = storage
+        self.game_engine = GameEngine(manager, game_config)
+        self.started = started if started is not None else time.perf_counter()
+        # Seconds spent in each start-up phase, reported by /readyz
+        self.phases: Dict[str, float] = {}
+
+    @property
+    def service_clients(self) -> Mapping[str, Any]:
+        return self.manager.service_clients
+
+    async def send_prompt(self, name: str, prompt: str):
+        context = await self.manager.load_context(name)
+        if not context:
+            return {"success": False, "message": f"Context '{name}' does not exist.", "response": None}
+
+        service_client = self.manager.get_service_client(context.service)
+        return await self.manager.send_prompt(name, prompt, service_client)
+
+def create_storage(storage_config: Dict[str, Any]):
+    if storage_config.get('backend') == 'redis':
+        # Imported only when configured; redis is an optional dependency
+        from storage.redis_storage import RedisStorage
+        return RedisStorage(**storage_config.get('redis', {}))
+    # Cluster workers share the file, so it is locked per operation
+    return TinyDBStorage(storage_config.get('path', 'all_contexts.json'), shared=bool(os.getenv(WORKER_ID_ENV)))
+
+def create_service_clients() -> ServiceClients:
+    """Clients for the configured services; each is constructed, and its SDK imported, on first use."""
+    configs = {}
+
+    # Groq setup
+    groq_config = get_service_config('groq')
+    if groq_config:
+        GROQ_API_KEY = os.getenv("GROQ_API_KEY") or groq_config.get('api_key')
+        if GROQ_API_KEY:
+            # The client picks its options (such as base_url, for a load test) from the service's configuration
+            configs['groq'] = {**groq_config, 'api_key': GROQ_API_KEY}
+        else:
+            logger.warning("GROQ_API_KEY is not set. Groq functionality will be limited.")
+
+    # Ollama setup
+    ollama_config = get_service_config('ollama')
+    if ollama_config:
+        OLLAMA_HOST = ollama_config.get('host', 'http://localhost')
+        OLLAMA_PORT = ollama_config.get('port', 11434)
+        configs['ollama'] = {'host': OLLAMA_HOST, 'port': OLLAMA_PORT}
+
+    # Cerebras setup
+    cerebras_config = get_service_config('cerebras')
+    if cerebras_config:
+        CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY") or cerebras_config.get('api_key')
+        if CEREBRAS_API_KEY:
+            configs['cerebras'] = {**cerebras_config, 'api_key': CEREBRAS_API_KEY}
+        else:
+            logger.warning("CEREBRAS_API_KEY is not set. Cerebras functionality will be limited.")
+
+    return ServiceClients(configs)
+
+def create_services() -> Services:
+    """
+    Build storage, provider clients, the conversation manager and plugins from the configuration.
+
+    Providers are not contacted here; the server probes them concurrently once it is serving
+    (see ``api.health.Startup``).
+    """
+    started = time.perf_counter()
+    load_dotenv()
+    setup_logging(get_logging_config())
+    setup_global_error_handler()
+
+    phases = {}
+    began = time.perf_counter()
+    service_clients = create_service_clients()
+    phases['clients'] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    storage_config = get_storage_config()
+    storage = create_storage(storage_config)
+    manager = ConversationManager(
+        storage_backend=storage,
+        service_clients=service_clients,
+        persist_incomplete=get_cancellation_config().get('persist_incomplete', False),
+        replicated=storage_config.get('backend') == 'redis'
+    )
+    phases['storage'] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    from plugins import PluginManager
+    plugin_manager = PluginManager()
+    logger.info("Loaded plugins: %s", plugin_manager.list_plugins())
+    phases['plugins'] = time.perf_counter() - began
+
+    game_config = {**(storage_config.get('games') or {}), 'projection': get_game_prompt_config()}
+    services = Services(manager, plugin_manager, storage, started, game_config)
+    services.phases.update(phases)
+    logger.info("ConversationManager instance and services created and configured.")
+    return services
+
+_services: Optional[Services] = None
+
+def get_services() -> Services:
+    """The process-wide services, built on first use."""
+    global _services
+    if _services is None:
+        _services = create_services()
+    return _services
+
+def __getattr__(name):
+    # ``from manager_instance import manager`` keeps working, but only builds the services when asked for
+    if name in ('manager', 'plugin_manager', 'service_clients', 'storage', 'game_engine'):
+        return getattr(get_services(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_service_client(service_name):
-    client = service_clients.get(service_name)
-    if not client:
-        raise ValueError(f"No client available for service: {service_name}")
-    return client
+    return get_services().manager.get_service_client(service_name)
 
 async def send_prompt(name: str, prompt: str):
-    context = manager.get_context(name)
-    if not context:
-        return {"success": False, "message": f"Context '{name}' does not exist.", "response": None}
-    
-    service_client = get_service_client(context.service)
-    return await manager.send_prompt(name, prompt, service_client)
-
-async def initialize_services():
-    for service_name, client in service_clients.items():
-        try:
-            models = await run_sync_or_async(client.list_models)
-            logger.info(f"Successfully connected to {service_name}. Available models: {len(models)}")
-        except Exception as e:
-            logger.error(f"Could not connect to {service_name} server. Error: {str(e)}")
-
-asyncio.run(initialize_services())
-
-logger.info("ConversationManager instance and services created and configured.")
+    return await get_services().send_prompt(name, prompt)
 
 # Export the functions and objects that should be accessible from other modules
-__all__ = ['manager', 'send_prompt', 'plugin_manager']
\ No newline at end of file
+__all__ = ['Services', 'create_services', 'get_services', 'manager', 'send_prompt', 'plugin_manager']
\ No newline at end of file
@@ -20,10 +20,10 @@ class PluginManager:
                     if hasattr(module, 'register_plugin'):
                         plugin = module.register_plugin()
                         self.plugins[plugin_name] = plugin
-                        logger.info(f"Loaded plugin: {plugin_name}")
+                        logger.info("Loaded plugin: %s", plugin_name)
                     # Remove the else clause that was logging the warning
                 except Exception as e:
-                    logger.error(f"Error loading plugin {plugin_name}: {str(e)}")
+                    logger.error("Error loading plugin %s: %s", plugin_name, e)
 
     def get_plugin(self, name: str):
         return self.plugins.get(name)
@@ -34,10 +34,10 @@ class PluginManager:
             try:
                 return plugin.execute(*args, **kwargs)
             except Exception as e:
-                logger.error(f"Error executing plugin {name}: {str(e)}")
+                logger.error("Error executing plugin %s: %s", name, e)
                 return None
         else:
-            logger.warning(f"Plugin {name} not found")
+            logger.warning("Plugin %s not found", name)
             return None
 
     def list_plugins(self):
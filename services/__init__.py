@@ -1,13 +1,66 @@
+import importlib
+import threading
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Type
 from .base_client import ServiceClient
-from .groq_client import GroqClient
-from .ollama_client import OllamaClient
-from .cerebras_client import CerebrasClient
 
+# Provider clients by name, as "module:class". A provider's module, and the SDK it wraps, is only
+# imported when a client for it is first needed, so a process pays for the providers it uses.
 SERVICE_REGISTRY = {
-    'groq': GroqClient,
-    'ollama': OllamaClient,
-    'cerebras': CerebrasClient,
+    'groq': 'services.groq_client:GroqClient',
+    'ollama': 'services.ollama_client:OllamaClient',
+    'cerebras': 'services.cerebras_client:CerebrasClient',
 }
 
+def get_service_class(name: str) -> Type[ServiceClient]:
+    if name not in SERVICE_REGISTRY:
+        raise ValueError(f"Unknown service: {name}")
+    module_name, class_name = SERVICE_REGISTRY[name].split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+class ServiceClients(Mapping):
+    """
+    Client per configured service, constructed (and its SDK imported) on first lookup.
+
+    Iterating lists the configured names without constructing anything; use ``loaded()`` to see
+    which clients exist so far.
+    """
+
+    def __init__(self, configs: Dict[str, Dict[str, Any]]):
+        self.configs = configs
+        self.clients: Dict[str, ServiceClient] = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> ServiceClient:
+        client = self.clients.get(name)
+        if client is None:
+            if name not in self.configs:
+                raise KeyError(name)
+            # Probes may construct a client in a thread while a request asks for it
+            with self.lock:
+                client = self.clients.get(name)
+                if client is None:
+                    client = self.clients[name] = get_service_class(name)(self.configs[name])
+        return client
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.configs)
+
+    def __len__(self) -> int:
+        return len(self.configs)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.configs
+
+    def loaded(self) -> Dict[str, ServiceClient]:
+        return dict(self.clients)
+
 def initialize_services(config):
-    return {name: cls(config.get(name, {})) for name, cls in SERVICE_REGISTRY.items()}
\ No newline at end of file
+    return ServiceClients({name: config.get(name, {}) for name in SERVICE_REGISTRY})
+
+def __getattr__(name):
+    # ``from services import GroqClient`` still works; it imports that provider only
+    for service, target in SERVICE_REGISTRY.items():
+        if target.endswith(f":{name}"):
+            return get_service_class(service)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,15 +1,22 @@
 # services/base_client.py
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator
 from utils.logger import get_logger
+from utils.async_utils import run_sync_or_async
 
 logger = get_logger(__name__)
 
+SECRET_KEYS = ('key', 'token', 'secret', 'password')
+
+def redact(config: Dict[str, Any]) -> Dict[str, Any]:
+    """A copy of a service config with credentials masked, safe to log or print."""
+    return {k: '***' if v and any(s in k.lower() for s in SECRET_KEYS) else v for k, v in config.items()}
+
 class ServiceClient(ABC):
     def __init__(self, config: Dict[str, Any]):
         self.config = config
-        logger.info(f"Initializing {self.__class__.__name__} with config: {config}")
+        logger.debug("Initializing %s with config: %s", self.__class__.__name__, redact(config))
 
     @abstractmethod
     async def generate_response(self, context: Any) -> str:
@@ -21,6 +28,17 @@ class ServiceClient(ABC):
         """
         pass
 
+    async def stream_response(self, context: Any) -> AsyncIterator[str]:
+        """
+        Stream the generated response as text deltas.
+        
+        :param context: The conversation context containing history, model, and settings.
+        :return: An async iterator over chunks of the generated response.
+        """
+        # Default implementation yields the complete response as a single chunk
+        # Subclasses with native streaming support should override this method
+        yield await self.generate_response(context)
+
     @abstractmethod
     async def list_models(self) -> List[str]:
         """
@@ -69,24 +87,46 @@ class ServiceClient(ABC):
         """
         Prepare the message history for the API request.
         
+        Contexts that carry ``prepared_messages`` (e.g. fan-out targets sharing one prefix)
+        are sent as-is instead of being copied again.
+        
         :param context: The conversation context containing the message history.
         :return: A list of message dictionaries ready for the API request.
         """
+        prepared = getattr(context, 'prepared_messages', None)
+        if prepared is not None:
+            return prepared
         return [{"role": msg["role"], "content": msg["content"]} for msg in context.history]
 
+    async def close_stream(self, stream: Any) -> None:
+        """
+        Release a provider stream that is abandoned before it is exhausted,
+        e.g. because the caller disconnected or the request was cancelled.
+        
+        :param stream: The streaming response object returned by the provider SDK.
+        """
+        close = getattr(stream, 'aclose', None) or getattr(stream, 'close', None)
+        if close is None:
+            return
+        try:
+            await run_sync_or_async(close)
+        except Exception as e:
+            logger.debug("Error closing %s stream: %s", self.__class__.__name__, e)
+
     async def handle_error(self, error: Exception) -> str:
         """
-        Handle errors that occur during API calls.
+        Log an error that occurred during an API call; the client then re-raises it, so callers
+        can tell a failed generation from a response.
         
         :param error: The exception that was raised.
-        :return: An error message string.
+        :return: The logged error message.
         """
         error_msg = f"An error occurred: {str(error)}"
         logger.error(error_msg)
         return error_msg
 
     def __str__(self) -> str:
-        return f"{self.__class__.__name__}(config={self.config})"
+        return f"{self.__class__.__name__}(config={redact(self.config)})"
 
     def __repr__(self) -> str:
         return self.__str__()
\ No newline at end of file
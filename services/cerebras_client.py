@@ -1,8 +1,9 @@
 # services/cerebras_client.py
 
+import asyncio
 from .base_client import ServiceClient
-from cerebras.cloud.sdk import Cerebras
-from typing import Dict, Any, List
+from cerebras.cloud.sdk import AsyncCerebras
+from typing import Dict, Any, List, AsyncIterator
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -10,10 +11,19 @@ logger = get_logger(__name__)
 class CerebrasClient(ServiceClient):
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
-        self.client = Cerebras(api_key=config['api_key'])
+        # base_url points the client at another OpenAI-compatible server, such as benchmarks/fake_provider.py
+        options = {key: config[key] for key in ('base_url', 'max_retries') if config.get(key) is not None}
+        self.client = AsyncCerebras(api_key=config['api_key'], **options)
         logger.info("Cerebras client initialized")
 
     async def generate_response(self, context: Any) -> str:
+        if context.settings.stream:
+            response_text = ""
+            async for content in self.stream_response(context):
+                response_text += content
+                print(content, end='', flush=True)
+            print()
+            return response_text
         try:
             response = await self.client.chat.completions.create(
                 messages=self.prepare_messages(context),
@@ -21,22 +31,36 @@ class CerebrasClient(ServiceClient):
                 temperature=context.settings.temperature,
                 max_tokens=context.settings.max_tokens,
                 top_p=context.settings.top_p,
-                stream=context.settings.stream,
+                stream=False,
                 tools=context.settings.tools if context.settings.use_tools else None
             )
-            if context.settings.stream:
-                response_text = ""
+            return response.choices[0].message.content
+        except Exception as e:
+            await self.handle_error(e)
+            raise
+
+    async def stream_response(self, context: Any) -> AsyncIterator[str]:
+        try:
+            response = await self.client.chat.completions.create(
+                messages=self.prepare_messages(context),
+                model=context.model,
+                temperature=context.settings.temperature,
+                max_tokens=context.settings.max_tokens,
+                top_p=context.settings.top_p,
+                stream=True,
+                tools=context.settings.tools if context.settings.use_tools else None
+            )
+            try:
                 async for chunk in response:
                     content = chunk.choices[0].delta.content
                     if content:
-                        response_text += content
-                        print(content, end='', flush=True)
-                print()
-                return response_text
-            else:
-                return response.choices[0].message.content
+                        yield content
+            except (asyncio.CancelledError, GeneratorExit):
+                await self.close_stream(response)
+                raise
         except Exception as e:
-            return await self.handle_error(e)
+            await self.handle_error(e)
+            raise
 
     async def list_models(self) -> List[str]:
         # Since we're now using a fixed list, we don't need to make an API call
@@ -54,7 +78,7 @@ class CerebrasClient(ServiceClient):
                 "description": f"Cerebras {model_name} model",
             }
         else:
-            logger.warning(f"Unknown model: {model_name}")
+            logger.warning("Unknown model: %s", model_name)
             return {"name": model_name, "error": "Unknown model"}
 
     async def handle_error(self, error: Exception) -> str:
@@ -1,8 +1,9 @@
 # services/groq_client.py
 
+import asyncio
 from .base_client import ServiceClient
 from groq import AsyncGroq
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -10,10 +11,19 @@ logger = get_logger(__name__)
 class GroqClient(ServiceClient):
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
-        self.client = AsyncGroq(api_key=config['api_key'])
+        # base_url points the client at another OpenAI-compatible server, such as benchmarks/fake_provider.py
+        options = {key: config[key] for key in ('base_url', 'max_retries') if config.get(key) is not None}
+        self.client = AsyncGroq(api_key=config['api_key'], **options)
         logger.info("Groq client initialized")
 
     async def generate_response(self, context: Any) -> str:
+        if context.settings.stream:
+            response_text = ""
+            async for content in self.stream_response(context):
+                response_text += content
+                print(content, end='', flush=True)
+            print()
+            return response_text
         try:
             chat_completion = await self.client.chat.completions.create(
                 messages=self.prepare_messages(context),
@@ -21,21 +31,34 @@ class GroqClient(ServiceClient):
                 temperature=context.settings.temperature,
                 max_tokens=context.settings.max_tokens,
                 top_p=context.settings.top_p,
-                stream=context.settings.stream,
+                stream=False,
             )
-            if context.settings.stream:
-                response_text = ""
+            return chat_completion.choices[0].message.content
+        except Exception as e:
+            await self.handle_error(e)
+            raise
+
+    async def stream_response(self, context: Any) -> AsyncIterator[str]:
+        try:
+            chat_completion = await self.client.chat.completions.create(
+                messages=self.prepare_messages(context),
+                model=context.model,
+                temperature=context.settings.temperature,
+                max_tokens=context.settings.max_tokens,
+                top_p=context.settings.top_p,
+                stream=True,
+            )
+            try:
                 async for chunk in chat_completion:
                     content = chunk.choices[0].delta.content
                     if content:
-                        response_text += content
-                        print(content, end='', flush=True)
-                print()
-                return response_text
-            else:
-                return chat_completion.choices[0].message.content
+                        yield content
+            except (asyncio.CancelledError, GeneratorExit):
+                await self.close_stream(chat_completion)
+                raise
         except Exception as e:
-            return await self.handle_error(e)
+            await self.handle_error(e)
+            raise
 
     async def list_models(self) -> List[str]:
         # Groq doesn't have a list_models API, so we return a predefined list
@@ -1,8 +1,9 @@
 # services/ollama_client.py
 
+import asyncio
 from .base_client import ServiceClient
-from ollama import Client
-from typing import Dict, Any, List
+from ollama import AsyncClient
+from typing import Dict, Any, List, AsyncIterator
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -12,53 +13,78 @@ class OllamaClient(ServiceClient):
         super().__init__(config)
         host = config.get('host', 'localhost')
         port = config.get('port', 11434)
-        self.client = Client(host=f"http://{host}:{port}")
-        logger.info(f"Ollama client initialized with host {host} and port {port}")
+        self.client = AsyncClient(host=f"http://{host}:{port}")
+        logger.info("Ollama client initialized with host %s and port %s", host, port)
 
-    def generate_response(self, context: Any) -> str:
+    async def generate_response(self, context: Any) -> str:
+        if context.settings.stream:
+            response_text = ""
+            async for content in self.stream_response(context):
+                response_text += content
+                print(content, end='', flush=True)
+            print()
+            return response_text
         try:
-            response = self.client.chat(
+            response = await self.client.chat(
                 model=context.model,
                 messages=self.prepare_messages(context),
-                stream=context.settings.stream,
-                options={
-                    "num_predict": context.settings.num_predict,
-                    "temperature": context.settings.temperature,
-                    "top_k": context.settings.top_k,
-                    "top_p": context.settings.top_p,
-                    "repeat_penalty": context.settings.repeat_penalty
-                }
+                stream=False,
+                options=self.get_options(context)
             )
-            if context.settings.stream:
-                response_text = ""
-                for chunk in response:
+            return response['message']['content']
+        except Exception as e:
+            await self.handle_error(e)
+            raise
+
+    async def stream_response(self, context: Any) -> AsyncIterator[str]:
+        try:
+            response = await self.client.chat(
+                model=context.model,
+                messages=self.prepare_messages(context),
+                stream=True,
+                options=self.get_options(context)
+            )
+            try:
+                async for chunk in response:
                     content = chunk['message']['content']
-                    response_text += content
-                    print(content, end='', flush=True)
-                print()
-                return response_text
-            else:
-                return response['message']['content']
+                    if content:
+                        yield content
+            except (asyncio.CancelledError, GeneratorExit):
+                await self.close_stream(response)
+                raise
         except Exception as e:
-            return self.handle_error(e)
+            await self.handle_error(e)
+            raise
+
+    def get_options(self, context: Any) -> Dict[str, Any]:
+        return {
+            "num_predict": context.settings.num_predict,
+            "temperature": context.settings.temperature,
+            "top_k": context.settings.top_k,
+            "top_p": context.settings.top_p,
+            "repeat_penalty": context.settings.repeat_penalty
+        }
 
-    def list_models(self) -> List[str]:
+    async def list_models(self) -> List[str]:
         try:
-            models = self.client.list()
+            models = await self.client.list()
             if isinstance(models, list):
                 return [model['name'] for model in models if isinstance(model, dict) and 'name' in model]
             elif isinstance(models, dict) and 'models' in models:
                 return [model['name'] for model in models['models'] if isinstance(model, dict) and 'name' in model]
+            elif hasattr(models, 'models'):
+                # Newer ollama packages return a typed ListResponse that names each model in ``model``
+                return [model.model for model in models.models if model.model]
             else:
-                logger.error(f"Unexpected format for Ollama models: {models}")
+                logger.error("Unexpected format for Ollama models: %s", models)
                 return []
         except Exception as e:
-            logger.error(f"Error listing Ollama models: {str(e)}")
+            logger.error("Error listing Ollama models: %s", e)
             return []
 
-    def get_model_info(self, model_name: str) -> Dict[str, Any]:
+    async def get_model_info(self, model_name: str) -> Dict[str, Any]:
         try:
-            models = self.client.list()
+            models = await self.client.list()
             model_list = models if isinstance(models, list) else models.get('models', [])
             for model in model_list:
                 if model.get('name') == model_name:
@@ -67,13 +93,13 @@ class OllamaClient(ServiceClient):
                         "created": model.get('modified_at', 'N/A'),
                         "description": f"An Ollama language model: {model['name']}",
                     }
-            logger.warning(f"Model not found: {model_name}")
+            logger.warning("Model not found: %s", model_name)
             return {"name": model_name, "error": "Model not found"}
         except Exception as e:
-            logger.error(f"Error getting Ollama model info: {str(e)}")
+            logger.error("Error getting Ollama model info: %s", e)
             return {"name": model_name, "error": str(e)}
 
-    def handle_error(self, error: Exception) -> str:
+    async def handle_error(self, error: Exception) -> str:
         error_msg = f"Ollama API Error: {str(error)}"
         logger.error(error_msg)
         return error_msg
\ No newline at end of file
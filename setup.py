@@ -5,7 +5,9 @@ setup(
     version="0.2.0",
     packages=find_packages(),
     install_requires=[
-        "flask",
+        "quart",
+        "quart-cors",
+        "hypercorn",
         "prompt-toolkit",
         "pyyaml",
         "groq",
@@ -13,9 +15,13 @@ setup(
         "cerebras-cloud-sdk",
         "asyncio",
     ],
+    extras_require={
+        "redis": ["redis"],
+    },
     entry_points={
         "console_scripts": [
             "llmserver=main:main",
+            "llmserver-batch=batch.runner:main",
         ],
     },
 )
\ No newline at end of file
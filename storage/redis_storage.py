@@ -0,0 +1,340 @@
+# storage/redis_storage.py
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+import redis
+from utils.logger import get_logger
+from utils.metrics import metrics
+from utils.tracing import tracer
+
+logger = get_logger(__name__)
+
+CONTEXT = 'context'
+GAME = 'game'
+
+Invalidation = Callable[[str, str], None]
+
+
+class LockTimeout(TimeoutError):
+    pass
+
+
+class RedisLock:
+    """
+    A lock on one context shared by every replica.
+
+    Taken with ``SET NX`` and a random token, so only the holder can extend or release it.
+    The expiry is renewed while the lock is held; if a replica dies mid-turn the lock frees
+    itself after ``timeout`` seconds. Redis is called on a worker thread, off the event loop.
+    """
+
+    def __init__(self, client, key: str, timeout: float = 60, wait: float = 30):
+        self.client = client
+        self.key = key
+        self.timeout_ms = int(timeout * 1000)
+        self.wait = wait
+        self.token = uuid.uuid4().hex
+        self.renewer: Optional[asyncio.Task] = None
+
+    async def acquire(self) -> None:
+        deadline = time.monotonic() + self.wait
+        delay = 0.01
+        with tracer.span('lock.wait', lock=self.key):
+            while not await asyncio.to_thread(self.client.set, self.key, self.token, nx=True, px=self.timeout_ms):
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Timed out waiting for lock {self.key}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.25)
+        self.renewer = asyncio.create_task(self._renew())
+
+    async def _renew(self) -> None:
+        while True:
+            await asyncio.sleep(self.timeout_ms / 3000)
+            if not await asyncio.to_thread(self._if_held, lambda pipe: pipe.pexpire(self.key, self.timeout_ms)):
+                logger.warning("Lost lock %s before the turn finished", self.key)
+                return
+
+    async def release(self) -> None:
+        if self.renewer is not None:
+            self.renewer.cancel()
+            self.renewer = None
+        await asyncio.to_thread(self._if_held, lambda pipe: pipe.delete(self.key))
+
+    def _if_held(self, command: Callable[[Any], Any]) -> bool:
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self.key)
+                if pipe.get(self.key) != self.token:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                command(pipe)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    async def __aenter__(self) -> 'RedisLock':
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.release()
+
+
+class RedisStorage:
+    """
+    Context and game storage shared by several server replicas through Redis.
+
+    Keys, all under ``prefix``:
+
+    - ``contexts``: set of context names
+    - ``context:<name>``: hash of the context's fields, each JSON-encoded
+    - ``history:<name>``: list of JSON messages
+    - ``game:<name>``: hash with the current game ``state``, the ``base`` state of turn ``first_turn``
+      and the number of ``turns`` after it (see ``GameState.to_dict``)
+    - ``game_history:<name>``: list of JSON deltas, one per turn after ``base``
+    - ``lock:<name>``: per-context lock (see ``RedisLock``)
+
+    Saves append only the list entries added since this replica last read or wrote the list, and
+    are announced on the ``invalidate`` channel so other replicas drop their cached copy.
+    The client must be created with ``decode_responses=True``.
+
+    The methods block on Redis; async callers run them with ``asyncio.to_thread`` (see
+    ``ConversationManager.load_context``).
+    """
+
+    def __init__(self, url: str = 'redis://localhost:6379/0', prefix: str = 'llmserver',
+                 lock_timeout: float = 60, lock_wait: float = 30, client=None):
+        self.client = client or redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+        self.instance_id = uuid.uuid4().hex
+        self.channel = self.key('invalidate')
+        # List key -> length this replica knows is stored
+        self.synced: Dict[str, int] = {}
+        # Game name -> first_turn of the game's stored deltas; a new base means the list is rewritten
+        self.game_bases: Dict[str, int] = {}
+        self.subscribers: List[Invalidation] = []
+        self.listener = None
+        # The event loop the subscribers run on; None when subscribed outside one
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        logger.info("Redis storage initialized with prefix: %s", prefix)
+
+    def key(self, *parts: str) -> str:
+        return ':'.join((self.prefix,) + parts)
+
+    def _write(self, kind: str, name: str, list_key: str, items: List[Any], stage: Callable[[Any], int]) -> None:
+        """
+        Queue ``stage`` plus the new entries of ``items`` in one transaction, then announce the change.
+        ``stage`` returns the number of bytes it writes.
+        """
+        started = time.perf_counter()
+        with tracer.span('storage.save', backend='redis', key=list_key), self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(list_key)
+                    stored = pipe.llen(list_key)
+                    pipe.multi()
+                    written = stage(pipe)
+                    if self.synced.get(list_key) == stored and len(items) >= stored:
+                        new_items = items[stored:]
+                    else:
+                        # Truncated, or written by a replica we have not heard from yet
+                        pipe.delete(list_key)
+                        new_items = items
+                    encoded = [json.dumps(item) for item in new_items]
+                    if encoded:
+                        pipe.rpush(list_key, *encoded)
+                    pipe.publish(self.channel, json.dumps({"kind": kind, "name": name, "origin": self.instance_id}))
+                    pipe.execute()
+                    self.synced[list_key] = len(items)
+                    metrics.observe('storage_write_seconds', time.perf_counter() - started, backend='redis')
+                    metrics.increment('storage_write_bytes_total', sum(map(len, encoded)) + written, backend='redis')
+                    return
+                except redis.WatchError:
+                    metrics.increment('storage_write_retries_total', backend='redis')
+                    continue
+
+    def save(self, name: str, data: Dict[str, Any]) -> None:
+        try:
+            fields = {field: json.dumps(value) for field, value in data.items() if field != 'history'}
+
+            def stage(pipe):
+                pipe.hset(self.key(CONTEXT, name), mapping=fields)
+                pipe.sadd(self.key('contexts'), name)
+                return sum(map(len, fields.values()))
+
+            self._write(CONTEXT, name, self.key('history', name), data.get('history', []), stage)
+            logger.debug("Saved context: %s", name)
+        except Exception as e:
+            logger.error("Error saving context %s: %s", name, e)
+            raise
+
+    def load(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            history_key = self.key('history', name)
+            with tracer.span('storage.load', backend='redis', context=name):
+                pipe = self.client.pipeline()
+                pipe.hgetall(self.key(CONTEXT, name))
+                pipe.lrange(history_key, 0, -1)
+                fields, history = pipe.execute()
+            if not fields:
+                logger.warning("Context not found: %s", name)
+                return None
+            self.synced[history_key] = len(history)
+            logger.debug("Loaded context: %s", name)
+            return self._context(fields, history)
+        except Exception as e:
+            logger.error("Error loading context %s: %s", name, e)
+            raise
+
+    @staticmethod
+    def _context(fields: Dict[str, str], history: List[str]) -> Dict[str, Any]:
+        data = {field: json.loads(value) for field, value in fields.items()}
+        data['history'] = [json.loads(message) for message in history]
+        return data
+
+    def delete(self, name: str) -> None:
+        """Delete a context together with its game, which cannot outlive it."""
+        try:
+            pipe = self.client.pipeline()
+            pipe.delete(self.key(CONTEXT, name), self.key('history', name), self.key(GAME, name),
+                        self.key('game_history', name))
+            pipe.srem(self.key('contexts'), name)
+            for kind in (CONTEXT, GAME):
+                pipe.publish(self.channel, json.dumps({"kind": kind, "name": name, "origin": self.instance_id}))
+            pipe.execute()
+            self.synced.pop(self.key('history', name), None)
+            self.synced.pop(self.key('game_history', name), None)
+            self.game_bases.pop(name, None)
+            logger.debug("Deleted context: %s", name)
+        except Exception as e:
+            logger.error("Error deleting context %s: %s", name, e)
+            raise
+
+    def list_names(self) -> List[str]:
+        return sorted(self.client.smembers(self.key('contexts')))
+
+    def load_all(self) -> List[Dict[str, Any]]:
+        try:
+            names = self.list_names()
+            pipe = self.client.pipeline()
+            for name in names:
+                pipe.hgetall(self.key(CONTEXT, name))
+                pipe.lrange(self.key('history', name), 0, -1)
+            replies = pipe.execute()
+            all_contexts = []
+            for name, fields, history in zip(names, replies[::2], replies[1::2]):
+                if fields:
+                    self.synced[self.key('history', name)] = len(history)
+                    all_contexts.append(self._context(fields, history))
+            logger.debug("Loaded %s contexts", len(all_contexts))
+            return all_contexts
+        except Exception as e:
+            logger.error("Error loading all contexts: %s", e)
+            raise
+
+    def clear_all(self) -> None:
+        try:
+            for name in self.list_names():
+                self.delete(name)
+            logger.warning("Cleared all contexts from the database")
+        except Exception as e:
+            logger.error("Error clearing all contexts: %s", e)
+            raise
+
+    def save_game(self, name: str, data: Dict[str, Any]) -> None:
+        history_key = self.key('game_history', name)
+        turns = data.get('turns', [])
+        first_turn = data.get('first_turn', 0)
+        if self.game_bases.get(name) != first_turn:
+            # The oldest turns were dropped, so the stored deltas no longer line up
+            self.synced.pop(history_key, None)
+
+        def stage(pipe):
+            state, base = json.dumps(data['current_state']), json.dumps(data['base'])
+            pipe.hset(self.key(GAME, name), mapping={"state": state, "base": base, "first_turn": first_turn,
+                                                     "turns": len(turns)})
+            return len(state) + len(base)
+
+        self._write(GAME, name, history_key, turns, stage)
+        self.game_bases[name] = first_turn
+        logger.debug("Saved game state: %s", name)
+
+    def load_game(self, name: str) -> Optional[Dict[str, Any]]:
+        history_key = self.key('game_history', name)
+        pipe = self.client.pipeline()
+        pipe.hgetall(self.key(GAME, name))
+        pipe.lrange(history_key, 0, -1)
+        fields, history = pipe.execute()
+        if not fields:
+            return None
+        self.synced[history_key] = len(history)
+        entries = [json.loads(entry) for entry in history]
+        if 'base' not in fields:
+            # Saved before games were stored as deltas: the list holds every state
+            self.game_bases.pop(name, None)
+            return {"current_state": json.loads(fields['state']), "history": entries}
+        self.game_bases[name] = int(fields['first_turn'])
+        return {"current_state": json.loads(fields['state']), "base": json.loads(fields['base']),
+                "first_turn": self.game_bases[name], "turns": entries}
+
+    def delete_game(self, name: str) -> None:
+        pipe = self.client.pipeline()
+        pipe.delete(self.key(GAME, name), self.key('game_history', name))
+        pipe.publish(self.channel, json.dumps({"kind": GAME, "name": name, "origin": self.instance_id}))
+        pipe.execute()
+        self.synced.pop(self.key('game_history', name), None)
+        self.game_bases.pop(name, None)
+
+    def lock(self, name: str) -> RedisLock:
+        return RedisLock(self.client, self.key('lock', name), self.lock_timeout, self.lock_wait)
+
+    def subscribe(self, callback: Invalidation) -> None:
+        """
+        Call ``callback(kind, name)`` when another replica changes a context or game.
+
+        Messages are received on a listener thread and handed to the event loop running when the
+        first callback subscribed, so callbacks never run alongside code iterating the caches.
+        """
+        self.subscribers.append(callback)
+        if self.listener is None:
+            try:
+                self.loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.loop = None
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_invalidate})
+            self.listener = pubsub.run_in_thread(sleep_time=0.5, daemon=True)
+
+    def _on_invalidate(self, message: Dict[str, Any]) -> None:
+        event = json.loads(message['data'])
+        if event.get('origin') == self.instance_id:
+            return
+        if self.loop is None:
+            self._invalidate(event)
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._invalidate, event)
+        except RuntimeError:
+            # The loop has closed; nothing is left to invalidate
+            pass
+
+    def _invalidate(self, event: Dict[str, Any]) -> None:
+        list_kind = 'history' if event['kind'] == CONTEXT else 'game_history'
+        self.synced.pop(self.key(list_kind, event['name']), None)
+        for callback in list(self.subscribers):
+            try:
+                callback(event['kind'], event['name'])
+            except Exception as e:
+                logger.error("Invalidation handler failed for %s %s: %s", event['kind'], event['name'], e)
+
+    def close(self) -> None:
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
\ No newline at end of file
@@ -1,59 +1,147 @@
 # storage/tinydb_storage.py
 
+import os
+import time
+from contextlib import nullcontext
 from tinydb import TinyDB, Query
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from utils.logger import get_logger
+from utils.file_lock import InterProcessLock
+from utils.metrics import metrics
+from utils.tracing import tracer
 
 logger = get_logger(__name__)
 
 class TinyDBStorage:
-    def __init__(self, db_path: str = 'all_contexts.json'):
+    def __init__(self, db_path: str = 'all_contexts.json', shared: bool = False):
+        self.db_path = db_path
         self.db = TinyDB(db_path)
         self.Context = Query()
-        logger.info(f"TinyDB storage initialized with database: {db_path}")
+        # Games are kept as a checkpoint of the whole GameState plus the deltas of later turns
+        self.games = self.db.table('games')
+        # When several worker processes share the file, every operation takes a file lock
+        self.shared = shared
+        self.lock = InterProcessLock(f"{db_path}.lock") if shared else nullcontext()
+        logger.info("TinyDB storage initialized with database: %s", db_path)
+
+    def _refresh(self, table=None) -> None:
+        if self.shared:
+            # Query results and the next document id are cached per process; another worker may have written since
+            table = table or self.db.table(self.db.default_table_name)
+            table.clear_cache()
+            table._next_id = None
 
     def save(self, name: str, data: Dict[str, Any]) -> None:
         try:
-            self.db.upsert(data, self.Context.name == name)
-            logger.debug(f"Saved context: {name}")
+            started = time.perf_counter()
+            with tracer.span('storage.save', backend='tinydb', context=name) as span, self.lock:
+                self._refresh()
+                self.db.upsert(data, self.Context.name == name)
+                # TinyDB rewrites the whole file on every write
+                written = os.path.getsize(self.db_path)
+                if span:
+                    span.set_attribute('bytes', written)
+            metrics.observe('storage_write_seconds', time.perf_counter() - started, backend='tinydb')
+            metrics.increment('storage_write_bytes_total', written, backend='tinydb')
+            logger.debug("Saved context: %s", name)
         except Exception as e:
-            logger.error(f"Error saving context {name}: {str(e)}")
+            logger.error("Error saving context %s: %s", name, e)
             raise
 
     def load(self, name: str) -> Dict[str, Any]:
         try:
-            result = self.db.search(self.Context.name == name)
+            with tracer.span('storage.load', backend='tinydb', context=name), self.lock:
+                self._refresh()
+                result = self.db.search(self.Context.name == name)
             if result:
-                logger.debug(f"Loaded context: {name}")
+                logger.debug("Loaded context: %s", name)
                 return result[0]
             else:
-                logger.warning(f"Context not found: {name}")
+                logger.warning("Context not found: %s", name)
                 return None
         except Exception as e:
-            logger.error(f"Error loading context {name}: {str(e)}")
+            logger.error("Error loading context %s: %s", name, e)
             raise
 
     def delete(self, name: str) -> None:
         try:
-            self.db.remove(self.Context.name == name)
-            logger.debug(f"Deleted context: {name}")
+            with self.lock:
+                self.db.remove(self.Context.name == name)
+            logger.debug("Deleted context: %s", name)
         except Exception as e:
-            logger.error(f"Error deleting context {name}: {str(e)}")
+            logger.error("Error deleting context %s: %s", name, e)
             raise
 
+    def list_names(self) -> List[str]:
+        with self.lock:
+            self._refresh()
+            return sorted(context['name'] for context in self.db.all())
+
     def load_all(self) -> List[Dict[str, Any]]:
         try:
-            all_contexts = self.db.all()
-            logger.debug(f"Loaded {len(all_contexts)} contexts")
+            with self.lock:
+                all_contexts = self.db.all()
+            logger.debug("Loaded %s contexts", len(all_contexts))
             return all_contexts
         except Exception as e:
-            logger.error(f"Error loading all contexts: {str(e)}")
+            logger.error("Error loading all contexts: %s", e)
             raise
 
     def clear_all(self) -> None:
         try:
-            self.db.truncate()
+            with self.lock:
+                self.db.truncate()
+                self.games.truncate()
             logger.warning("Cleared all contexts from the database")
         except Exception as e:
-            logger.error(f"Error clearing all contexts: {str(e)}")
-            raise
\ No newline at end of file
+            logger.error("Error clearing all contexts: %s", e)
+            raise
+
+    def save_game(self, name: str, data: Dict[str, Any]) -> None:
+        """Write a checkpoint of a game, replacing its earlier checkpoint and deltas."""
+        try:
+            with tracer.span('storage.save', backend='tinydb', game=name), self.lock:
+                self._refresh(self.games)
+                self.games.upsert({"name": name, **data, "deltas": []}, self.Context.name == name)
+            logger.debug("Saved game checkpoint: %s", name)
+        except Exception as e:
+            logger.error("Error saving game %s: %s", name, e)
+            raise
+
+    def append_game_delta(self, name: str, delta: Dict[str, Any]) -> None:
+        """Add one turn to a game's checkpoint; the game must have been saved with ``save_game``."""
+        try:
+            with tracer.span('storage.save', backend='tinydb', game=name), self.lock:
+                self._refresh(self.games)
+                updated = self.games.update(lambda game: game['deltas'].append(delta), self.Context.name == name)
+            if not updated:
+                raise KeyError(f"No checkpoint for game {name}")
+            logger.debug("Appended game delta: %s", name)
+        except Exception as e:
+            logger.error("Error saving game %s: %s", name, e)
+            raise
+
+    def load_game(self, name: str) -> Optional[Dict[str, Any]]:
+        """The game's checkpoint with its ``deltas``, for ``GameState.from_dict``, or None."""
+        try:
+            with tracer.span('storage.load', backend='tinydb', game=name), self.lock:
+                self._refresh(self.games)
+                result = self.games.search(self.Context.name == name)
+            return result[0] if result else None
+        except Exception as e:
+            logger.error("Error loading game %s: %s", name, e)
+            raise
+
+    def delete_game(self, name: str) -> None:
+        try:
+            with self.lock:
+                self.games.remove(self.Context.name == name)
+            logger.debug("Deleted game: %s", name)
+        except Exception as e:
+            logger.error("Error deleting game %s: %s", name, e)
+            raise
+
+    def list_games(self) -> List[str]:
+        with self.lock:
+            self._refresh(self.games)
+            return [game['name'] for game in self.games.all()]
\ No newline at end of file
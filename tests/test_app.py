@@ -0,0 +1,92 @@
+import asyncio
+import subprocess
+import sys
+import time
+import pytest
+from conversation_manager import ConversationManager
+from manager_instance import Services
+from api.health import Startup
+from main import create_app
+
+class ProbedClient:
+    def __init__(self, delay=0.0, models=('m',), error=None):
+        self.delay = delay
+        self.models = list(models)
+        self.error = error
+
+    async def list_models(self):
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.models
+
+class BlockingClient:
+    def list_models(self):
+        time.sleep(0.3)
+        return ['m']
+
+def make_services(**clients):
+    return Services(ConversationManager(service_clients=clients))
+
+def test_importing_has_no_side_effects():
+    code = "import main, manager_instance; print(manager_instance._services is None)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, timeout=60)
+    assert result.stdout.strip() == 'True', result.stderr
+
+@pytest.mark.asyncio
+async def test_probes_run_concurrently_with_timeouts():
+    services = make_services(fast=ProbedClient(), slow=ProbedClient(delay=5), broken=ProbedClient(error=ConnectionError("refused")),
+                             empty=ProbedClient(models=()), blocking=BlockingClient())
+    startup = Startup(services, {'probe_timeout': 0.2, 'required_services': ['fast']})
+    began = time.perf_counter()
+    await startup.run()
+    assert time.perf_counter() - began < 0.5
+
+    status = startup.status()
+    assert status['ready'] and status['time_to_ready'] is not None
+    assert status['services']['fast'] == {"ok": True, "models": 1, "seconds": status['services']['fast']['seconds']}
+    assert status['services']['slow']['error'] == "No response within 0.2s"
+    assert status['services']['broken']['error'] == "refused"
+    assert status['services']['empty']['error'] == "No models available"
+    # A blocking sync client is probed in a thread, so it times out instead of stalling the loop
+    assert not status['services']['blocking']['ok']
+    assert 'probes' in status['phases']
+
+@pytest.mark.asyncio
+async def test_required_services_are_retried_until_they_answer():
+    client = ProbedClient(error=ConnectionError("refused"))
+    startup = Startup(make_services(ollama=client), {'required_services': ['ollama'], 'retry_interval': 0.05})
+    startup.start()
+    await asyncio.sleep(0.02)
+    assert not startup.ready
+    client.error = None
+    await asyncio.wait_for(startup.task, 1)
+    assert startup.ready
+
+@pytest.mark.asyncio
+async def test_readiness_and_liveness_routes():
+    release = asyncio.Event()
+
+    class GatedClient:
+        async def list_models(self):
+            await release.wait()
+            return ['m']
+
+    app = create_app(make_services(gated=GatedClient()))
+    async with app.test_app() as test_app:
+        client = test_app.test_client()
+        assert (await client.get('/healthz')).status_code == 200
+        response = await client.get('/readyz')
+        assert response.status_code == 503
+        assert (await response.get_json())['ready'] is False
+
+        release.set()
+        for _ in range(50):
+            response = await client.get('/readyz')
+            if response.status_code == 200:
+                break
+            await asyncio.sleep(0.01)
+        status = await response.get_json()
+        assert response.status_code == 200
+        assert status['services']['gated']['ok'] is True
+        assert status['time_to_ready'] > 0
\ No newline at end of file
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import pytest
+from conversation_manager import ConversationManager
+from batch import BatchRunner
+
+class CountingClient:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.prompts = []
+
+    async def generate_response(self, context):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        self.prompts.append(context.history[-1]['content'])
+        return f"echo: {context.history[-1]['content']}"
+
+def write_rows(path, rows):
+    path.write_text('\n'.join(json.dumps(row) for row in rows) + '\n')
+
+@pytest.fixture
+def manager():
+    manager = ConversationManager(service_clients={'groq': CountingClient()})
+    manager.create_context('eval', 'groq', 'test-model', 'System prompt')
+    return manager
+
+@pytest.mark.asyncio
+async def test_batch_runs_rows_with_bounded_concurrency(manager, tmp_path):
+    input_path, output_path = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    write_rows(input_path, [{"context": "eval", "prompt": f"question {i}"} for i in range(10)] + [
+        {"service": "groq", "model": "m", "prompt": "Hello {name}", "variables": {"name": "world"}},
+        {"context": "missing", "prompt": "x"},
+    ])
+
+    summary = await BatchRunner(manager, {'groq': 2}).run(str(input_path), str(output_path))
+
+    client = manager.service_clients['groq']
+    assert client.peak == 2
+    assert summary['succeeded'] == 11
+    assert summary['failed'] == 1
+    assert 'Hello world' in client.prompts
+    # Batch rows never touch the stored context
+    assert len(manager.get_context('eval').history) == 1
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert len(results) == 12
+
+@pytest.mark.asyncio
+async def test_batch_resumes_from_checkpoint(manager, tmp_path):
+    input_path, output_path = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    write_rows(input_path, [{"id": f"row-{i}", "context": "eval", "prompt": f"q{i}"} for i in range(4)])
+    # A previous run finished row-0, failed row-1 and crashed while writing row-2
+    output_path.write_text(
+        json.dumps({"id": "row-0", "status": "ok"}) + '\n' +
+        json.dumps({"id": "row-1", "status": "error"}) + '\n' +
+        '{"id": "row-2", "sta'
+    )
+
+    summary = await BatchRunner(manager).run(str(input_path), str(output_path))
+
+    assert summary['skipped'] == 1
+    assert sorted(manager.service_clients['groq'].prompts) == ['q1', 'q2', 'q3']
+    lines = output_path.read_text().splitlines()
+    assert json.loads(lines[-1])['status'] == 'ok'
+    assert sum(1 for line in lines if line.startswith('{"id": "row-2", "line"')) == 1
+
+class FailingClient:
+    async def generate_response(self, context):
+        raise ConnectionError("provider unavailable")
+
+@pytest.mark.asyncio
+async def test_failed_provider_calls_are_errors_and_retried(manager, tmp_path):
+    input_path, output_path = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    write_rows(input_path, [{"id": "json", "service": "groq", "model": "m",
+                             "prompt": 'Reply as {"name": "{name}"}', "variables": {"name": "Aria"}}])
+    manager.service_clients['groq'] = FailingClient()
+
+    summary = await BatchRunner(manager).run(str(input_path), str(output_path))
+    assert summary['failed'] == 1
+    assert json.loads(output_path.read_text().splitlines()[-1])['error'] == 'provider unavailable'
+
+    # On resume the failed row runs again; braces that are not placeholders are kept
+    manager.service_clients['groq'] = CountingClient()
+    summary = await BatchRunner(manager).run(str(input_path), str(output_path))
+    assert summary['succeeded'] == 1
+    assert manager.service_clients['groq'].prompts == ['Reply as {"name": "Aria"}']
+
+@pytest.mark.asyncio
+async def test_duplicate_ids_are_rejected(manager, tmp_path):
+    input_path, output_path = tmp_path / 'in.jsonl', tmp_path / 'out.jsonl'
+    # The second row's id collides with the line number the third row defaults to
+    write_rows(input_path, [{"id": "a", "context": "eval", "prompt": "x"}, {"id": "3", "context": "eval", "prompt": "y"},
+                            {"context": "eval", "prompt": "z"}])
+    with pytest.raises(ValueError, match="line 3"):
+        await BatchRunner(manager).run(str(input_path), str(output_path))
+    assert manager.service_clients['groq'].prompts == [] and not output_path.exists()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from conversation_manager import ConversationManager
+from api.disconnect import cancel_on_disconnect
+from utils.metrics import metrics
+
+class SlowClient:
+    def __init__(self):
+        self.closed = False
+
+    async def generate_response(self, context):
+        await asyncio.sleep(10)
+        return 'never'
+
+    async def stream_response(self, context):
+        try:
+            yield 'partial '
+            yield 'reply'
+            await asyncio.sleep(10)
+        finally:
+            self.closed = True
+
+def make_manager(persist_incomplete=False):
+    client = SlowClient()
+    manager = ConversationManager(service_clients={'groq': client}, persist_incomplete=persist_incomplete)
+    manager.create_context('test', 'groq', 'test-model', 'System prompt')
+    return manager, client
+
+@pytest.mark.asyncio
+async def test_cancelled_turn_is_discarded():
+    manager, _ = make_manager()
+    task = asyncio.ensure_future(manager.send_prompt('test', 'Hello'))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert [m['role'] for m in manager.get_context('test').history] == ['system']
+
+@pytest.mark.asyncio
+async def test_cancelled_turn_is_marked_incomplete():
+    manager, client = make_manager(persist_incomplete=True)
+    before = metrics.get('generations_cancelled_total', service='groq', reason='disconnect')
+    task = asyncio.ensure_future(manager.send_prompt('test', 'Hello'))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    last = manager.get_context('test').history[-1]
+    assert last == {"role": "assistant", "content": "partial reply", "incomplete": True}
+    assert client.closed
+    assert metrics.get('generations_cancelled_total', service='groq', reason='disconnect') == before + 1
+
+@pytest.mark.asyncio
+async def test_disconnect_cancellation_is_counted():
+    manager, _ = make_manager()
+    before = metrics.get('requests_cancelled_total', route='/send_prompt')
+    # Quart cancels the handler task when the client disconnects
+    handler = asyncio.ensure_future(cancel_on_disconnect(manager.send_prompt('test', 'Hello'), '/send_prompt'))
+    await asyncio.sleep(0.01)
+    handler.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await handler
+    assert metrics.get('requests_cancelled_total', route='/send_prompt') == before + 1
+    assert len(manager.get_context('test').history) == 1
\ No newline at end of file
@@ -0,0 +1,110 @@
+import pytest
+from conversation_manager import ConversationManager
+from cluster.dispatcher import Dispatcher, WorkerProcess, with_label
+from cluster.worker import owned_contexts
+from storage.tinydb_storage import TinyDBStorage
+from utils.hash_ring import HashRing
+
+def test_hash_ring_moves_only_the_new_nodes_share():
+    keys = [f"context-{i}" for i in range(2000)]
+    ring = HashRing(['w0', 'w1', 'w2'])
+    before = {key: ring.get(key) for key in keys}
+    counts = {node: list(before.values()).count(node) for node in ring.nodes}
+    assert min(counts.values()) > 400
+
+    ring.add('w3')
+    moved = [key for key in keys if ring.get(key) != before[key]]
+    assert all(ring.get(key) == 'w3' for key in moved)
+    assert 300 < len(moved) < 700
+
+class FakeDispatcher(Dispatcher):
+    """Talks to in-process managers instead of worker processes."""
+
+    def __init__(self, managers):
+        super().__init__({'workers': 0})
+        self.managers = managers
+        for worker_id in managers:
+            self.workers[worker_id] = WorkerProcess(worker_id, 0)
+            self.ring.add(worker_id)
+
+    async def call(self, worker, method, path, payload=None):
+        manager = self.managers[worker.id]
+        if path == '/cluster/contexts':
+            stored = manager.storage_backend.list_names() if manager.storage_backend else []
+            return {"owned": owned_contexts(manager), "stored": stored}
+        if path == '/cluster/release':
+            released = {name: manager.release_context(name) for name in payload['names']}
+            return {"contexts": {name: data for name, data in released.items() if data}, "games": {}}
+        if path == '/cluster/adopt':
+            for name in payload['names']:
+                manager.adopt_context(name, payload['contexts'].get(name))
+            return {}
+
+@pytest.mark.asyncio
+async def test_rebalance_keeps_each_context_on_its_owner():
+    managers = {worker_id: ConversationManager() for worker_id in ('w0', 'w1')}
+    # Like freshly started workers, both hold every context
+    for manager in managers.values():
+        for i in range(20):
+            manager.create_context(f"ctx-{i}", 'groq', 'model', 'System prompt')
+    dispatcher = FakeDispatcher(managers)
+    await dispatcher.rebalance()
+    assert sum(len(m.contexts) for m in managers.values()) == 20
+
+    owner = dispatcher.owner('ctx-3').id
+    managers[owner].get_context('ctx-3').add_message('user', 'latest turn')
+
+    managers['w2'] = ConversationManager()
+    # The new worker starts with a stale copy of everything
+    for i in range(20):
+        managers['w2'].create_context(f"ctx-{i}", 'groq', 'model', 'System prompt')
+    dispatcher.workers['w2'] = WorkerProcess('w2', 0)
+    await dispatcher.rebalance(add='w2')
+
+    for i in range(20):
+        name = f"ctx-{i}"
+        holders = [worker_id for worker_id, m in managers.items() if name in m.contexts]
+        assert holders == [dispatcher.ring.get(name)]
+    new_owner = managers[dispatcher.ring.get('ctx-3')]
+    assert new_owner.get_context('ctx-3').history[-1]['content'] == 'latest turn'
+
+@pytest.mark.asyncio
+async def test_hibernated_contexts_move_with_their_owner(tmp_path):
+    path = str(tmp_path / 'db.json')
+    managers = {worker_id: ConversationManager(TinyDBStorage(path, shared=True)) for worker_id in ('w0', 'w1')}
+    for i in range(20):
+        managers['w0'].create_context(f"ctx-{i}", 'groq', 'model', 'System prompt')
+    managers['w1'].load_all_contexts()
+    dispatcher = FakeDispatcher(managers)
+    await dispatcher.rebalance()
+    for manager in managers.values():
+        for name in list(manager.contexts):
+            assert manager.hibernate_context(name)
+
+    managers['w2'] = ConversationManager(TinyDBStorage(path, shared=True))
+    dispatcher.workers['w2'] = WorkerProcess('w2', 0)
+    await dispatcher.rebalance(add='w2')
+
+    listed = [ctx['name'] for m in managers.values() for ctx in m.list_contexts()['contexts']]
+    assert sorted(listed) == sorted(f"ctx-{i}" for i in range(20))
+    for i in range(20):
+        name = f"ctx-{i}"
+        assert managers[dispatcher.ring.get(name)].get_context(name) is not None
+
+def test_shared_storage_lists_names_written_by_other_workers(tmp_path):
+    path = str(tmp_path / 'contexts.json')
+    first, second = TinyDBStorage(path, shared=True), TinyDBStorage(path, shared=True)
+    assert second.list_names() == []
+    first.save('b', {"name": "b", "history": []})
+    first.save('a', {"name": "a", "history": []})
+    assert second.list_names() == ['a', 'b']
+
+def test_requests_are_routed_by_context_field():
+    assert Dispatcher.context_of('/game_turn', {"context_name": "a"}) == 'a'
+    assert Dispatcher.context_of('/copy_context', {"source_name": "a", "new_name": "b"}) == 'a'
+    assert Dispatcher.context_of('/jobs', {"type": "send_prompt", "params": {"name": "c"}}) == 'c'
+    assert Dispatcher.context_of('/fan_out', {"prompt": "x"}) is None
+
+def test_worker_label_is_added_to_metric_samples():
+    assert with_label('contexts_loaded 3', 'worker', 'w1') == 'contexts_loaded{worker="w1"} 3'
+    assert with_label('errors_total{error="ValueError"} 2', 'worker', 'w0') == 'errors_total{worker="w0",error="ValueError"} 2'
\ No newline at end of file
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import os
+import pytest
+import yaml
+from api.admission import AdmissionController
+from config.config_loader import Config, ConfigError, get_config
+
+BASE = {
+    'api': {'host': '127.0.0.1', 'port': 5000},
+    'logging': {'level': 'INFO', 'sampling': {}},
+    'admission': {'global': {'limit': 1, 'max_queue': 4}, 'adaptive': {'enabled': False}},
+    'services': {'ollama': {'host': 'localhost', 'api_key': '${CONFIG_TEST_KEY}'}},
+}
+
+def write(path, config):
+    path.write_text(yaml.safe_dump(config))
+    # Some filesystems keep whole-second modification times
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+def edited(**sections):
+    config = yaml.safe_load(yaml.safe_dump(BASE))
+    for section, values in sections.items():
+        config[section].update(values)
+    return config
+
+def test_parsed_once_with_typed_accessors(tmp_path, monkeypatch):
+    monkeypatch.setenv('CONFIG_TEST_KEY', 'secret')
+    path = tmp_path / 'services.yaml'
+    write(path, BASE)
+    config = Config(str(path))
+    path.write_text('not: [valid')
+
+    assert config.get_int('api.port') == 5000
+    assert config.get_str('services.ollama.api_key') == 'secret'
+    assert config.get_bool('console.enabled', True) is True
+    assert config.get_float('tracing.sample_rate', 0.1) == 0.1
+    with pytest.raises(ConfigError):
+        config.get_int('api.host')
+    # Sections are copies, so callers can't change what others read
+    config.section('api')['port'] = 1
+    assert config.get('api.port') == 5000
+    assert get_config() is get_config()
+
+def test_runtime_keys_apply_and_others_wait_for_a_restart(tmp_path):
+    path = tmp_path / 'services.yaml'
+    write(path, BASE)
+    config = Config(str(path))
+    seen = []
+    unsubscribe = config.subscribe('logging', seen.append)
+
+    write(path, edited(logging={'level': 'DEBUG'}, api={'port': 6000}))
+    assert config.changed()
+    assert config.reload() == ['logging.level']
+    assert config.get('logging.level') == 'DEBUG'
+    assert config.get('api.port') == 5000
+    assert seen == [{'level': 'DEBUG', 'sampling': {}}]
+
+    unsubscribe()
+    write(path, edited(logging={'level': 'WARNING'}))
+    config.reload()
+    assert len(seen) == 1
+
+@pytest.mark.parametrize('content', [
+    'logging: [unclosed',
+    yaml.safe_dump(edited(logging={'level': 'LOUD'})),
+    yaml.safe_dump(edited(admission={'global': {'limit': '8', 'max_queue': 4}})),
+    yaml.safe_dump(edited(admission={'global': {'limit': 0, 'max_queue': 4}})),
+    yaml.safe_dump({**BASE, 'logging': 'DEBUG'}),
+])
+def test_invalid_edits_keep_the_running_config(tmp_path, content):
+    path = tmp_path / 'services.yaml'
+    write(path, BASE)
+    config = Config(str(path))
+    path.write_text(content)
+    with pytest.raises(ConfigError):
+        config.reload()
+    assert config.get('logging.level') == 'INFO'
+    assert config.get('admission.global.limit') == 1
+
+@pytest.mark.asyncio
+async def test_watcher_applies_admission_limits(tmp_path, caplog):
+    path = tmp_path / 'services.yaml'
+    write(path, BASE)
+    config = Config(str(path))
+    admission = AdmissionController(config.section('admission'))
+    config.subscribe('admission', admission.reconfigure)
+    limiter = admission.global_limiter
+    await limiter.acquire()
+    waiting = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    watcher = asyncio.create_task(config.watch(0.01))
+    try:
+        with caplog.at_level(logging.ERROR):
+            path.write_text('admission: {global: {limit: nope')
+            await asyncio.sleep(0.05)
+        assert 'Rejected configuration change' in caplog.text
+        write(path, edited(admission={'global': {'limit': 2, 'max_queue': 4}}))
+        await asyncio.wait_for(waiting, 1)
+    finally:
+        watcher.cancel()
+    assert admission.global_limiter is limiter
+    assert limiter.stats() == {"limit": 2, "in_flight": 2, "queued": 0}
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 from conversation_manager import ConversationManager, ConversationContext
 
@@ -28,4 +29,19 @@ def test_get_context(conversation_manager):
     conversation_manager.create_context('test', 'groq', 'test-model', 'System prompt')
     context = conversation_manager.get_context('test')
     assert isinstance(context, ConversationContext)
-    assert context.name == 'test'
\ No newline at end of file
+    assert context.name == 'test'
+
+@pytest.mark.asyncio
+async def test_concurrent_turns_on_a_context_are_serialised(conversation_manager):
+    class EchoClient:
+        async def generate_response(self, context):
+            await asyncio.sleep(0.01)
+            return f"reply to {context.history[-1]['content']}"
+
+    conversation_manager.create_context('test', 'groq', 'test-model', 'System prompt')
+    client = EchoClient()
+    await asyncio.gather(*(conversation_manager.send_prompt('test', f"prompt {i}", client) for i in range(3)))
+    history = conversation_manager.get_context('test').history[1:]
+    assert [message['role'] for message in history] == ['user', 'assistant'] * 3
+    assert all(reply['content'] == f"reply to {prompt['content']}" for prompt, reply in zip(history[::2], history[1::2]))
+    assert len(conversation_manager.turn_locks) == 0
\ No newline at end of file
@@ -0,0 +1,80 @@
+import asyncio
+import time
+import pytest
+from conversation_manager import ConversationManager
+from utils.deadline import (
+    Deadline, DeadlineExceeded, deadline_from_request, set_deadline, reset_deadline, with_deadline
+)
+
+class SlowClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_response(self, context):
+        self.calls += 1
+        await asyncio.sleep(10)
+        return 'never'
+
+CONFIG = {'default': 60, 'max': 120, 'routes': {'/send_prompt': 30}}
+
+def test_deadline_from_body_field_is_consumed():
+    data = {'name': 'test', 'timeout': 5}
+    deadline = deadline_from_request('/send_prompt', {}, data, CONFIG)
+    assert deadline.timeout == 5
+    assert 'timeout' not in data
+
+def test_deadline_from_headers_and_defaults():
+    assert deadline_from_request('/send_prompt', {'X-Request-Timeout': '2.5'}, {}, CONFIG).timeout == 2.5
+    absolute = deadline_from_request('/send_prompt', {'X-Request-Deadline': str(time.time() + 10)}, {}, CONFIG)
+    assert 9 < absolute.timeout <= 10
+    assert deadline_from_request('/send_prompt', {}, {}, CONFIG).timeout == 30
+    assert deadline_from_request('/game_turn', {}, {}, CONFIG).timeout == 60
+    assert deadline_from_request('/game_turn', {'X-Request-Timeout': '900'}, {}, CONFIG).timeout == 120
+
+@pytest.mark.parametrize('headers, data', [
+    ({'X-Request-Timeout': 'nan'}, {}),
+    ({'X-Request-Timeout': 'inf'}, {}),
+    ({'X-Request-Timeout': '-5'}, {}),
+    ({}, {'timeout': 0}),
+    ({'X-Request-Deadline': 'nan'}, {}),
+])
+def test_invalid_caller_timeouts_are_rejected(headers, data):
+    with pytest.raises(ValueError):
+        deadline_from_request('/send_prompt', headers, data, CONFIG)
+    # A propagated deadline that already passed is expired rather than invalid
+    assert deadline_from_request('/send_prompt', {'X-Request-Deadline': str(time.time() - 1)}, {}, CONFIG).expired()
+
+@pytest.mark.asyncio
+async def test_expired_deadline_skips_provider():
+    client = SlowClient()
+    manager = ConversationManager(service_clients={'groq': client})
+    manager.create_context('test', 'groq', 'test-model', 'System prompt')
+
+    token = set_deadline(Deadline(-1))
+    try:
+        with pytest.raises(DeadlineExceeded) as exc_info:
+            await manager.send_prompt('test', 'Hello')
+    finally:
+        reset_deadline(token)
+    assert exc_info.value.stage == 'provider'
+    assert client.calls == 0
+    assert len(manager.get_context('test').history) == 1
+
+@pytest.mark.asyncio
+async def test_slow_provider_times_out():
+    client = SlowClient()
+    manager = ConversationManager(service_clients={'groq': client})
+    manager.create_context('test', 'groq', 'test-model', 'System prompt')
+
+    token = set_deadline(Deadline(0.05))
+    try:
+        with pytest.raises(DeadlineExceeded):
+            await manager.send_prompt('test', 'Hello')
+    finally:
+        reset_deadline(token)
+    assert client.calls == 1
+    assert len(manager.get_context('test').history) == 1
+
+@pytest.mark.asyncio
+async def test_no_deadline_is_passthrough():
+    assert await with_deadline(asyncio.sleep(0, result='done'), 'provider') == 'done'
\ No newline at end of file
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import socket
+import pytest
+from benchmarks.fake_provider import FakeProvider, create_app, serve
+from conversation_manager import ConversationContext
+from game.engine import GameEngine
+from game_settings import get_default_settings
+from services.cerebras_client import CerebrasClient
+from services.groq_client import GroqClient
+from services.ollama_client import OllamaClient
+
+def make_context(service, stream=False, prompt="Hello"):
+    settings = get_default_settings(service)
+    settings.stream = stream
+    return ConversationContext('bench', service, 'fake-model', 'You are a benchmark.', settings,
+                               [{"role": "user", "content": prompt}])
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def test_replies_are_deterministic():
+    first, second = FakeProvider({'seed': 7, 'tokens': 12}), FakeProvider({'seed': 7, 'tokens': 12})
+    messages = [{"role": "user", "content": "Hello"}]
+    replies = [first.plan(messages) for _ in range(3)]
+    assert replies == [second.plan(messages) for _ in range(3)]
+    assert len(replies[0][1]) == 12 and replies[0] != replies[1]
+    assert len(first.plan(messages, max_tokens=5)[1]) == 5
+
+    status, parts = first.plan([{"role": "user", "content": GameEngine(None)._turn_prompt('Look around')}])
+    assert status is None and 'options' in GameEngine(None)._parse_response(''.join(parts))
+
+@pytest.mark.asyncio
+async def test_errors_and_rate_limits():
+    client = create_app(FakeProvider({'rate_limit_rate': 1.0, 'retry_after': 3, 'ttft': 0})).test_client()
+    response = await client.post('/openai/v1/chat/completions', json={"model": "m", "messages": []})
+    assert response.status_code == 429 and response.headers['Retry-After'] == '3'
+
+    client = create_app(FakeProvider({'error_rate': 1.0, 'ttft': 0})).test_client()
+    response = await client.post('/api/chat', json={"model": "m", "messages": [], "stream": False})
+    assert response.status_code == 500
+
+@pytest.mark.asyncio
+async def test_provider_clients_work_against_it():
+    port = free_port()
+    provider = FakeProvider({'tokens': 8, 'ttft': 0.01, 'token_delay': 0.001})
+    shutdown = asyncio.Event()
+    server = asyncio.ensure_future(serve(create_app(provider), '127.0.0.1', port, shutdown.wait))
+    try:
+        for _ in range(100):
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.02)
+        base_url = f"http://127.0.0.1:{port}"
+        clients = {
+            'groq': GroqClient({'api_key': 'fake', 'base_url': base_url, 'max_retries': 0}),
+            # Cerebras' client makes a blocking warm-up request to the server on this loop
+            'cerebras': await asyncio.to_thread(CerebrasClient, {'api_key': 'fake', 'base_url': base_url, 'max_retries': 0}),
+            'ollama': OllamaClient({'host': '127.0.0.1', 'port': port}),
+        }
+        for service, client in clients.items():
+            reply = await client.generate_response(make_context(service))
+            assert len(reply.split()) == 8, (service, reply)
+            chunks = [chunk async for chunk in client.stream_response(make_context(service, stream=True))]
+            assert len(chunks) == 8, (service, chunks)
+        assert await clients['ollama'].list_models() == ['fake-model']
+
+        state = json.loads(await clients['groq'].generate_response(make_context('groq', prompt=GameEngine(None)._start_prompt())))
+        assert state['turn'] == 0
+    finally:
+        shutdown.set()
+        await server
\ No newline at end of file
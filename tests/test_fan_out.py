@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from conversation_manager import ConversationManager
+from api.fan_out import FanOut, prepare_targets
+from utils.deadline import Deadline
+
+class DelayedClient:
+    def __init__(self, delays):
+        self.delays = delays
+        self.seen = []
+
+    async def generate_response(self, context):
+        self.seen.append(context)
+        await asyncio.sleep(self.delays.get(context.model, 0))
+        return f"{context.model} says hi"
+
+@pytest.fixture
+def manager():
+    client = DelayedClient({'fast': 0.01, 'slow': 0.05, 'stuck': 10})
+    manager = ConversationManager(service_clients={'groq': client})
+    manager.create_context('chat', 'groq', 'fast', 'System prompt')
+    return manager
+
+def test_targets_share_prepared_prefix(manager):
+    targets = prepare_targets(manager, 'Hello', [
+        {"service": "groq", "model": "fast"},
+        {"service": "groq", "model": "slow"},
+        {"context": "chat"},
+        {"context": "chat", "model": "slow"},
+    ])
+    assert targets[0].prepared_messages is targets[1].prepared_messages
+    assert targets[2].prepared_messages is targets[3].prepared_messages
+    assert targets[2].prepared_messages[-1] is targets[0].prepared_messages[-1]
+    assert [m['role'] for m in targets[2].prepared_messages] == ['system', 'user']
+    with pytest.raises(ValueError):
+        prepare_targets(manager, 'Hello', [{"context": "missing"}])
+
+@pytest.mark.asyncio
+async def test_results_stream_in_completion_order_and_stragglers_are_cut(manager):
+    targets = prepare_targets(manager, 'Hello', [
+        {"service": "groq", "model": "stuck"},
+        {"service": "groq", "model": "slow"},
+        {"context": "chat"},
+    ])
+    events = [event async for event in FanOut(manager, Deadline(0.2)).run(targets)]
+
+    assert [(e['target'], e['status']) for e in events[:3]] == [(2, 'ok'), (1, 'ok'), (0, 'deadline')]
+    assert events[0]['tokens']['completion'] > 0
+    assert events[-1] == {**events[-1], "type": "summary", "succeeded": 2, "timed_out": 1}
+    # Fan-out never writes the prompt into the stored context
+    assert len(manager.get_context('chat').history) == 1
\ No newline at end of file
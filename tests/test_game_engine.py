@@ -1,16 +1,15 @@
+import json
 import pytest
+from conversation_manager import ConversationManager
 from game.engine import GameEngine
-from game.state import GameState
+from game.state import GameState, _deep_size, apply_delta, diff_state
+from storage.tinydb_storage import TinyDBStorage
 
 @pytest.fixture
-def mock_services(mocker):
-    return {
-        'test_context': mocker.Mock(service='groq')
-    }
-
-@pytest.fixture
-def game_engine(mock_services):
-    return GameEngine(mock_services)
+def game_engine():
+    manager = ConversationManager()
+    manager.create_context('test_context', 'groq', 'test-model', 'System prompt')
+    return GameEngine(manager)
 
 @pytest.mark.asyncio
 async def test_start_game(game_engine, mocker):
@@ -41,7 +40,180 @@ async def test_process_turn(game_engine, mocker):
     assert 'image' in result
     assert 'actions' in result
 
-def test_end_game(game_engine):
+@pytest.mark.asyncio
+async def test_end_game(game_engine):
     game_engine.states['test_context'] = GameState('test_context', {})
-    game_engine.end_game('test_context')
-    assert 'test_context' not in game_engine.states
\ No newline at end of file
+    await game_engine.end_game('test_context')
+    assert 'test_context' not in game_engine.states
+
+class TurnClient:
+    def __init__(self, reply=None):
+        self.turn = 0
+        self.reply = reply
+        self.prompts = []
+
+    async def generate_response(self, context):
+        self.turn += 1
+        self.prompts.append([message["content"] for message in context.history])
+        if self.reply:
+            return json.dumps(self.reply(self.turn))
+        state = {"turn": self.turn, "location": "forest", "inventory": ["cloak"] + ["coin"] * self.turn}
+        if self.turn % 2:
+            state["hint"] = "A voice calls from the river"
+        return json.dumps(state)
+
+def persistent_engine(path, client, interval=3, names=('game',), **config):
+    manager = ConversationManager(TinyDBStorage(path), {'groq': client})
+    for name in names:
+        if not manager.get_context(name):
+            manager.create_context(name, 'groq', 'model', 'You run a game.')
+    return GameEngine(manager, {'checkpoint_interval': interval, **config})
+
+def test_diff_and_apply_delta():
+    old = {"a": 1, "b": [1], "c": "gone"}
+    new = {"a": 1, "b": [1, 2], "d": None}
+    delta = diff_state(old, new)
+    assert delta == {"set": {"d": None}, "unset": ["c"], "nested": {"b": {"extend": [2]}}}
+    assert apply_delta(old, delta) == new
+    assert diff_state({"x": {"y": 1, "z": 2}}, {"x": {"y": 1, "z": 3}}) == {"nested": {"x": {"set": {"z": 3}}}}
+    assert apply_delta(old, diff_state(old, ["not", "a", "dict"])) == ["not", "a", "dict"]
+
+@pytest.mark.asyncio
+async def test_games_survive_a_restart_as_checkpoint_and_deltas(tmp_path):
+    path = str(tmp_path / 'db.json')
+    client = TurnClient()
+    engine = persistent_engine(path, client)
+    await engine.start_game('game')
+    for i in range(4):
+        await engine.process_turn('game', f"step {i}")
+    history = engine.states['game'].get_history()
+    assert [state['turn'] for state in history] == [1, 2, 3, 4, 5]
+
+    # Checkpoints at the start and after the third turn, then one delta
+    stored = engine.conversation_manager.storage_backend.load_game('game')
+    assert stored['current_state']['turn'] == 4 and len(stored['deltas']) == 1
+    assert stored['deltas'][0]['set']['hint'] and stored['deltas'][0]['nested'] == {'inventory': {'extend': ['coin']}}
+
+    restarted = persistent_engine(path, client)
+    assert restarted.states == {} and restarted.list_active_games() == ['game']
+    assert await restarted.get_game_state('game') == history[-1]
+    assert restarted.states['game'].get_history() == history
+    result = await restarted.process_turn('game', 'onwards')
+    assert result['turn'] == 6 and len(restarted.states['game'].get_history()) == 6
+
+    await restarted.end_game('game')
+    assert persistent_engine(path, client).list_active_games() == []
+
+def turn_state(turn):
+    return {"narration": f"Turn {turn}: " + "the lanterns drift between the trees. " * 10,
+            "image": {"top": "Forest", "bottom": "Night", "prompt": f"a forest at night, turn {turn}"},
+            "location": "forest" if turn < 50 else "river", "inventory": ["cloak"] + ["coin"] * (turn // 10),
+            "actions": [{"description": "Look around"}, {"description": "Follow the voice"}]}
+
+def test_compact_history_rebuilds_every_turn_and_rolls_back():
+    # Parsed like a provider's reply, so no strings are shared between turns
+    states = [json.loads(json.dumps(turn_state(turn))) for turn in range(100)]
+    game = GameState('game', states[0], snapshot_interval=8, max_snapshots=4)
+    for state in states[1:]:
+        game.update(state)
+    assert len(game) == 100 and len(game.snapshots) == 4
+    assert game.get_history() == states
+    assert [game.state_at(turn) for turn in (0, 7, 64, 97, 99)] == [states[turn] for turn in (0, 7, 64, 97, 99)]
+    assert GameState.from_dict('game', game.to_dict()).get_history() == states
+    assert len(game.history) == 100 and game.history[-1] == states[99] and game.history[5:8] == states[5:8]
+    usage = game.memory_usage()
+    assert usage["turns"] == 100 and usage["deltas"] == 99 and 0 < usage["bytes"] < _deep_size(states) * 0.75
+
+    deltas = game.deltas
+    game.rollback(30)
+    assert game.deltas is deltas and len(game) == 70 and game.get_current_state() == states[69]
+    game.update(turn_state(500))
+    assert len(game.deltas) == 70 and game.get_history() == states[:70] + [turn_state(500)]
+    assert all(turn <= 70 for turn, _ in game.snapshots)
+    with pytest.raises(ValueError):
+        game.rollback(71)
+
+def test_max_turns_bounds_the_kept_turns():
+    states = [turn_state(turn) for turn in range(100)]
+    game = GameState('game', states[0], snapshot_interval=8, max_snapshots=4, max_turns=20)
+    for state in states[1:]:
+        game.update(state)
+    # Dropped a snapshot interval at a time: turns 72 to 99 are kept
+    assert game.first_turn == 72 and len(game.deltas) == 27 and len(game) == 100
+    assert game.get_history() == states[72:] and game.state_at(80) == states[80]
+    with pytest.raises(IndexError):
+        game.state_at(71)
+    game.rollback(27)
+    assert game.get_current_state() == states[72]
+    with pytest.raises(ValueError):
+        game.rollback(1)
+
+    data = game.to_dict()
+    assert data['first_turn'] == 72 and data['base'] == states[72] and data['turns'] == []
+    restored = GameState.from_dict('game', {**data, "deltas": game.deltas[:5]}, max_turns=20)
+    assert restored.get_history() == states[72:78]
+
+@pytest.mark.asyncio
+async def test_idle_and_excess_games_hibernate_and_come_back(tmp_path):
+    engine = persistent_engine(str(tmp_path / 'db.json'), TurnClient(), names=('a', 'b', 'c'),
+                               idle_timeout=60, max_resident=2)
+    manager = engine.conversation_manager
+    for name in ('a', 'b', 'c'):
+        await engine.start_game(name)
+        await engine.process_turn(name, 'look')
+    engine.last_used.update({'a': 100.0, 'b': 200.0, 'c': 300.0})
+
+    # Over the cap: the least recently used goes, even though none is idle yet
+    assert await engine.sweep(now=150.0) == ['a']
+    assert 'a' not in engine.states and 'a' not in manager.contexts
+    assert [ctx['name'] for ctx in manager.list_contexts()['contexts']] == ['b', 'c', 'a']
+
+    # A game in the middle of a turn is left alone
+    async with manager.context_lock('b'):
+        assert await engine.sweep(now=1000.0) == ['c']
+    assert engine.session_counts() == {"resident": 1, "hibernated": 2, "hibernated_total": 2, "rehydrated_total": 0}
+
+    result = await engine.process_turn('a', 'wake up')
+    assert 'error' not in result and len(engine.states['a']) == 3
+    assert len(manager.get_context('a').history) == 7
+    assert engine.session_counts()["rehydrated_total"] == 1 and engine.hibernated == {'c'}
+
+@pytest.mark.asyncio
+async def test_turns_send_a_slim_history_and_store_it_in_full():
+    client = TurnClient(turn_state)
+    manager = ConversationManager(service_clients={'groq': client})
+    manager.create_context('game', 'groq', 'model', 'You run a game.')
+    engine = GameEngine(manager, {'projection': {'verbatim_turns': 2, 'summarized_turns': 10, 'narration_chars': 60}})
+    await engine.start_game('game')
+    for turn in range(40):
+        await engine.process_turn('game', f"go {turn}")
+
+    sent = client.prompts[-1]
+    # System prompt, 10 summarized turns, 2 verbatim turns and the new prompt
+    assert len(sent) == 1 + 2 * 10 + 2 * 2 + 1
+    assert sent[1] == "Player action: go 27"
+    summary = json.loads(sent[2])
+    assert 'image' not in summary and 'actions' not in summary and summary['location'] == 'forest'
+    assert summary['narration'].endswith('...') and len(summary['narration']) <= 63
+    assert sent[-5] == engine._turn_prompt('go 37') and json.loads(sent[-4]) == turn_state(39)
+    assert sent[-1] == engine._turn_prompt('go 39')
+    # Prompts stop growing, while the stored history keeps every reply
+    assert sum(map(len, client.prompts[-1])) <= sum(map(len, client.prompts[20])) * 1.1
+    history = manager.get_context('game').history
+    assert len(history) == 1 + 2 * 41 and json.loads(history[2]['content']) == turn_state(1)
+    assert engine._action_of(history[1]['content']) == 'start the adventure'
+    assert engine._action_of('Tell me a joke') is None
+
+@pytest.mark.asyncio
+async def test_deleting_a_context_ends_its_game(tmp_path):
+    engine = persistent_engine(str(tmp_path / 'db.json'), TurnClient(), names=('a', 'b'))
+    manager, storage = engine.conversation_manager, engine.conversation_manager.storage_backend
+    for name in ('a', 'b'):
+        await engine.start_game(name)
+        await engine.process_turn(name, 'look')
+    assert engine.hibernate('b')
+
+    for name in ('a', 'b'):
+        assert manager.delete_context(name)['success']
+    assert engine.states == {} and engine.hibernated == set()
+    assert storage.list_games() == [] and engine.session_counts()["resident"] == 0
\ No newline at end of file
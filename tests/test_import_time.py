@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SDKS = ('groq', 'ollama', 'cerebras')
+
+# Cumulative import time, in seconds, allowed for the modules short-lived commands start from.
+# Importing every provider SDK eagerly took about 0.7s on its own.
+IMPORT_BUDGETS = {'manager_instance': 0.5, 'batch.runner': 0.5}
+
+def run(code, *flags):
+    result = subprocess.run([sys.executable, *flags, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result
+
+def test_provider_sdks_are_imported_on_first_use():
+    code = (
+        "import sys, main, manager_instance\n"
+        "from services import ServiceClients\n"
+        f"loaded = lambda: sorted(m for m in {SDKS!r} if m in sys.modules)\n"
+        "clients = ServiceClients({'groq': {'api_key': 'test'}, 'ollama': {}})\n"
+        "print(loaded(), sorted(clients), sorted(clients.loaded()))\n"
+        "clients['groq']\n"
+        "print(loaded(), sorted(clients.loaded()))\n"
+    )
+    before, after = run(code).stdout.splitlines()
+    assert before == "[] ['groq', 'ollama'] []"
+    assert after == "['groq'] ['groq']"
+
+def test_import_time_budget():
+    for module, budget in IMPORT_BUDGETS.items():
+        # The first run may still be writing bytecode caches
+        run(f"import {module}")
+        lines = run(f"import {module}", '-X', 'importtime').stderr.splitlines()
+        cumulative = next(int(line.split('|')[1]) for line in reversed(lines) if line.split('|')[-1].strip() == module)
+        assert cumulative / 1e6 < budget, f"importing {module} took {cumulative / 1e6:.2f}s (budget {budget}s)"
\ No newline at end of file
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from api.jobs import JobManager, is_local_url
+from api.admission import AdmissionRejected
+
+@pytest.mark.asyncio
+async def test_jobs_run_by_priority_and_long_poll():
+    manager = JobManager({'workers': 1})
+    order = []
+
+    async def echo(params, tenant):
+        order.append(params['value'])
+        return {"value": params['value'], "tenant": tenant}
+
+    manager.register('echo', echo, required=('value',))
+    manager.start()
+    try:
+        low = manager.submit('echo', {'value': 'low'}, priority=9)
+        high = manager.submit('echo', {'value': 'high'}, priority=0, tenant='game')
+        job = await manager.wait(low.id, timeout=1)
+    finally:
+        await manager.stop()
+
+    assert order == ['high', 'low']
+    assert job.status == 'succeeded'
+    assert manager.get(high.id).result == {"value": 'high', "tenant": 'game'}
+
+@pytest.mark.asyncio
+async def test_job_validation_and_queue_bound():
+    manager = JobManager({'workers': 1, 'max_queued': 1})
+    manager.register('echo', lambda params, tenant: asyncio.sleep(0), required=('value',))
+    manager.start()
+    try:
+        with pytest.raises(ValueError):
+            manager.submit('echo', {})
+        with pytest.raises(ValueError):
+            manager.submit('echo', {'value': 1}, webhook='http://example.com/hook')
+        manager.submit('echo', {'value': 1})
+        with pytest.raises(AdmissionRejected):
+            manager.submit('echo', {'value': 2})
+    finally:
+        await manager.stop()
+
+@pytest.mark.asyncio
+async def test_queued_jobs_are_counted_as_they_start_or_are_cancelled():
+    manager = JobManager({'workers': 1})
+    release = asyncio.Event()
+
+    async def blocked(params, tenant):
+        await release.wait()
+
+    manager.register('blocked', blocked)
+    manager.start()
+    try:
+        first, second, third = (manager.submit('blocked', {}) for _ in range(3))
+        assert manager.queued() == 3
+        await asyncio.sleep(0.01)
+        assert first.status == 'running' and manager.queued() == 2
+        manager.cancel(third.id)
+        assert manager.queued() == 1
+        release.set()
+        await manager.wait(second.id, timeout=1)
+        assert second.status == 'succeeded' and manager.queued() == 0
+    finally:
+        await manager.stop()
+
+@pytest.mark.asyncio
+async def test_running_job_can_be_cancelled_and_expires():
+    manager = JobManager({'workers': 1, 'result_ttl': 0})
+
+    async def slow(params, tenant):
+        await asyncio.sleep(10)
+
+    manager.register('slow', slow)
+    manager.start()
+    try:
+        job = manager.submit('slow', {})
+        await asyncio.sleep(0.01)
+        assert job.status == 'running'
+        manager.cancel(job.id)
+        await asyncio.wait_for(job.done.wait(), 1)
+    finally:
+        await manager.stop()
+
+    assert job.status == 'cancelled'
+    await asyncio.sleep(0.01)
+    assert manager.get(job.id) is None
+
+def test_webhooks_are_loopback_only():
+    assert is_local_url('http://127.0.0.1:8080/done')
+    assert is_local_url('http://localhost/done')
+    assert not is_local_url('http://10.0.0.5/done')
+    assert not is_local_url('file:///etc/passwd')
\ No newline at end of file
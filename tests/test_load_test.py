@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from benchmarks.fake_provider import FakeProvider, create_app as create_provider_app, serve
+from benchmarks.load_test import LoadTest, parse_mix, percentiles, response_error
+from conversation_manager import ConversationManager
+from manager_instance import Services
+from main import create_app
+from services.groq_client import GroqClient
+from tests.test_fake_provider import free_port
+
+def test_percentiles_and_errors():
+    stats = percentiles([i / 1000 for i in range(1, 101)])
+    assert (stats['p50'], stats['p90'], stats['p99'], stats['max']) == (50.0, 90.0, 99.0, 100.0)
+    assert percentiles([])['p50'] is None
+    assert parse_mix('send_prompt=3,list_contexts') == {'send_prompt': 3.0, 'list_contexts': 1.0}
+    with pytest.raises(ValueError):
+        parse_mix('delete_everything=1')
+
+    assert response_error(429, b'{}') == 'HTTP 429'
+    assert response_error(200, b'{"game_response": {"error": "No active game"}}') == 'error in response'
+    assert response_error(200, b'{"success": true}') is None
+    assert response_error(200, b'{"type": "result", "status": "error"}\n{"type": "summary"}\n') == 'target error'
+
+@pytest.mark.asyncio
+async def test_closed_loop_against_the_app():
+    provider_port, server_port = free_port(), free_port()
+    shutdown = asyncio.Event()
+    provider = FakeProvider({'tokens': 8, 'ttft': 0.005, 'token_delay': 0.0})
+    client = GroqClient({'api_key': 'fake', 'base_url': f"http://127.0.0.1:{provider_port}", 'max_retries': 0})
+    app = create_app(Services(ConversationManager(service_clients={'groq': client})))
+    servers = [asyncio.ensure_future(serve(create_provider_app(provider), '127.0.0.1', provider_port, shutdown.wait)),
+               asyncio.ensure_future(serve(app, '127.0.0.1', server_port, shutdown.wait))]
+    try:
+        await asyncio.sleep(0.5)
+        report = await LoadTest(f"http://127.0.0.1:{server_port}", {
+            'contexts': 3, 'concurrency': 3, 'requests': 24, 'duration': 30,
+            'mix': {'send_prompt': 2, 'game_turn': 1, 'list_contexts': 1},
+        }).run()
+    finally:
+        shutdown.set()
+        await asyncio.gather(*servers)
+
+    assert report['mode'] == 'closed'
+    assert report['setup']['routes']['create_context']['requests'] == 3
+    assert report['setup']['routes']['start_game']['errors'] == 0
+    load = report['load']
+    assert load['requests'] == 24 and load['errors'] == 0, load['errors_by_cause']
+    assert set(load['routes']) <= {'send_prompt', 'game_turn', 'list_contexts'}
+    assert load['latency_ms']['p99'] >= load['latency_ms']['p50'] > 0
+    assert report['server_rss_mb'] is None
\ No newline at end of file
@@ -0,0 +1,79 @@
+import json
+import logging
+import queue
+from services.base_client import ServiceClient, redact
+from utils.logger import JsonFormatter, RequestQueueHandler, ThrottleFilter, set_request_id, reset_request_id
+
+def make_logger(name, *filters):
+    handler = RequestQueueHandler(queue.Queue(3))
+    for f in filters:
+        handler.addFilter(f)
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger, handler
+
+def drain(handler):
+    records = []
+    while not handler.queue.empty():
+        records.append(handler.queue.get_nowait())
+    return records
+
+def test_records_carry_request_id_and_format_as_json():
+    logger, handler = make_logger('test.json')
+    token = set_request_id('req-1')
+    try:
+        args = ['turn']
+        logger.info("Processed %s", args)
+        args.append('changed')
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Failed")
+    finally:
+        reset_request_id(token)
+    first, second = [json.loads(JsonFormatter().format(r)) for r in drain(handler)]
+    # Arguments are merged when logged, not when the writer thread gets to the record
+    assert first['message'] == "Processed ['turn']"
+    assert first['request_id'] == 'req-1' and first['logger'] == 'test.json'
+    assert second['level'] == 'ERROR' and 'ValueError: boom' in second['exception']
+
+def test_full_queue_drops_instead_of_blocking():
+    logger, handler = make_logger('test.full')
+    for i in range(5):
+        logger.info("message %d", i)
+    assert len(drain(handler)) == 3
+    assert handler.dropped == 2
+
+def test_sampling_and_rate_limits_by_logger_prefix():
+    throttle = ThrottleFilter(sampling={'test.sampled': 0.25}, rate_limits={'test.limited': 2})
+    sampled, sampled_handler = make_logger('test.sampled.child', throttle)
+    sampled_handler.queue = queue.Queue()
+    for i in range(8):
+        sampled.debug("sample %d", i)
+    sampled.warning("never sampled")
+    kept = drain(sampled_handler)
+    assert [r.msg for r in kept] == ["sample 0", "sample 4", "never sampled"]
+    assert kept[1].suppressed == 3
+
+    limited, limited_handler = make_logger('test.limited', throttle)
+    limited_handler.queue = queue.Queue()
+    for i in range(10):
+        limited.info("burst %d", i)
+    assert [r.msg for r in drain(limited_handler)] == ["burst 0", "burst 1"]
+
+def test_service_config_is_redacted():
+    class Client(ServiceClient):
+        async def generate_response(self, context):
+            return ''
+
+        async def list_models(self):
+            return []
+
+        async def get_model_info(self, model_name):
+            return {}
+
+    client = Client({'api_key': 'sk-secret', 'models': ['m']})
+    assert 'sk-secret' not in str(client)
+    assert redact({'api_key': 'sk-secret', 'host': 'localhost', 'token': ''}) == {'api_key': '***', 'host': 'localhost', 'token': ''}
\ No newline at end of file
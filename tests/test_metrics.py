@@ -0,0 +1,71 @@
+import threading
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+import pytest
+from services.groq_client import GroqClient
+from utils.metrics import Metrics, metrics
+from utils.instrumentation import timed_generate, timed_stream
+
+def test_counters_from_several_threads_are_merged():
+    registry = Metrics()
+
+    def work():
+        for _ in range(10000):
+            registry.increment('requests_total', route='/send_prompt')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    registry.increment('requests_total', route='/send_prompt')
+    assert registry.get('requests_total', route='/send_prompt') == 40001
+
+def test_render_prometheus_text():
+    registry = Metrics()
+    registry.increment('errors_total', error='ValueError')
+    registry.adjust_gauge('in_flight', 1)
+    registry.register_gauge('contexts_loaded', lambda: 3)
+    for value in (0.02, 0.2, 2, 200):
+        registry.observe('latency_seconds', value, (0.1, 1, 10), route='/a"b')
+
+    text = registry.render()
+    assert '# TYPE errors_total counter\nerrors_total{error="ValueError"} 1\n' in text
+    assert '# TYPE in_flight gauge\nin_flight 1\n' in text
+    assert 'contexts_loaded 3\n' in text
+    assert '# TYPE latency_seconds histogram\n' in text
+    assert 'latency_seconds_bucket{route="/a\\"b",le="0.1"} 1\n' in text
+    assert 'latency_seconds_bucket{route="/a\\"b",le="10"} 3\n' in text
+    assert 'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4\n' in text
+    assert 'latency_seconds_count{route="/a\\"b"} 4\n' in text
+
+class StreamingClient:
+    async def stream_response(self, context):
+        for chunk in ('Hello ', 'there, ', 'traveller'):
+            yield chunk
+
+@pytest.mark.asyncio
+async def test_timed_stream_records_first_token_and_rate():
+    metrics.reset()
+    context = SimpleNamespace(service='groq', model='m')
+    chunks = [chunk async for chunk in timed_stream(StreamingClient(), context)]
+    assert ''.join(chunks) == 'Hello there, traveller'
+    assert metrics.get_histogram('provider_time_to_first_token_seconds', service='groq', model='m')['count'] == 1
+    assert metrics.get_histogram('provider_request_duration_seconds', service='groq', model='m')['count'] == 1
+    assert metrics.get('provider_completion_tokens_total', service='groq', model='m') > 0
+
+@pytest.mark.asyncio
+async def test_provider_failures_are_counted():
+    metrics.reset()
+    client = GroqClient({'api_key': 'test_key'})
+    client.client.chat.completions.create = AsyncMock(side_effect=ConnectionError("provider unavailable"))
+    settings = SimpleNamespace(stream=False, temperature=0.7, max_tokens=50, top_p=1.0)
+    context = SimpleNamespace(service='groq', model='m', history=[], settings=settings)
+
+    with pytest.raises(ConnectionError):
+        await timed_generate(client, context)
+    settings.stream = True
+    with pytest.raises(ConnectionError):
+        async for _ in timed_stream(client, context):
+            pass
+    assert metrics.get('provider_errors_total', error='ConnectionError', service='groq', model='m') == 2
\ No newline at end of file
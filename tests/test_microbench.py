@@ -0,0 +1,31 @@
+import json
+from benchmarks.microbench import compare, main
+
+def result(median_us, peak_kib):
+    return {"loops": 1, "best_us": median_us, "median_us": median_us, "ops_per_s": 1, "peak_kib": peak_kib,
+            "retained_kib": 0}
+
+def test_compare_flags_time_and_memory_regressions():
+    baseline = {"results": {"fast": result(10, 100), "big": result(10, 100), "noise": result(10, 1), "gone": result(1, 1)}}
+    current = {"results": {"fast": result(13, 100), "big": result(10, 200), "noise": result(11, 3),
+                           "new": result(1, 1), "skipped": {"skipped": "file too large"}}}
+    regressions = compare(current, baseline, 0.2)
+    assert [(r["case"], r["metric"]) for r in regressions] == [("fast", "median_us"), ("big", "peak_kib")]
+    assert regressions[0]["change"] == 0.3
+
+def test_run_and_compare_against_saved_baseline(tmp_path, capsys):
+    baseline = tmp_path / 'baseline.json'
+    options = ['--filter', 'game.parse', '--filter', 'storage', '--contexts', '50', '--history', '2',
+               '--repeat', '2', '--min-time', '0.001']
+    assert main(options + ['--save', str(baseline)]) == 0
+    report = json.loads(baseline.read_text())
+    assert set(report["results"]) == {"game.parse[clean]", "game.parse[messy]", "game.parse[no json]",
+                                      "storage.save[contexts=50,history=2]", "storage.load_all[contexts=50,history=2]"}
+    assert all(r["median_us"] > 0 and r["loops"] >= 1 for r in report["results"].values())
+
+    # A baseline recorded on a much faster machine makes every case a regression
+    for case in report["results"].values():
+        case["median_us"] /= 100
+    baseline.write_text(json.dumps(report))
+    assert main(options + ['--compare', str(baseline), '--output', str(tmp_path / 'run.json')]) == 1
+    assert len(json.loads((tmp_path / 'run.json').read_text())["regressions"]) >= 5
\ No newline at end of file
@@ -0,0 +1,75 @@
+import asyncio
+import marshal
+import pytest
+from types import SimpleNamespace
+from utils.profiling import Profiler, ProfilerBusy, footprint
+
+def busy_loop():
+    total = 0
+    for i in range(20000):
+        total += i * i
+    return total
+
+async def workload(seconds):
+    loop = asyncio.get_running_loop()
+    end = loop.time() + seconds
+    while loop.time() < end:
+        busy_loop()
+        await asyncio.sleep(0)
+
+@pytest.mark.asyncio
+async def test_sampling_collapsed_stacks():
+    profiler = Profiler({'sample_interval': 0.001})
+    task = asyncio.create_task(workload(0.3))
+    body, content_type = await profiler.run(0.2, 'sampling', 'collapsed')
+    await task
+    assert content_type.startswith('text/plain')
+    lines = body.splitlines()
+    assert any('busy_loop (test_profiling.py' in line for line in lines)
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) > 0 and ';' in stack
+
+@pytest.mark.asyncio
+async def test_cprofile_top_and_pstats():
+    profiler = Profiler()
+    task = asyncio.create_task(workload(0.3))
+    report, _ = await profiler.run(0.1, 'cprofile', 'top', top=10)
+    assert 'busy_loop' in report
+    raw, content_type = await profiler.run(0.1, 'cprofile', 'pstats')
+    await task
+    assert content_type == 'application/octet-stream'
+    assert any(function == 'busy_loop' for _, _, function in marshal.loads(raw))
+
+@pytest.mark.asyncio
+async def test_memory_report_includes_state_sizes():
+    manager = SimpleNamespace(contexts={'a': SimpleNamespace(history=[{'content': 'hi'}])})
+    engine = SimpleNamespace(states={})
+    profiler = Profiler(memory_sources=lambda: footprint(manager, engine))
+
+    async def grow():
+        await asyncio.sleep(0.02)
+        manager.contexts['a'].history.append({'content': 'x' * 100000})
+
+    task = asyncio.create_task(grow())
+    report, _ = await profiler.run(0.1, 'sampling', 'top', memory=True)
+    await task
+    assert 'Memory growth over 0.1s' in report
+    assert 'test_profiling.py' in report
+    assert 'messages: 1 -> 2' in report
+    assert 'message_chars: 2 -> 100002' in report
+
+@pytest.mark.asyncio
+async def test_invalid_options_and_concurrent_runs():
+    profiler = Profiler({'max_seconds': 1, 'admin_token': 'secret'})
+    assert profiler.authorized('secret') and not profiler.authorized('wrong') and not profiler.authorized(None)
+    assert not Profiler().authorized('')
+    for kwargs in ({'seconds': 5}, {'mode': 'perf'}, {'mode': 'sampling', 'output': 'pstats'},
+                   {'mode': 'cprofile', 'output': 'collapsed'}, {'mode': 'cprofile', 'output': 'pstats', 'memory': True}):
+        with pytest.raises(ValueError):
+            await profiler.run(**{'seconds': 0.1, **kwargs})
+
+    first = asyncio.create_task(profiler.run(0.1))
+    await asyncio.sleep(0)
+    with pytest.raises(ProfilerBusy):
+        await profiler.run(0.1)
+    await first
\ No newline at end of file
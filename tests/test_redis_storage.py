@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import pytest
+from conversation_manager import ConversationManager
+from game.engine import GameEngine
+
+fakeredis = pytest.importorskip('fakeredis')
+from storage.redis_storage import RedisStorage, LockTimeout
+
+GAME_JSON = '{"narration": "You wake up", "actions": [{"description": "Look"}]}'
+
+class FakeClient:
+    def __init__(self, delay=0):
+        self.delay = delay
+
+    async def generate_response(self, context):
+        await asyncio.sleep(self.delay)
+        return GAME_JSON
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+def replica(server, delay=0, **options):
+    storage = RedisStorage(client=fakeredis.FakeRedis(server=server, decode_responses=True), **options)
+    manager = ConversationManager(storage, {'groq': FakeClient(delay)}, replicated=True)
+    return manager, GameEngine(manager)
+
+async def eventually(check, timeout=3):
+    for _ in range(int(timeout / 0.05)):
+        if check():
+            return
+        await asyncio.sleep(0.05)
+    assert check()
+
+def test_saves_append_only_new_messages(server):
+    storage = RedisStorage(client=fakeredis.FakeRedis(server=server, decode_responses=True))
+    data = {"name": "a", "service": "groq", "model": "m", "system_prompt": "s", "settings": {},
+            "history": [{"role": "system", "content": "s"}]}
+    storage.save('a', data)
+    data["history"].append({"role": "user", "content": "hi"})
+    storage.client.lset(storage.key('history', 'a'), 0, '{"role": "system", "content": "kept"}')
+    storage.save('a', data)
+    # Only the new message was pushed; the first entry was not rewritten
+    assert [m["content"] for m in storage.load('a')["history"]] == ["kept", "hi"]
+
+    data["history"] = data["history"][:1]
+    storage.save('a', data)
+    assert storage.load('a')["history"] == [{"role": "system", "content": "s"}]
+    assert storage.list_names() == ['a']
+
+def test_games_are_rewritten_when_their_base_moves(server):
+    storage = RedisStorage(client=fakeredis.FakeRedis(server=server, decode_responses=True))
+    deltas = [{"set": {"turn": turn}} for turn in range(1, 4)]
+    storage.save_game('g', {"current_state": {"turn": 2}, "first_turn": 0, "base": {"turn": 0}, "turns": deltas[:2]})
+    storage.save_game('g', {"current_state": {"turn": 3}, "first_turn": 0, "base": {"turn": 0}, "turns": deltas})
+    storage.save_game('g', {"current_state": {"turn": 3}, "first_turn": 2, "base": {"turn": 2}, "turns": deltas[2:]})
+    stored = RedisStorage(client=fakeredis.FakeRedis(server=server, decode_responses=True)).load_game('g')
+    assert stored == {"current_state": {"turn": 3}, "first_turn": 2, "base": {"turn": 2}, "turns": deltas[2:]}
+
+@pytest.mark.asyncio
+async def test_replicas_share_contexts_and_games(server):
+    manager_a, engine_a = replica(server)
+    manager_b, engine_b = replica(server)
+    manager_a.create_context('shared', 'groq', 'm', 'System prompt')
+    assert manager_b.get_context('shared') is not None
+
+    await engine_a.start_game('shared')
+    result = await engine_b.process_turn('shared', 'Look')
+    assert result['narration'] == 'You wake up'
+    assert len(engine_a.conversation_manager.storage_backend.load_game('shared')['turns']) == 1
+
+    # B's turn invalidates A's cached context and game
+    await eventually(lambda: 'shared' not in manager_a.contexts and 'shared' not in engine_a.states)
+    assert len(manager_a.get_context('shared').history) == 5
+
+@pytest.mark.asyncio
+async def test_invalidations_are_handled_on_the_event_loop(server):
+    manager_a, _ = replica(server)
+    manager_b, _ = replica(server)
+    threads = []
+    manager_a.storage_backend.subscribe(lambda kind, name: threads.append(threading.current_thread()))
+    manager_b.create_context('shared', 'groq', 'm', 'System prompt')
+    await eventually(lambda: threads)
+    assert threads == [threading.main_thread()]
+
+@pytest.mark.asyncio
+async def test_turns_on_one_context_are_serialised_across_replicas(server):
+    manager_a, _ = replica(server, delay=0.1)
+    manager_b, _ = replica(server, delay=0.1)
+    manager_a.create_context('shared', 'groq', 'm', 'System prompt')
+    await asyncio.gather(manager_a.send_prompt('shared', 'one'), manager_b.send_prompt('shared', 'two'))
+    roles = [message['role'] for message in manager_a.refresh_context('shared').history]
+    assert roles == ['system', 'user', 'assistant', 'user', 'assistant']
+
+@pytest.mark.asyncio
+async def test_lock_wait_is_bounded(server):
+    storage = RedisStorage(client=fakeredis.FakeRedis(server=server, decode_responses=True), lock_wait=0.1)
+    async with storage.lock('a'):
+        with pytest.raises(LockTimeout):
+            await storage.lock('a').acquire()
+    async with storage.lock('a'):
+        pass
+
+@pytest.mark.asyncio
+async def test_deleting_a_context_drops_its_game_on_the_event_loop(server):
+    manager_a, engine_a = replica(server)
+    manager_b, engine_b = replica(server)
+    manager_a.create_context('shared', 'groq', 'm', 'System prompt')
+    await engine_a.start_game('shared')
+    assert await engine_b.has_game('shared')
+    threads, events = [], []
+    manager_a.add_delete_listener(lambda name: threads.append(threading.current_thread()))
+    engine_a.add_listener(lambda name, event, source: events.append(event['type']))
+
+    assert (await manager_a.remove_context('shared'))['success']
+    assert threads == [threading.main_thread()] and events == ['game_ended'] and engine_a.states == {}
+    assert manager_a.storage_backend.load_game('shared') is None
+    await eventually(lambda: 'shared' not in engine_b.states)
\ No newline at end of file
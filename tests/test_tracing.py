@@ -0,0 +1,99 @@
+import asyncio
+import json
+import pytest
+from utils.tracing import Tracer, JsonlSpanExporter, OtlpSpanExporter, Span, Trace
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def submit(self, spans):
+        self.spans.extend(spans)
+
+    def shutdown(self):
+        pass
+
+def make_tracer(sample_rate=1.0, slow_request_seconds=None):
+    tracer = Tracer()
+    tracer.enabled = True
+    tracer.sample_rate = sample_rate
+    tracer.slow_request_seconds = slow_request_seconds
+    tracer.exporter = ListExporter()
+    return tracer
+
+@pytest.mark.asyncio
+async def test_spans_follow_the_request_into_tasks():
+    tracer = make_tracer()
+
+    async def provider_call():
+        with tracer.span('provider.generate'):
+            await asyncio.sleep(0.01)
+
+    with tracer.trace('POST /game_turn'):
+        with tracer.span('admission.wait'):
+            pass
+        await asyncio.wait_for(asyncio.create_task(provider_call()), 1)
+
+    spans = {span.name: span for span in tracer.exporter.spans}
+    root = spans['POST /game_turn']
+    assert root.parent_id is None
+    assert spans['admission.wait'].parent_id == root.span_id
+    assert spans['provider.generate'].parent_id == root.span_id
+    assert spans['provider.generate'].duration >= 0.01
+    assert {span.trace.id for span in spans.values()} == {root.trace.id}
+
+def test_sampling_and_slow_requests():
+    tracer = make_tracer(sample_rate=0.0)
+    with tracer.trace('GET /list_contexts') as root:
+        assert root is None
+        with tracer.span('storage.load') as span:
+            assert span is None
+    assert tracer.exporter.spans == []
+
+    # A caller's sampled traceparent wins over the local rate
+    token = tracer.start_trace('POST /send_prompt', '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01')
+    tracer.end_trace(token)
+    assert tracer.exporter.spans[0].trace.id == '0af7651916cd43dd8448eb211c80319c'
+    assert tracer.exporter.spans[0].parent_id == 'b7ad6b7169203331'
+
+    slow = make_tracer(sample_rate=0.0, slow_request_seconds=0.5)
+    with slow.trace('fast'):
+        with slow.span('storage.save'):
+            pass
+    assert slow.exporter.spans == []
+    slow.slow_request_seconds = 0.0
+    with slow.trace('slow'):
+        with slow.span('storage.save'):
+            pass
+    assert [span.name for span in slow.exporter.spans] == ['storage.save', 'slow']
+
+def test_errors_are_recorded_on_the_span():
+    tracer = make_tracer()
+    with pytest.raises(ValueError):
+        with tracer.trace('POST /game_turn'):
+            with tracer.span('game.parse'):
+                raise ValueError("No JSON object found in response")
+    assert [span.error for span in tracer.exporter.spans] == ["ValueError: No JSON object found in response"] * 2
+
+def test_jsonl_exporter_rolls_over(tmp_path):
+    path = str(tmp_path / 'spans.jsonl')
+    exporter = JsonlSpanExporter(path, max_bytes=200, backups=2, flush_interval=0.01)
+    exporter.shutdown()
+    trace = Trace('a' * 32, True)
+    for batch in range(4):
+        span = Span(trace, f"stage-{batch}")
+        span.end_ns = span.start_ns + 1000
+        exporter.export([span])
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['spans.jsonl', 'spans.jsonl.1', 'spans.jsonl.2']
+    assert json.loads(open(path).readline())['name'] == 'stage-3'
+
+def test_otlp_encoding():
+    exporter = OtlpSpanExporter(flush_interval=0.01)
+    exporter.shutdown()
+    trace = Trace('a' * 32, True)
+    span = Span(trace, 'provider.generate', parent_id='b' * 16, attributes={'service': 'groq', 'tokens': 12})
+    span.end_ns = span.start_ns + 1000
+    encoded = exporter.encode([span])['resourceSpans'][0]['scopeSpans'][0]['spans'][0]
+    assert encoded['traceId'] == 'a' * 32 and encoded['parentSpanId'] == 'b' * 16
+    assert {'key': 'tokens', 'value': {'intValue': '12'}} in encoded['attributes']
+    assert encoded['status'] == {'code': 1}
\ No newline at end of file
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import pytest
+from conversation_manager import ConversationManager
+from game.engine import GameEngine
+from api.websocket import GameSocketHub
+
+GAME_JSON = '{"narration": "You wake up", "image": {"top": "T", "bottom": "B", "prompt": "P"}, "actions": [{"description": "Look"}]}'
+
+class FakeClient:
+    async def generate_response(self, context):
+        return GAME_JSON
+
+    async def stream_response(self, context):
+        for i in range(0, len(GAME_JSON), 20):
+            yield GAME_JSON[i:i + 20]
+
+class FailingClient(FakeClient):
+    async def stream_response(self, context):
+        yield GAME_JSON[:20]
+        raise ConnectionError("provider unavailable")
+
+@pytest.fixture
+def game_engine():
+    manager = ConversationManager(service_clients={'groq': FakeClient()})
+    manager.create_context('game', 'groq', 'test-model', 'System prompt')
+    return GameEngine(manager)
+
+class FakeWebsocket:
+    def __init__(self, messages):
+        self.incoming = [json.dumps(message) for message in messages]
+        self.sent = []
+        self.accepted = False
+        self.close_code = None
+
+    async def accept(self):
+        self.accepted = True
+
+    async def receive(self):
+        if not self.incoming:
+            # Give queued turns a chance to finish, then behave like a client that stays idle
+            await asyncio.sleep(0.05)
+            raise asyncio.CancelledError()
+        return self.incoming.pop(0)
+
+    async def send(self, data):
+        self.sent.append(json.loads(data))
+
+    async def close(self, code):
+        self.close_code = code
+
+async def run_socket(hub, context_name, messages):
+    websocket = FakeWebsocket(messages)
+    try:
+        await hub.serve(context_name, websocket)
+    except asyncio.CancelledError:
+        pass
+    return websocket
+
+@pytest.mark.asyncio
+async def test_stream_start_over_socket(game_engine):
+    hub = GameSocketHub(game_engine)
+    websocket = await run_socket(hub, 'game', [{"type": "start"}])
+
+    assert websocket.accepted
+    events = websocket.sent
+    assert events[0]['type'] == 'connected'
+    deltas = [e['text'] for e in events if e['type'] == 'delta']
+    assert ''.join(deltas) == GAME_JSON
+    assert events[-1] == {"type": "state", "state": json.loads(GAME_JSON)}
+    assert 'game' in game_engine.states
+
+@pytest.mark.asyncio
+async def test_provider_failure_is_an_error_event(game_engine):
+    game_engine.conversation_manager.service_clients['groq'] = FailingClient()
+    websocket = await run_socket(GameSocketHub(game_engine), 'game', [{"type": "start"}])
+
+    assert websocket.sent[-1] == {"type": "error", "error": "provider unavailable"}
+    # Neither the prompt nor the partial reply is kept, and no game was started
+    assert [m['role'] for m in game_engine.conversation_manager.get_context('game').history] == ['system']
+    assert 'game' not in game_engine.states
+
+@pytest.mark.asyncio
+async def test_unknown_context_is_rejected(game_engine):
+    hub = GameSocketHub(game_engine)
+    websocket = await run_socket(hub, 'missing', [])
+    assert not websocket.accepted
+    assert websocket.close_code == 4004
+
+@pytest.mark.asyncio
+async def test_engine_events_are_pushed(game_engine):
+    hub = GameSocketHub(game_engine)
+    await game_engine.start_game('game')
+    pushed = []
+    hub.sessions['game'] = type('Session', (), {'push': lambda self, event: pushed.append(event)})()
+
+    await game_engine.process_turn('game', 'Look around')
+    assert pushed[-1]['type'] == 'turn_processed'
\ No newline at end of file
@@ -0,0 +1,127 @@
+# utils/deadline.py
+
+import asyncio
+import math
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Dict, Mapping, Optional
+
+DEADLINE_HEADER = 'X-Request-Deadline'  # absolute unix timestamp in seconds
+TIMEOUT_HEADER = 'X-Request-Timeout'    # relative timeout in seconds
+TIMEOUT_FIELD = 'timeout'               # relative timeout in seconds, in the JSON body
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time; ``stage`` names where it happened."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"Deadline exceeded during {stage}")
+
+
+class Deadline:
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, stage: str) -> None:
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    async def run(self, awaitable: Awaitable[Any], stage: str) -> Any:
+        if self.expired():
+            # Don't spend upstream capacity on work nobody will wait for
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded(stage)
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage)
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar('deadline', default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def set_deadline(deadline: Optional[Deadline]):
+    return _current_deadline.set(deadline)
+
+
+def reset_deadline(token) -> None:
+    _current_deadline.reset(token)
+
+
+def check_deadline(stage: str) -> None:
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+async def with_deadline(awaitable: Awaitable[Any], stage: str) -> Any:
+    """Await ``awaitable`` within the current request's deadline, if there is one."""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return await awaitable
+    return await deadline.run(awaitable, stage)
+
+
+async def iterate_with_deadline(iterable, stage: str) -> AsyncIterator[Any]:
+    """Async-iterate ``iterable``, bounding every step by the current request's deadline."""
+    deadline = _current_deadline.get()
+    iterator = iterable.__aiter__()
+    while True:
+        try:
+            if deadline is None:
+                item = await iterator.__anext__()
+            else:
+                item = await deadline.run(iterator.__anext__(), stage)
+        except StopAsyncIteration:
+            return
+        yield item
+
+
+def _positive_timeout(value: Any) -> float:
+    timeout = float(value)
+    if not math.isfinite(timeout) or timeout <= 0:
+        raise ValueError(f"Timeout must be a positive number of seconds, not {value!r}")
+    return timeout
+
+
+def deadline_from_request(route: str, headers: Mapping[str, str], data: Optional[Dict[str, Any]],
+                          config: Dict[str, Any]) -> Optional[Deadline]:
+    """
+    Build the deadline for a request from the caller's header or body field, falling back
+    to the per-route server default. The ``timeout`` body field is consumed from ``data``.
+
+    Raises ValueError for a caller's value that is not a finite number, or a timeout that is not
+    positive; a deadline that has already passed gives an expired ``Deadline``.
+    """
+    timeout = None
+    if data is not None and TIMEOUT_FIELD in data:
+        timeout = _positive_timeout(data.pop(TIMEOUT_FIELD))
+    elif headers.get(TIMEOUT_HEADER):
+        timeout = _positive_timeout(headers[TIMEOUT_HEADER])
+    elif headers.get(DEADLINE_HEADER):
+        deadline = float(headers[DEADLINE_HEADER])
+        if not math.isfinite(deadline):
+            raise ValueError(f"{DEADLINE_HEADER} must be a finite timestamp")
+        timeout = deadline - time.time()
+
+    if timeout is None:
+        timeout = config.get('routes', {}).get(route, config.get('default'))
+        if timeout is None:
+            return None
+    max_timeout = config.get('max')
+    if max_timeout is not None:
+        timeout = min(timeout, max_timeout)
+    return Deadline(float(timeout))
\ No newline at end of file
@@ -1,6 +1,8 @@
 import sys
+import logging
 import traceback
 from .logger import get_logger
+from .metrics import metrics
 
 logger = get_logger(__name__)
 
@@ -9,12 +11,13 @@ class ErrorHandler:
     def handle_error(error, context=None):
         error_type = type(error).__name__
         error_message = str(error)
-        stack_trace = traceback.format_exc()
+        metrics.increment('errors_total', error=error_type)
 
-        logger.error(f"Error occurred: {error_type} - {error_message}")
+        logger.error("Error occurred: %s - %s", error_type, error_message)
         if context:
-            logger.error(f"Context: {context}")
-        logger.debug(f"Stack trace:\n{stack_trace}")
+            logger.error("Context: %s", context)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Stack trace:\n%s", traceback.format_exc())
 
         return {
             "error": error_type,
@@ -0,0 +1,64 @@
+# utils/instrumentation.py
+
+import time
+from typing import Any, AsyncIterator
+from utils.metrics import metrics, TOKEN_RATE_BUCKETS
+from utils.tracing import tracer, SPAN_KIND_CLIENT
+from utils.tokens import estimate_tokens
+
+def _labels(client: Any, context: Any) -> dict:
+    return {"service": getattr(context, 'service', type(client).__name__), "model": getattr(context, 'model', '')}
+
+def _record_error(labels: dict, error: BaseException) -> None:
+    metrics.increment('provider_errors_total', error=type(error).__name__, **labels)
+
+def _record_completion(labels: dict, started: float, response: str) -> None:
+    elapsed = time.perf_counter() - started
+    tokens = estimate_tokens(response)
+    metrics.observe('provider_request_duration_seconds', elapsed, **labels)
+    metrics.increment('provider_completion_tokens_total', tokens, **labels)
+    if elapsed > 0 and tokens:
+        metrics.observe('provider_tokens_per_second', tokens / elapsed, TOKEN_RATE_BUCKETS, **labels)
+
+async def timed_generate(client: Any, context: Any) -> str:
+    """``client.generate_response(context)``, recording provider latency, token rate and errors."""
+    labels = _labels(client, context)
+    started = time.perf_counter()
+    try:
+        with tracer.span('provider.generate', SPAN_KIND_CLIENT, **labels):
+            response = await client.generate_response(context)
+    except Exception as e:
+        _record_error(labels, e)
+        raise
+    _record_completion(labels, started, response or '')
+    return response
+
+async def timed_stream(client: Any, context: Any) -> AsyncIterator[str]:
+    """``client.stream_response(context)``, additionally recording the time to the first chunk."""
+    labels = _labels(client, context)
+    started = time.perf_counter()
+    chunks = []
+    stream = client.stream_response(context)
+    # Not made current: each step of this generator may run in a different task
+    span = tracer.start_span('provider.stream', kind=SPAN_KIND_CLIENT, **labels)
+    first_token = tracer.start_span('provider.first_token', span)
+    error = None
+    try:
+        async for chunk in stream:
+            if not chunks:
+                metrics.observe('provider_time_to_first_token_seconds', time.perf_counter() - started, **labels)
+                tracer.finish(first_token)
+            chunks.append(chunk)
+            yield chunk
+    except BaseException as e:
+        error = e
+        if isinstance(e, Exception):
+            _record_error(labels, e)
+        raise
+    finally:
+        # Closing this wrapper early (client gone) must reach the provider stream too
+        await stream.aclose()
+        if not chunks:
+            tracer.finish(first_token, error)
+        tracer.finish(span, error)
+    _record_completion(labels, started, ''.join(chunks))
\ No newline at end of file
@@ -1,21 +1,195 @@
 # utils/logger.py
 
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
-import os
+import queue
+import threading
+import time
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_request_id: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+def set_request_id(request_id: Optional[str]) -> Token:
+    """Tag log records from the current request (and the tasks it starts) with ``request_id``."""
+    return _request_id.set(request_id)
+
+def reset_request_id(token: Token) -> None:
+    _request_id.reset(token)
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry["request_id"] = record.request_id
+        if getattr(record, 'suppressed', 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class ThrottleFilter(logging.Filter):
+    """
+    Per-logger sampling and rate limiting for records below WARNING.
+
+    ``sampling`` maps a logger name (or a parent such as ``storage``) to the fraction of records
+    kept, evenly spaced; ``rate_limits`` maps it to records per second (a token bucket with a
+    one second burst). Records let through after some were dropped carry ``suppressed``.
+    """
+
+    def __init__(self, sampling: Optional[Dict[str, float]] = None, rate_limits: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.sampling = sampling or {}
+        self.rate_limits = rate_limits or {}
+        self.rules: Dict[str, tuple] = {}
+        self.state: Dict[str, list] = {}
+        self.lock = threading.Lock()
+
+    def _rule(self, name: str) -> tuple:
+        rule = self.rules.get(name)
+        if rule is None:
+            rate, limit = 1.0, None
+            parts = name.split('.')
+            for end in range(len(parts), 0, -1):
+                prefix = '.'.join(parts[:end])
+                if rate == 1.0 and prefix in self.sampling:
+                    rate = float(self.sampling[prefix])
+                if limit is None and prefix in self.rate_limits:
+                    limit = float(self.rate_limits[prefix])
+            rule = self.rules[name] = (rate, limit)
+        return rule
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate, limit = self._rule(record.name)
+        if rate >= 1.0 and limit is None:
+            return True
+        with self.lock:
+            # [sample credit, tokens, last refill, suppressed since last kept record]
+            state = self.state.get(record.name)
+            if state is None:
+                state = self.state[record.name] = [1.0 - rate, limit or 0.0, time.monotonic(), 0]
+            state[0] += rate
+            keep = state[0] >= 1.0
+            if keep:
+                state[0] -= 1.0
+            if keep and limit is not None:
+                now = time.monotonic()
+                state[1] = min(limit, state[1] + (now - state[2]) * limit)
+                state[2] = now
+                keep = state[1] >= 1.0
+                if keep:
+                    state[1] -= 1.0
+            if not keep:
+                state[3] += 1
+                return False
+            record.suppressed, state[3] = state[3], 0
+        return True
+
+class RequestQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread without blocking.
+
+    The message is merged with its arguments here, in the logging thread, so later changes to
+    mutable arguments don't show up in the log; the formatter runs on the writer thread. When the
+    queue is full the record is dropped and counted instead of stalling the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_id = _request_id.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
 def setup_logging(config):
+    """
+    Route all logging through a bounded queue to a background writer thread.
+
+    :param config: ``level``, ``file``, ``format`` (``text`` or ``json``), ``max_bytes``, ``backups``,
+        ``queue_size``, ``sampling`` and ``rate_limits``
+    """
+    global _listener, _queue_handler
     log_level = getattr(logging, config.get('level', 'INFO'))
     log_file = config.get('file', 'llmserver.log')
-    
-    logging.basicConfig(
-        level=log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5),
-            logging.StreamHandler()
-        ]
-    )
+    formatter = JsonFormatter() if config.get('format', 'text') == 'json' else logging.Formatter(TEXT_FORMAT)
+
+    handlers = [
+        RotatingFileHandler(log_file, maxBytes=config.get('max_bytes', 10*1024*1024), backupCount=config.get('backups', 5)),
+        logging.StreamHandler()
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    stop_logging()
+    if _queue_handler is not None:
+        root.removeHandler(_queue_handler)
+    _queue_handler = RequestQueueHandler(queue.Queue(config.get('queue_size', 10000)))
+    if config.get('sampling') or config.get('rate_limits'):
+        _queue_handler.addFilter(ThrottleFilter(config.get('sampling'), config.get('rate_limits')))
+    _listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root.setLevel(log_level)
+    root.addHandler(_queue_handler)
+
+def update_logging(config) -> None:
+    """Apply a changed level, ``sampling`` or ``rate_limits`` to the running set-up."""
+    logging.getLogger().setLevel(getattr(logging, config.get('level', 'INFO')))
+    if _queue_handler is None:
+        return
+    for log_filter in list(_queue_handler.filters):
+        if isinstance(log_filter, ThrottleFilter):
+            _queue_handler.removeFilter(log_filter)
+    if config.get('sampling') or config.get('rate_limits'):
+        _queue_handler.addFilter(ThrottleFilter(config.get('sampling'), config.get('rate_limits')))
+
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+atexit.register(stop_logging)
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
 
 def get_logger(name):
     return logging.getLogger(name)
\ No newline at end of file
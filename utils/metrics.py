@@ -0,0 +1,177 @@
+# utils/metrics.py
+
+import math
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple
+
+LabelKey = Tuple[Tuple[str, Any], ...]
+
+# Seconds; provider calls range from milliseconds (cached/local) to minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets: int):
+        # One slot per upper bound plus +Inf; made cumulative when rendered
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+class Shard:
+    """Series written by one thread. Only the owning thread writes; readers copy."""
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = defaultdict(dict)
+
+class Metrics:
+    """
+    In-process counters, gauges and histograms keyed by metric name and label set.
+
+    Every thread writes to its own shard, so recording a sample takes no lock; scrapes merge the
+    shards. Gauges that describe current state (loaded contexts, queue depth) are read from
+    callbacks at scrape time instead of being updated on every change.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Shard] = []
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._gauges: set = set()
+        self._gauge_callbacks: Dict[str, Callable[[], Any]] = {}
+
+    def _shard(self) -> Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def increment(self, name: str, amount: float = 1, **labels: Any) -> None:
+        self._shard().counters[name][tuple(sorted(labels.items()))] += amount
+
+    def adjust_gauge(self, name: str, amount: float, **labels: Any) -> None:
+        """Move a gauge up or down, e.g. +1/-1 around an in-flight request."""
+        if name not in self._gauges:
+            self._gauges.add(name)
+        self._shard().counters[name][tuple(sorted(labels.items()))] += amount
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: Any) -> None:
+        bounds = self._buckets.get(name)
+        if bounds is None:
+            bounds = self._buckets.setdefault(name, tuple(buckets))
+        series = self._shard().histograms[name]
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(len(bounds))
+        histogram.counts[bisect_left(bounds, value)] += 1
+        histogram.sum += value
+        histogram.count += 1
+
+    def register_gauge(self, name: str, callback: Callable[[], Any]) -> None:
+        """``callback`` returns a number, or a list of ``(labels, value)`` pairs; it is called on every scrape."""
+        self._gauge_callbacks[name] = callback
+
+    def get(self, name: str, **labels: Any) -> float:
+        key = tuple(sorted(labels.items()))
+        return sum(shard.counters[name].get(key, 0) for shard in self._shard_list() if name in shard.counters)
+
+    def get_histogram(self, name: str, **labels: Any) -> Dict[str, Any]:
+        histogram = self._merged_histograms().get(name, {}).get(tuple(sorted(labels.items())))
+        if histogram is None:
+            return {"count": 0, "sum": 0.0, "buckets": {}}
+        return {"count": histogram.count, "sum": histogram.sum,
+                "buckets": dict(zip(self._buckets[name] + (math.inf,), self._cumulative(histogram)))}
+
+    def snapshot(self) -> Dict[str, Dict[LabelKey, float]]:
+        merged: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        for shard in self._shard_list():
+            for name, series in list(shard.counters.items()):
+                for key, value in series.copy().items():
+                    merged[name][key] += value
+        return {name: dict(values) for name, values in merged.items()}
+
+    def reset(self) -> None:
+        for shard in self._shard_list():
+            shard.counters.clear()
+            shard.histograms.clear()
+
+    def _shard_list(self) -> List[Shard]:
+        with self._lock:
+            return list(self._shards)
+
+    def _merged_histograms(self) -> Dict[str, Dict[LabelKey, Histogram]]:
+        merged: Dict[str, Dict[LabelKey, Histogram]] = defaultdict(dict)
+        for shard in self._shard_list():
+            for name, series in list(shard.histograms.items()):
+                for key, histogram in series.copy().items():
+                    total = merged[name].get(key)
+                    if total is None:
+                        total = merged[name][key] = Histogram(len(self._buckets[name]))
+                    total.counts = [a + b for a, b in zip(total.counts, histogram.counts)]
+                    total.sum += histogram.sum
+                    total.count += histogram.count
+        return merged
+
+    @staticmethod
+    def _cumulative(histogram: Histogram) -> List[int]:
+        cumulative, total = [], 0
+        for count in histogram.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for name, series in sorted(self.snapshot().items()):
+            lines.append(f"# TYPE {name} {'gauge' if name in self._gauges else 'counter'}")
+            lines.extend(f"{name}{_labels(key)} {_number(value)}" for key, value in sorted(series.items(), key=_sort_key))
+        for name, callback in sorted(self._gauge_callbacks.items()):
+            try:
+                value = callback()
+            except Exception:
+                continue
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, (int, float)):
+                lines.append(f"{name} {_number(value)}")
+            else:
+                lines.extend(f"{name}{_labels(tuple(sorted(labels.items())))} {_number(v)}" for labels, v in value)
+        for name, series in sorted(self._merged_histograms().items()):
+            lines.append(f"# TYPE {name} histogram")
+            bounds = self._buckets[name] + (math.inf,)
+            for key, histogram in sorted(series.items(), key=_sort_key):
+                for bound, count in zip(bounds, self._cumulative(histogram)):
+                    lines.append(f"{name}_bucket{_labels(key + (('le', bound),))} {count}")
+                lines.append(f"{name}_sum{_labels(key)} {_number(histogram.sum)}")
+                lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+def _sort_key(item) -> str:
+    return repr(item[0])
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ''
+    pairs = []
+    for label, value in key:
+        text = _number(value) if label == 'le' else str(value)
+        text = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{label}="{text}"')
+    return '{' + ','.join(pairs) + '}'
+
+metrics = Metrics()
\ No newline at end of file
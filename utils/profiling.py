@@ -0,0 +1,232 @@
+# utils/profiling.py
+
+import asyncio
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import signal
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from utils.logger import get_logger
+
+try:
+    import yappi
+except ImportError:  # Optional; only needed for mode 'yappi'
+    yappi = None
+
+logger = get_logger(__name__)
+
+MODES = ('sampling', 'cprofile', 'yappi')
+FORMATS = ('top', 'collapsed', 'pstats')
+CONTENT_TYPES = {'top': 'text/plain; charset=utf-8', 'collapsed': 'text/plain; charset=utf-8',
+                 'pstats': 'application/octet-stream'}
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+class StackSampler:
+    """
+    Samples one thread's Python stack at a fixed interval and counts identical stacks.
+
+    On the main thread of a Unix process the samples come from a SIGPROF interval timer, so they
+    are taken every ``interval`` seconds of CPU time wherever the interpreter is. Elsewhere a
+    background thread polls the stack, which only sees the thread where it releases the GIL
+    (I/O waits and the event loop's select) and under-counts pure Python hot spots.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.use_signal = hasattr(signal, 'setitimer') and thread_id == threading.main_thread().ident
+        self.previous_handler = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='StackSampler', daemon=True)
+
+    def start(self) -> None:
+        if self.use_signal:
+            self.previous_handler = signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self.thread.start()
+
+    def stop(self) -> None:
+        if self.use_signal:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self.previous_handler or signal.SIG_DFL)
+        else:
+            self.stopping.set()
+            self.thread.join()
+
+    def _on_signal(self, signum, frame) -> None:
+        self._record(frame)
+
+    def _run(self) -> None:
+        while not self.stopping.wait(self.interval):
+            self._record(sys._current_frames().get(self.thread_id))
+
+    def _record(self, frame) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            self.counts[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """One ``frame;frame;frame count`` line per stack, as read by flamegraph.pl and speedscope."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+    def top(self, limit: int) -> str:
+        total = sum(self.counts.values()) or 1
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in self.counts.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        clock = 'CPU time' if self.use_signal else 'wall time'
+        lines = [f"{sum(self.counts.values())} samples every {self.interval * 1000:g} ms of {clock}", "",
+                 f"{'own %':>7} {'total %':>8}  function"]
+        for frame, count in own.most_common(limit):
+            lines.append(f"{count / total:>7.1%} {inclusive[frame] / total:>8.1%}  {frame}")
+        return '\n'.join(lines) + '\n'
+
+def footprint(manager, game_engine) -> Dict[str, int]:
+    """Sizes of the in-memory contexts and game states, to tell their growth from other allocations."""
+    contexts = list(manager.contexts.values())
+    games = list(game_engine.states.values())
+    return {
+        "contexts": len(contexts),
+        "messages": sum(len(context.history) for context in contexts),
+        "message_chars": sum(len(message.get('content') or '') for context in contexts for message in context.history),
+        "games": len(games),
+        "game_states": sum(len(game) for game in games),
+        "game_state_bytes": sum(game.memory_usage()["bytes"] for game in games),
+    }
+
+class Profiler:
+    """
+    Profiles the running server for a number of seconds.
+
+    ``sampling`` samples the event loop thread's stack (low overhead, gives collapsed stacks),
+    ``cprofile`` traces every call on the event loop thread, and ``yappi`` (if installed) traces
+    all threads with wall-clock time. Only one profile runs at a time.
+
+    :param config: ``admin_token``, ``max_seconds`` and ``sample_interval``
+    :param memory_sources: Returns sizes to compare before and after when ``memory`` is requested
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None,
+                 memory_sources: Optional[Callable[[], Dict[str, int]]] = None):
+        config = config or {}
+        self.admin_token = config.get('admin_token') or ''
+        self.max_seconds = config.get('max_seconds', 60)
+        self.sample_interval = config.get('sample_interval', 0.005)
+        self.memory_sources = memory_sources
+        self.running = False
+
+    def authorized(self, token: Optional[str]) -> bool:
+        return bool(self.admin_token) and hmac.compare_digest(self.admin_token, token or '')
+
+    async def run(self, seconds: float = 10, mode: str = 'sampling', output: str = 'top', top: int = 30,
+                  memory: bool = False) -> Tuple[Union[str, bytes], str]:
+        """Profile for ``seconds`` and return ``(body, content_type)``; invalid options raise ValueError."""
+        seconds = float(seconds)
+        top = int(top)
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"seconds must be between 0 and {self.max_seconds}")
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        if output not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        if mode == 'yappi' and yappi is None:
+            raise ValueError("yappi is not installed")
+        if mode == 'sampling' and output == 'pstats':
+            raise ValueError("pstats output needs mode cprofile or yappi")
+        if mode != 'sampling' and output == 'collapsed':
+            raise ValueError("collapsed stacks need mode sampling")
+        if memory and output == 'pstats':
+            raise ValueError("memory reports are only added to text formats")
+        if self.running:
+            raise ProfilerBusy("A profile is already running")
+
+        self.running = True
+        logger.info("Profiling for %ss (%s, %s%s)", seconds, mode, output, ', memory' if memory else '')
+        try:
+            memory_start = self._start_memory() if memory else None
+            if mode == 'sampling':
+                body = await self._sample(seconds, output, top)
+            else:
+                stats = await (self._cprofile(seconds) if mode == 'cprofile' else self._yappi(seconds))
+                body = marshal.dumps(stats.stats) if output == 'pstats' else self._top(stats, top)
+            if memory_start is not None:
+                body += self._memory_report(memory_start, seconds, top)
+        finally:
+            self.running = False
+        return body, CONTENT_TYPES[output]
+
+    async def _sample(self, seconds: float, output: str, top: int) -> str:
+        sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+        return sampler.collapsed() if output == 'collapsed' else sampler.top(top)
+
+    async def _cprofile(self, seconds: float) -> pstats.Stats:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+        return pstats.Stats(profile)
+
+    async def _yappi(self, seconds: float) -> pstats.Stats:
+        yappi.set_clock_type('wall')
+        yappi.clear_stats()
+        yappi.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            yappi.stop()
+        return yappi.convert2pstats(yappi.get_func_stats())
+
+    @staticmethod
+    def _top(stats: pstats.Stats, top: int) -> str:
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats('cumulative').print_stats(top)
+        return out.getvalue()
+
+    def _start_memory(self) -> Tuple[bool, tracemalloc.Snapshot, Dict[str, int]]:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(10)
+        sizes = self.memory_sources() if self.memory_sources else {}
+        return started, tracemalloc.take_snapshot(), sizes
+
+    def _memory_report(self, memory_start, seconds: float, top: int) -> str:
+        started, before, sizes_before = memory_start
+        after = tracemalloc.take_snapshot()
+        if started:
+            tracemalloc.stop()
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        growth = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+        lines = ["", f"Memory growth over {seconds:g}s (tracemalloc, largest first):"]
+        lines.extend(str(stat) for stat in growth[:top] if stat.size_diff)
+        if self.memory_sources:
+            sizes_after = self.memory_sources()
+            lines.extend(["", "In-memory state (before -> after):"])
+            lines.extend(f"  {name}: {sizes_before.get(name, 0)} -> {value}" for name, value in sizes_after.items())
+        return '\n'.join(lines) + '\n'
\ No newline at end of file
@@ -0,0 +1,17 @@
+# utils/tokens.py
+
+import math
+from typing import Any
+
+# Rough size of a token for budgeting, fair-queue costs and metrics; no provider reports usage here
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(*texts: Any) -> int:
+    return math.ceil(sum(len(text) for text in texts if isinstance(text, str)) / CHARS_PER_TOKEN)
+
+
+def estimate_context_tokens(context, *extra: Any) -> int:
+    """Tokens a provider call on ``context`` sends and receives, i.e. the whole history plus ``extra``."""
+    history = context.history if context is not None else []
+    return estimate_tokens(*(message.get('content') for message in history), *extra)
\ No newline at end of file
@@ -0,0 +1,368 @@
+# utils/tracing.py
+
+"""
+Lightweight request tracing.
+
+A trace is started per request (or WebSocket turn) and stages open child spans with
+``tracer.span(name)``. The current span lives in a ContextVar, so it follows the request into
+the asyncio tasks it creates. Finished traces are handed to a background thread that writes them
+to a rolling JSONL file or posts them to an OTLP/HTTP collector, so the request path never does I/O.
+
+Untraced requests cost one ContextVar lookup per stage: ``span()`` yields ``None`` when there is
+no current trace.
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Iterator, List, Optional
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class Trace:
+    __slots__ = ('id', 'sampled', 'root', 'spans', 'closed')
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.id = trace_id
+        self.sampled = sampled
+        self.root: Optional['Span'] = None
+        self.spans: List['Span'] = []
+        self.closed = False
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str] = None, kind: int = SPAN_KIND_INTERNAL,
+                 start_ns: Optional[int] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """``(trace_id, parent_span_id, sampled)`` from a W3C ``traceparent`` header, if valid."""
+    parts = (header or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class SpanExporter(ABC):
+    """Exports finished spans in batches from a daemon thread; spans are dropped if the queue is full."""
+
+    def __init__(self, flush_interval: float = 2.0, max_batch: int = 512, max_queue: int = 10000):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.queue: queue.Queue = queue.Queue(max_queue)
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    def submit(self, spans: List[Span]) -> None:
+        for span in spans:
+            try:
+                self.queue.put_nowait(span)
+            except queue.Full:
+                metrics.increment('trace_spans_dropped_total')
+
+    def _run(self) -> None:
+        while not (self.stopping.is_set() and self.queue.empty()):
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+                while len(batch) < self.max_batch:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self.export(batch)
+                except Exception as e:
+                    metrics.increment('trace_spans_dropped_total', len(batch))
+                    logger.warning("Could not export %s spans: %s", len(batch), e)
+
+    @abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        """
+        Write one batch of finished spans; called on the exporter thread.
+
+        :param spans: The spans to export, in the order they finished.
+        """
+        pass
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        self.stopping.set()
+        self.thread.join(timeout)
+
+
+class JsonlSpanExporter(SpanExporter):
+    """Appends one JSON object per span, rolling the file over at ``max_bytes`` and keeping ``backups`` old files."""
+
+    def __init__(self, path: str = 'traces/spans.jsonl', max_bytes: int = 10 * 1024 * 1024, backups: int = 3, **options):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(**options)
+
+    def export(self, spans: List[Span]) -> None:
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self.rollover()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(span.to_dict(), default=str) + '\n' for span in spans))
+
+    def rollover(self) -> None:
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+class OtlpSpanExporter(SpanExporter):
+    """Posts spans to an OpenTelemetry collector using OTLP/HTTP with JSON encoding."""
+
+    def __init__(self, endpoint: str = 'http://localhost:4318/v1/traces', service_name: str = 'llmserver',
+                 timeout: float = 5.0, headers: Optional[Dict[str, str]] = None, **options):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+        super().__init__(**options)
+
+    def export(self, spans: List[Span]) -> None:
+        body = json.dumps(self.encode(spans)).encode('utf-8')
+        request = urllib.request.Request(self.endpoint, data=body, headers=self.headers, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def encode(self, spans: List[Span]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [otlp_attribute('service.name', self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "llmserver"}, "spans": [otlp_span(span) for span in spans]}],
+        }]}
+
+
+def otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+def otlp_span(span: Span) -> Dict[str, Any]:
+    encoded = {
+        "traceId": span.trace.id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [otlp_attribute(key, value) for key, value in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = span.parent_id
+    return encoded
+
+
+class Tracer:
+    """
+    Creates traces and spans and hands finished traces to the configured exporter.
+
+    A trace is kept when it is head-sampled (``sample_rate``, or the caller's ``traceparent``
+    says so) or, if ``slow_request_seconds`` is set, when its root span took at least that long.
+    With ``slow_request_seconds`` every request records spans so the slow ones can be kept.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.slow_request_seconds: Optional[float] = None
+        self.exporter: Optional[SpanExporter] = None
+
+    def configure(self, config: Optional[Dict[str, Any]] = None) -> None:
+        config = config or {}
+        self.shutdown()
+        self.enabled = config.get('enabled', False)
+        if not self.enabled:
+            return
+        self.sample_rate = config.get('sample_rate', 0.1)
+        self.slow_request_seconds = config.get('slow_request_seconds')
+        options = {"flush_interval": config.get('flush_interval', 2.0), "max_batch": config.get('max_batch', 512)}
+        if config.get('exporter', 'jsonl') == 'otlp':
+            otlp = config.get('otlp', {})
+            self.exporter = OtlpSpanExporter(otlp.get('endpoint', 'http://localhost:4318/v1/traces'),
+                                             config.get('service_name', 'llmserver'), otlp.get('timeout', 5.0),
+                                             otlp.get('headers'), **options)
+        else:
+            jsonl = config.get('jsonl', {})
+            self.exporter = JsonlSpanExporter(jsonl.get('path', 'traces/spans.jsonl'),
+                                              jsonl.get('max_bytes', 10 * 1024 * 1024), jsonl.get('backups', 3), **options)
+        logger.info("Tracing enabled: sampling %.0f%% to %s", self.sample_rate * 100, type(self.exporter).__name__)
+
+    def reconfigure(self, config: Dict[str, Any]) -> None:
+        """Apply a changed ``sample_rate`` or ``slow_request_seconds``; the exporter is kept."""
+        if self.enabled:
+            self.sample_rate = config.get('sample_rate', 0.1)
+            self.slow_request_seconds = config.get('slow_request_seconds')
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+            self.exporter = None
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **attributes: Any) -> Optional[Token]:
+        """Open the root span of a trace and make it current; returns ``None`` if the request is not traced."""
+        if not self.enabled:
+            return None
+        parent = parse_traceparent(traceparent)
+        if parent:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < self.sample_rate
+        if not sampled and self.slow_request_seconds is None:
+            return None
+        trace = Trace(trace_id, sampled)
+        trace.root = Span(trace, name, parent_id, SPAN_KIND_SERVER, attributes=attributes)
+        return _current_span.set(trace.root)
+
+    def end_trace(self, token: Optional[Token], error: Optional[BaseException] = None, **attributes: Any) -> None:
+        if token is None:
+            return
+        span = _current_span.get()
+        _current_span.reset(token)
+        if span is not None:
+            span.attributes.update(attributes)
+            self.finish(span, error)
+
+    @contextmanager
+    def trace(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """A whole trace as a context manager, for work that does not start with an HTTP request."""
+        token = self.start_trace(name, **attributes)
+        error = None
+        try:
+            yield _current_span.get() if token else None
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.end_trace(token, error)
+
+    @contextmanager
+    def span(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Time a stage as a child of the current span. Must be entered and exited in the same task."""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = Span(parent.trace, name, parent.span_id, kind, attributes=attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(span, error)
+
+    def start_span(self, name: str, parent: Optional[Span] = None, start_ns: Optional[int] = None,
+                   kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Optional[Span]:
+        """A child span that is not made current, for async generators and intervals measured elsewhere."""
+        parent = parent or _current_span.get()
+        if parent is None:
+            return None
+        return Span(parent.trace, name, parent.span_id, kind, start_ns, attributes)
+
+    def attach(self, span: Optional[Span]) -> Token:
+        """Make ``span`` current, e.g. before creating a task that should continue its trace."""
+        return _current_span.set(span)
+
+    def detach(self, token: Token) -> None:
+        _current_span.reset(token)
+
+    def finish(self, span: Optional[Span], error: Optional[BaseException] = None) -> None:
+        if span is None:
+            return
+        span.end_ns = time.time_ns()
+        if error is not None and not isinstance(error, GeneratorExit):
+            span.error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+        trace = span.trace
+        if trace.closed:
+            # Work that outlived its request (e.g. a background job)
+            if trace.sampled and self.exporter is not None:
+                self.exporter.submit([span])
+            return
+        trace.spans.append(span)
+        if span is trace.root:
+            trace.closed = True
+            keep = trace.sampled or (self.slow_request_seconds is not None and span.duration >= self.slow_request_seconds)
+            if keep and self.exporter is not None:
+                trace.sampled = True
+                self.exporter.submit(trace.spans)
+            trace.spans = []
+
+
+tracer = Tracer()
\ No newline at end of file